@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+"""
+Бенчмарк токенизации для BM25: прежний путь (nltk word_tokenize по нижнему регистру)
+против общего анализатора chathrd (регулярное выражение + Snowball-стемминг + кэш).
+
+Текст берётся из .txt/.md/.csv/.json файлов директории (по умолчанию data/downloaded_files).
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import Callable, List
+
+from chathrd.utils.text_analyzer import TextAnalyzer
+
+TEXT_SUFFIXES = {".txt", ".md", ".csv", ".json"}
+
+
+def load_texts(data_dir: Path, limit_mb: float) -> List[str]:
+    """Читает текстовые файлы, пока не наберётся limit_mb мегабайт."""
+    texts, total = [], 0
+    for path in sorted(data_dir.rglob("*")):
+        if path.suffix.lower() not in TEXT_SUFFIXES or not path.is_file():
+            continue
+        raw = path.read_bytes()
+        for encoding in ("utf-8", "cp1251"):
+            try:
+                texts.append(raw.decode(encoding))
+                break
+            except UnicodeDecodeError:
+                continue
+        total += len(raw)
+        if total >= limit_mb * 1024 * 1024:
+            break
+    return texts
+
+
+def measure(name: str, func: Callable[[str], List[str]], texts: List[str]) -> float:
+    """Прогоняет func по всем текстам и печатает пропускную способность."""
+    size_mb = sum(len(t.encode("utf-8")) for t in texts) / 1024 / 1024
+    start = time.perf_counter()
+    tokens = sum(len(func(t)) for t in texts)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<32} {elapsed:8.2f} сек  {size_mb / elapsed:8.2f} МБ/с  {tokens / elapsed:12.0f} токенов/с")
+    return elapsed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Сравнение скорости токенизации BM25.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("--data-dir", default="data/downloaded_files", help="Директория с текстами.")
+    parser.add_argument("--limit-mb", type=float, default=20.0, help="Сколько мегабайт текста взять.")
+    args = parser.parse_args()
+
+    texts = load_texts(Path(args.data_dir), args.limit_mb)
+    if not texts:
+        print(f"Не найдено текстовых файлов в {args.data_dir}", file=sys.stderr)
+        return 1
+    print(f"Текстов: {len(texts)}")
+
+    from nltk.tokenize import word_tokenize
+    baseline = measure("nltk word_tokenize", lambda t: word_tokenize(t.lower()), texts)
+
+    analyzer = TextAnalyzer()
+    measure("регулярное выражение", analyzer.tokenize, texts)
+    cold = measure("анализатор (холодный кэш)", analyzer.analyze, texts)
+    warm = measure("анализатор (тёплый кэш)", analyzer.analyze, texts)
+    info = analyzer.normalize.cache_info()  # type: ignore[attr-defined]
+    print(f"Кэш нормализации: {info.currsize} слов, попаданий {info.hits}, промахов {info.misses}")
+    print(f"Ускорение относительно nltk: {baseline / cold:.1f}x (холодный), {baseline / warm:.1f}x (тёплый)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+"""
+Бенчмарк эмбеддинга чанков на CPU: исходный порядок батчей (как у
+SentenceTransformersDocumentEmbedder) против батчей по длине в токенах,
+квантованного int8 ONNX-бэкенда и пула процессов эмбеддинга.
+
+Для каждого варианта печатается скорость (чанков/с) и расхождение векторов с
+эталоном fp32 (torch): средняя и минимальная косинусная близость; для пула
+процессов — ускорение относительно одного процесса.
+Текст берётся из .txt/.md/.csv/.json файлов директории и режется на чанки по словам,
+как в пайплайне индексации.
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from chathrd.components.embedders.bucketed_embedder import BucketedDocumentEmbedder
+from chathrd.config.settings import settings
+
+TEXT_SUFFIXES = {".txt", ".md", ".csv", ".json"}
+
+
+def load_chunks(data_dir: Path, limit: int, seed: int) -> List[str]:
+    """Читает текстовые файлы и режет их на чанки разной длины (до MAX_SPLIT_LENGTH слов)."""
+    rng = random.Random(seed)
+    chunks: List[str] = []
+    for path in sorted(data_dir.rglob("*")):
+        if path.suffix.lower() not in TEXT_SUFFIXES or not path.is_file():
+            continue
+        raw = path.read_bytes()
+        for encoding in ("utf-8", "cp1251"):
+            try:
+                words = raw.decode(encoding).split()
+                break
+            except UnicodeDecodeError:
+                continue
+        start = 0
+        while start < len(words) and len(chunks) < limit:
+            # последние чанки файлов короче — имитируем разброс длин после DocumentSplitter
+            length = rng.randint(10, settings.MAX_SPLIT_LENGTH)
+            chunks.append(" ".join(words[start:start + length]))
+            start += length
+        if len(chunks) >= limit:
+            break
+    rng.shuffle(chunks)
+    return chunks
+
+
+def measure(name: str, func: Callable[[List[str]], np.ndarray], chunks: List[str],
+            baseline: Optional[np.ndarray]) -> np.ndarray:
+    """Эмбеддит чанки и печатает скорость и близость к эталону."""
+    start = time.perf_counter()
+    vectors = np.asarray(func(chunks), dtype=np.float32)
+    elapsed = time.perf_counter() - start
+    drift = ""
+    if baseline is not None:
+        cos = np.sum(vectors * baseline, axis=1) / (
+            np.linalg.norm(vectors, axis=1) * np.linalg.norm(baseline, axis=1)
+        )
+        drift = f"  косинус к fp32: средний {cos.mean():.4f}, минимальный {cos.min():.4f}"
+    print(f"{name:<28} {elapsed:8.2f} сек  {len(chunks) / elapsed:8.1f} чанков/с{drift}")
+    return vectors
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Сравнение скорости и точности эмбеддинга чанков.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("--data-dir", default="data/downloaded_files", help="Директория с текстами.")
+    parser.add_argument("--chunks", type=int, default=2000, help="Сколько чанков эмбеддить.")
+    parser.add_argument("--batch-size", type=int, default=settings.EMBEDDER_BATCH_SIZE, help="Размер батча.")
+    parser.add_argument("--model", default=settings.EMBEDDER_MODEL, help="Модель эмбеддингов.")
+    parser.add_argument("--skip-onnx", action="store_true", help="Не проверять бэкенд onnx-int8.")
+    parser.add_argument("--workers", default="", help="Числа процессов эмбеддинга через запятую, например 1,2,4.")
+    parser.add_argument("--seed", type=int, default=0, help="Зерно для длин чанков.")
+    args = parser.parse_args()
+
+    chunks = load_chunks(Path(args.data_dir), args.chunks, args.seed)
+    if not chunks:
+        print(f"В {args.data_dir} нет текстовых файлов", file=sys.stderr)
+        return 1
+    print(f"{len(chunks)} чанков, модель {args.model}, батч {args.batch_size}")
+
+    torch_embedder = BucketedDocumentEmbedder(args.model, backend="torch", batch_size=args.batch_size, workers=1)
+    torch_embedder.warm_up()
+    model = torch_embedder._model
+
+    def arrival_order(texts: List[str]) -> np.ndarray:
+        # батчи по порядку поступления, как при одном вызове encode на каждый batch_size
+        return np.vstack([
+            model.encode(texts[i:i + args.batch_size], batch_size=args.batch_size, show_progress_bar=False)
+            for i in range(0, len(texts), args.batch_size)
+        ])
+
+    # прогрев, чтобы не мерить загрузку весов и JIT
+    model.encode(chunks[:args.batch_size], show_progress_bar=False)
+    baseline = measure("torch, по порядку", arrival_order, chunks, None)
+    measure("torch, по длине", torch_embedder.embed, chunks, baseline)
+
+    if not args.skip_onnx:
+        try:
+            onnx_embedder = BucketedDocumentEmbedder(
+                args.model, backend="onnx-int8", batch_size=args.batch_size, workers=1,
+            )
+            onnx_embedder.warm_up()
+            onnx_embedder.embed(chunks[:args.batch_size])
+            measure("onnx-int8, по длине", onnx_embedder.embed, chunks, baseline)
+        except Exception as e:
+            print(f"onnx-int8 недоступен: {e} (установите pip install -e \".[onnx]\")", file=sys.stderr)
+
+    # масштабирование по числу процессов (бэкенд — из EMBEDDER_BACKEND)
+    single = None
+    for workers in [int(w) for w in args.workers.split(",") if w.strip()]:
+        embedder = BucketedDocumentEmbedder(args.model, batch_size=args.batch_size, workers=workers)
+        embedder.warm_up()
+        embedder.embed(chunks[:args.batch_size * workers])
+        start = time.perf_counter()
+        measure(f"{settings.EMBEDDER_BACKEND}, процессов: {workers}", embedder.embed, chunks, baseline)
+        elapsed = time.perf_counter() - start
+        embedder.close()
+        single = single or (elapsed if workers == 1 else None)
+        if single:
+            print(f"{'':<28} ускорение относительно 1 процесса: {single / elapsed:.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+
+"""
+Скрипт для переноса прежнего BM25-индекса (bm25.pkl) в бинарный сегментированный формат.
+Корпус заново не токенизируется: частоты терминов берутся из сохранённого BM25L.
+"""
+
+import argparse
+import logging
+import sys
+from pathlib import Path
+
+from chathrd.components.retrievers.bm25_segments import convert_pickle_index
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+)
+logger = logging.getLogger(__name__)
+
+
+def main() -> int:
+    """Конвертирует bm25.pkl в директорию сегментированного индекса."""
+    parser = argparse.ArgumentParser(
+        description="Перенос bm25.pkl в бинарный формат BM25-индекса.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("--pickle-path", default="data/bm25.pkl", help="Путь к прежнему bm25.pkl.")
+    parser.add_argument("--index-path", default="data/bm25_index", help="Директория нового индекса.")
+    args = parser.parse_args()
+
+    if not Path(args.pickle_path).exists():
+        logger.error(f"Файл не найден: {args.pickle_path}")
+        return 1
+
+    index = convert_pickle_index(args.pickle_path, args.index_path)
+    logger.info(f"Готово: {index.num_docs} документов в {args.index_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
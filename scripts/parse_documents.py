@@ -80,7 +80,7 @@ if __name__ == "__main__":
     # Директории для входных и выходных файлов
     input_dir = "data/downloaded_files"
     index_dir = "data/chroma_index"
-    bm25_path = "data/bm25.pkl"
+    bm25_path = "data/bm25_index"
     
     # Запускаем индексацию
     success = index_documents(input_dir, index_dir, bm25_path)
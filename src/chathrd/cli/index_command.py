@@ -8,6 +8,7 @@ from pathlib import Path
 from typing import List, Optional
 
 from chathrd.pipelines.indexing import run_indexing
+from chathrd.utils.sources import SOURCES, list_source_files
 
 
 def parse_arguments() -> argparse.Namespace:
@@ -38,8 +39,19 @@ def parse_arguments() -> argparse.Namespace:
     )
     parser.add_argument(
         "--bm25-path",
-        default="data/bm25.pkl",
-        help="Путь для сохранения BM25 индекса."
+        default="data/bm25_index",
+        help="Директория для сохранения BM25 индекса."
+    )
+    parser.add_argument(
+        "--source",
+        action="append",
+        choices=SOURCES,
+        help="Индексировать только этот источник (можно указать несколько раз); по умолчанию все."
+    )
+    parser.add_argument(
+        "--retry-failed",
+        action="store_true",
+        help="Индексировать только файлы, которые не удалось сконвертировать в прошлых запусках."
     )
     parser.add_argument(
         "--log-level",
@@ -95,8 +107,7 @@ def validate_paths(files: List[str], data_dir: str) -> Optional[List[str]]:
         return None
         
     # Проверяем, что в директории есть файлы
-    files_in_dir = [os.path.join(data_dir, f) for f in os.listdir(data_dir) 
-                   if os.path.isfile(os.path.join(data_dir, f))]
+    files_in_dir = list_source_files(data_dir)
     if not files_in_dir:
         logging.error(f"В директории нет файлов: {data_dir}")
         return None
@@ -118,16 +129,25 @@ def main() -> int:
     
     # Создаем все необходимые директории
     Path(args.index_dir).parent.mkdir(parents=True, exist_ok=True)
-    Path(args.bm25_path).parent.mkdir(parents=True, exist_ok=True)
+    Path(args.bm25_path).mkdir(parents=True, exist_ok=True)
     
-    # Проверяем пути
-    files = validate_paths(args.files, args.data_dir)
-    if files is None:
-        return 1
+    # Проверяем пути (при повторе несконвертированных файлов их список берётся из индекса)
+    files = None
+    if not args.retry_failed:
+        files = validate_paths(args.files, args.data_dir)
+        if files is None:
+            return 1
     
     # Запускаем индексацию
     try:
-        run_indexing(file_paths=files, data_dir=args.data_dir)
+        run_indexing(
+            file_paths=files,
+            data_dir=args.data_dir,
+            bm25_path=args.bm25_path,
+            persist_path=args.index_dir,
+            sources=args.source,
+            retry_failed=args.retry_failed,
+        )
         logging.info("Индексация завершена успешно")
         return 0
     except Exception as e:
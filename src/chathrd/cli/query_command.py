@@ -7,6 +7,7 @@ from pathlib import Path
 from typing import Optional
 
 from chathrd.pipelines.querying import process_query, create_querying_pipeline
+from chathrd.utils.sources import SOURCES
 
 
 def parse_arguments() -> argparse.Namespace:
@@ -41,8 +42,14 @@ def parse_arguments() -> argparse.Namespace:
     )
     parser.add_argument(
         "--bm25-path",
-        default="../data/bm25.pkl",
-        help="Путь к индексу BM25."
+        default="../data/bm25_index",
+        help="Директория индекса BM25."
+    )
+    parser.add_argument(
+        "--source",
+        action="append",
+        choices=SOURCES,
+        help="Искать только в этом источнике (можно указать несколько раз); по умолчанию во всех."
     )
     parser.add_argument(
         "--log-level",
@@ -89,9 +96,9 @@ def validate_paths(index_dir: str, bm25_path: str) -> bool:
         logging.error(f"Директория с индексом Chroma не найдена: {index_dir}")
         return False
     
-    # Проверяем файл с индексом BM25
+    # Проверяем директорию с индексом BM25
     if not Path(bm25_path).exists():
-        logging.error(f"Файл с индексом BM25 не найден: {bm25_path}")
+        logging.error(f"Индекс BM25 не найден: {bm25_path}")
         return False
     
     return True
@@ -132,7 +139,7 @@ def main() -> int:
         )
         
         # Выполняем запрос
-        result = process_query(args.query, pipeline)
+        result = process_query(args.query, pipeline, sources=args.source)
         
         # Выводим результат
         answer = result.get("answer", "Не удалось найти ответ на ваш запрос.")
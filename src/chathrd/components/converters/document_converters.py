@@ -1,88 +1,390 @@
 """Компоненты для конвертации документов из разных форматов."""
 
+import codecs
 import logging
+import os
 import tempfile
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from pathlib import Path
-from typing import List, Union, Dict
+from typing import List, Optional, Union, Dict, Tuple
 
 import fitz
+import numpy as np
 from haystack import component, Document
 from haystack.dataclasses import ByteStream
-from pdf2image import convert_from_path
+from pdf2image import convert_from_path, pdfinfo_from_path
+from PIL import Image
 import pytesseract
 
+from chathrd.components.processors.document_processors import detect_encoding
+from chathrd.config.settings import settings
+from chathrd.utils.file_manifest import file_sha256
+from chathrd.utils.ocr_cache import OCRCache
+
 logger = logging.getLogger(__name__)
 
 
+def page_text_layer(page, min_chars: int = 20) -> Optional[str]:
+    """
+    Извлекает текстовый слой страницы PDF.
+
+    Args:
+        page: Страница PyMuPDF.
+        min_chars: Сколько символов нужно, чтобы не распознавать страницу.
+
+    Returns:
+        Optional[str]: Текст страницы или None, если текста нет и страницу нужно распознавать.
+    """
+    text = page.get_text("text", sort=True)
+    return text if len(text.strip()) >= min_chars else None
+
+
+def pdf_text_layer(path: Path, min_page_chars: int = 20) -> Optional[List[Optional[str]]]:
+    """
+    Извлекает текстовый слой всех страниц PDF, открывая файл один раз.
+
+    Если PyMuPDF не открыл файл, все страницы считаются страницами без текста
+    (их число берётся из pdfinfo), чтобы файл ушёл в OCR целиком.
+
+    Args:
+        path: Путь к PDF.
+        min_page_chars: Сколько символов нужно странице, чтобы её не распознавать.
+
+    Returns:
+        Optional[List[Optional[str]]]: Текст страниц (None на месте страниц без текстового
+            слоя) или None, если файл не удалось прочитать.
+    """
+    try:
+        with fitz.open(path) as pdf:
+            return [page_text_layer(page, min_page_chars) for page in pdf]
+    except Exception as e:
+        logger.debug(f"PyMuPDF failed on {path.name}: {e}")
+    try:
+        return [None] * pdfinfo_from_path(str(path))["Pages"]
+    except Exception as e:
+        logger.error(f"PDF→Image conversion failed for {path.name}: {e}")
+        return None
+
+
+def otsu_threshold(gray: np.ndarray) -> int:
+    """
+    Порог бинаризации по методу Оцу.
+
+    Args:
+        gray: Изображение в оттенках серого (uint8).
+
+    Returns:
+        int: Порог яркости: пиксели не ярче него считаются чернилами.
+    """
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    omega = np.cumsum(hist) / hist.sum()
+    mu = np.cumsum(hist * np.arange(256)) / hist.sum()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        between = (mu[-1] * omega - mu) ** 2 / (omega * (1 - omega))
+    return int(np.argmax(np.nan_to_num(between)))
+
+
+def ocr_data_to_text(data: Dict[str, list]) -> Tuple[str, float]:
+    """
+    Собирает текст из pytesseract.image_to_data и считает среднюю уверенность слов.
+
+    Args:
+        data: Результат image_to_data с output_type=Output.DICT.
+
+    Returns:
+        Tuple[str, float]: Текст (строки через \n, абзацы через пустую строку) и уверенность 0–100.
+    """
+    paragraphs: Dict[Tuple[int, int], Dict[int, List[str]]] = {}
+    confidences: List[float] = []
+    for i, word in enumerate(data["text"]):
+        conf = float(data["conf"][i])
+        if conf < 0 or not word.strip():
+            continue
+        confidences.append(conf)
+        lines = paragraphs.setdefault((data["block_num"][i], data["par_num"][i]), {})
+        lines.setdefault(data["line_num"][i], []).append(word)
+    text = "\n\n".join(
+        "\n".join(" ".join(words) for words in lines.values()) for lines in paragraphs.values()
+    )
+    return text, (sum(confidences) / len(confidences) if confidences else 0.0)
+
+
 @component
 class OCRPDFToDocument:
     """
-    Конвертирует PDF-файлы:
-      – если в PDF есть текстовый слой → быстрое извлечение через PyMuPDF;
-      – иначе (сканы, пустые, повреждённые) → распознавание через pytesseract.
-    Выходной сокет: 'documents' (List[Document]) :contentReference[oaicite:3]{index=3}.
+    Конвертирует PDF, в которых есть страницы без текстового слоя (сканы, вклеенные
+    страницы с подписями, пустые, повреждённые файлы). Страницы с текстовым слоем
+    берутся как есть, распознаются (pytesseract) только страницы без текста.
+    Текстовый слой передаётся в text_layers: его собирает PDFFastOrOCRRouter при
+    маршрутизации, поэтому PDF не открывается повторно. Для путей без text_layers
+    он извлекается здесь же (см. pdf_text_layer).
+
+    Распознаваемые страницы растеризуются по одной (pdf2image с first_page/last_page) и
+    сразу отдаются на распознавание в пул из workers потоков (Tesseract — отдельный
+    процесс, так что потоки загружают несколько ядер). В памяти одновременно не больше
+    max_in_flight изображений страниц: следующая страница растеризуется, только когда
+    распознана одна из предыдущих. Оба лимита действуют в пределах процесса; в
+    ParallelFileConverter экземпляров столько же, сколько процессов конвертации,
+    поэтому значения по умолчанию (OCR_WORKERS, OCR_MAX_IN_FLIGHT) делят ядра между
+    ними. Время растеризации и распознавания каждой страницы пишется в лог.
+
+    Перед распознаванием страница растеризуется с низким разрешением (probe_dpi):
+    почти пустые страницы пропускаются, а по размеру страницы и высоте строк текста
+    выбирается разрешение в пределах [min_dpi, max_dpi] — обычному тексту А4 хватает
+    150–200 dpi. Страница растеризуется в оттенках серого и бинаризуется (порог Оцу).
+    Если средняя уверенность Tesseract ниже min_confidence, страница распознаётся
+    ещё раз с max_dpi без бинаризации, и берётся более уверенный результат.
+
+    Распознанные страницы сохраняются в постоянный OCRCache (cache_path, пустой
+    путь отключает кэш) по хэшу содержимого PDF, номеру страницы и параметрам
+    распознавания, поэтому при переиндексации неизменные сканы не распознаются
+    заново. Попадания и промахи кэша считаются в stats.
+
+    Страницы собираются по порядку в один документ через \f, поэтому
+    DocumentSplitter проставляет чанкам page_number. В meta документа:
+    page_count, ocr_used и ocr_pages — номера распознанных страниц через запятую.
+    Выходной сокет: 'documents' (List[Document]).
     """
+    def __init__(
+        self,
+        workers: int = settings.OCR_WORKERS,
+        max_in_flight: int = settings.OCR_MAX_IN_FLIGHT,
+        min_dpi: int = settings.OCR_MIN_DPI,
+        max_dpi: int = settings.OCR_MAX_DPI,
+        min_confidence: float = settings.OCR_MIN_CONFIDENCE,
+        min_page_chars: int = 20,
+        probe_dpi: int = 72,
+        max_pixels: int = 9_000_000,
+        cache_path: str = settings.OCR_CACHE_PATH,
+        cache_max_mb: int = settings.OCR_CACHE_MB,
+    ):
+        self.workers = max(1, workers)
+        self.max_in_flight = max(1, max_in_flight)
+        self.min_dpi = min_dpi
+        self.max_dpi = max(min_dpi, max_dpi)
+        self.min_confidence = min_confidence
+        self.min_page_chars = min_page_chars
+        self.probe_dpi = probe_dpi
+        self.max_pixels = max_pixels
+        self.cache = OCRCache(cache_path, cache_max_mb * 2**20) if cache_path else None
+        # параметры, от которых зависит распознанный текст, — часть ключа кэша
+        self.cache_params = f"rus+eng:{min_dpi}:{max_dpi}:{min_confidence}:{probe_dpi}:{max_pixels}"
+        self.stats: Counter = Counter()
+        if self.workers > 1:
+            # страницы распознаются параллельно — внутренние потоки Tesseract только мешают
+            os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
     @component.output_types(documents=List[Document])
-    def run(self, sources: List[Union[str, Path]]) -> dict:
+    def run(
+        self,
+        sources: List[Union[str, Path]],
+        text_layers: Optional[Dict[str, List[Optional[str]]]] = None,
+    ) -> dict:
+        """
+        Args:
+            sources: Пути к PDF.
+            text_layers: Для некоторых путей — уже извлечённый текст страниц
+                (None на месте страниц без текстового слоя).
+
+        Returns:
+            dict: {"documents": List[Document]}.
+        """
         all_docs: List[Document] = []
         for src in sources:
             path = Path(src)
-            try:
-                # 1) Открываем PDF и пытаемся извлечь «сырой» текст
-                pdf = fitz.open(path)  
-                text_pages = [page.get_text("text", sort=True) for page in pdf]  
-                full_text = "\n".join(text_pages).strip()  
-                # если получилось >20 символов — считаем, что текстовый слой есть
-                if len(full_text) >= 20:
-                    all_docs.append(Document(
-                        content=full_text,
-                        meta={"name": path.name, "ocr_used": False}
-                    ))
-                    continue
-            except Exception as e:
-                logger.debug(f"PyMuPDF failed on {path.name}: {e}")
-            
-            # 2) PDF без текста — конвертируем страницы в изображения
-            try:
-                images = convert_from_path(str(path), dpi=300)
-            except Exception as e:
-                logger.error(f"PDF→Image conversion failed for {path.name}: {e}")
+            pages = (text_layers or {}).get(str(path))
+            if pages is None:
+                pages = pdf_text_layer(path, self.min_page_chars)
+            if pages is None:
                 continue
 
-            # 3) На каждой странице запускаем Tesseract OCR
-            page_texts: List[str] = []
-            for i, img in enumerate(images):
-                try:
-                    txt = pytesseract.image_to_string(img, lang="rus+eng")
-                    page_texts.append(txt)
-                except Exception as exc:
-                    logger.error(f"OCR failed on page {i+1} of {path.name}: {exc}")
+            ocr_pages = [i + 1 for i, text in enumerate(pages) if text is None]
+            if ocr_pages:
+                start = time.perf_counter()
+                file_hash = file_sha256(path) if self.cache else None
+                recognized = self._ocr_pages(path, ocr_pages, file_hash)
+                logger.info(
+                    f"OCR {path.name}: {len(ocr_pages)} из {len(pages)} стр. за "
+                    f"{time.perf_counter() - start:.1f} сек ({self.workers} потоков)"
+                )
+            else:
+                recognized = {}
 
-            ocr_content = "\n".join(page_texts).strip()
-            if ocr_content:
+            page_texts = [recognized.get(i + 1, "") if text is None else text for i, text in enumerate(pages)]
+            if any(text.strip() for text in page_texts):
                 all_docs.append(Document(
-                    content=ocr_content,
+                    content="\f".join(page_texts),
                     meta={
                         "name": path.name,
-                        "ocr_used": True,
-                        "page_count": len(images)
+                        "file_path": str(path),
+                        "ocr_used": bool(ocr_pages),
+                        "ocr_pages": ",".join(map(str, ocr_pages)),
+                        "page_count": len(pages)
                     }
                 ))
             else:
                 logger.warning(f"No text extracted from {path.name} even after OCR")
         return {"documents": all_docs}
 
+    def _ocr_pages(self, path: Path, page_numbers: List[int], file_hash: Optional[str] = None) -> Dict[int, str]:
+        """Растеризует страницы по одной и распознаёт их в пуле потоков (кроме найденных в кэше)."""
+        page_texts: Dict[int, str] = {}
+        in_flight: Dict[Future, Tuple[int, float]] = {}
+        keys: Dict[int, str] = {}
+        if self.cache and file_hash:
+            keys = {page_no: OCRCache.key(file_hash, page_no, self.cache_params) for page_no in page_numbers}
+
+        def collect(done) -> None:
+            for future in done:
+                page_no, raster_time = in_flight.pop(future)
+                try:
+                    page_texts[page_no], ocr_time, conf, dpi = future.result()
+                except Exception as exc:
+                    logger.error(f"OCR failed on page {page_no} of {path.name}: {exc}")
+                    continue
+                if page_no in keys:
+                    self.cache.put(keys[page_no], page_texts[page_no])
+                logger.debug(
+                    f"{path.name}, стр. {page_no}: растеризация {raster_time:.2f} сек, "
+                    f"OCR {ocr_time:.2f} сек, {dpi} dpi, уверенность {conf:.0f}"
+                )
+
+        hits = 0
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ocr") as pool:
+            for page_no in page_numbers:
+                cached = self.cache.get(keys[page_no]) if page_no in keys else None
+                if cached is not None:
+                    page_texts[page_no] = cached
+                    hits += 1
+                    continue
+                # не больше max_in_flight изображений страниц в памяти
+                while len(in_flight) >= self.max_in_flight:
+                    collect(wait(in_flight, return_when=FIRST_COMPLETED).done)
+                start = time.perf_counter()
+                try:
+                    rendered = self._render(path, page_no)
+                except Exception as e:
+                    logger.error(f"PDF→Image conversion failed for page {page_no} of {path.name}: {e}")
+                    continue
+                if rendered is None:
+                    logger.debug(f"{path.name}, стр. {page_no}: пустая страница, OCR пропущен")
+                    page_texts[page_no] = ""
+                    if page_no in keys:
+                        self.cache.put(keys[page_no], "")
+                    continue
+                image, dpi = rendered
+                in_flight[pool.submit(self._ocr_page, path, page_no, image, dpi)] = (
+                    page_no, time.perf_counter() - start
+                )
+            collect(list(in_flight))
+        if keys:
+            self.stats["ocr_cache_hits"] += hits
+            self.stats["ocr_cache_misses"] += len(keys) - hits
+            logger.info(f"OCR-кэш {path.name}: попаданий {hits}, промахов {len(keys) - hits}")
+        return page_texts
+
+    def _rasterize(self, path: Path, page_no: int, dpi: int) -> Image.Image:
+        return convert_from_path(
+            str(path), dpi=dpi, first_page=page_no, last_page=page_no, grayscale=True
+        )[0]
+
+    def _choose_dpi(self, probe: np.ndarray) -> Optional[int]:
+        """
+        Выбирает разрешение по пробной растеризации страницы.
+
+        Args:
+            probe: Страница в оттенках серого с разрешением probe_dpi.
+
+        Returns:
+            Optional[int]: Разрешение для OCR или None, если страница почти пустая.
+        """
+        ink = probe <= otsu_threshold(probe)
+        if ink.mean() < 0.002:
+            return None
+        height_in, width_in = probe.shape[0] / self.probe_dpi, probe.shape[1] / self.probe_dpi
+
+        # строки текста — полосы рядов с чернилами; Tesseract лучше всего читает строки
+        # высотой ~30 пикселей (от верха прописных до низа выносных), мелкому шрифту
+        # нужно большее разрешение
+        rows = ink.mean(axis=1) > 0.01
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], rows.astype(np.int8), [0]))))
+        heights = edges[1::2] - edges[::2]
+        heights = heights[heights >= 2]
+        dpi = self.max_dpi
+        if len(heights):
+            line_in = float(np.median(heights)) / self.probe_dpi
+            dpi = int(30 / line_in)
+
+        # крупные страницы (А3, чертежи) — не больше max_pixels пикселей
+        dpi = min(dpi, int((self.max_pixels / (width_in * height_in)) ** 0.5))
+        return max(self.min_dpi, min(self.max_dpi, dpi // 25 * 25))
+
+    def _render(self, path: Path, page_no: int) -> Optional[Tuple[Image.Image, int]]:
+        """Растеризует страницу с подобранным разрешением и бинаризует её; None — пустая страница."""
+        probe = self._rasterize(path, page_no, self.probe_dpi)
+        dpi = self._choose_dpi(np.asarray(probe))
+        probe.close()
+        if dpi is None:
+            return None
+        image = self._rasterize(path, page_no, dpi)
+        gray = np.asarray(image)
+        image.close()
+        return Image.fromarray(gray > otsu_threshold(gray)), dpi
+
+    def _recognize(self, image: Image.Image) -> Tuple[str, float]:
+        data = pytesseract.image_to_data(image, lang="rus+eng", output_type=pytesseract.Output.DICT)
+        return ocr_data_to_text(data)
+
+    def _ocr_page(self, path: Path, page_no: int, image: Image.Image, dpi: int) -> Tuple[str, float, float, int]:
+        """Распознаёт страницу; при низкой уверенности — повторно с max_dpi без бинаризации."""
+        start = time.perf_counter()
+        try:
+            text, conf = self._recognize(image)
+        finally:
+            image.close()
+        if conf < self.min_confidence and dpi < self.max_dpi:
+            retry = self._rasterize(path, page_no, self.max_dpi)
+            try:
+                retry_text, retry_conf = self._recognize(retry)
+            finally:
+                retry.close()
+            logger.debug(
+                f"{path.name}, стр. {page_no}: уверенность {conf:.0f} при {dpi} dpi, "
+                f"повтор с {self.max_dpi} dpi — {retry_conf:.0f}"
+            )
+            if retry_conf > conf:
+                text, conf, dpi = retry_text, retry_conf, self.max_dpi
+        return text, time.perf_counter() - start, conf, dpi
+
 
 @component
 class PDFFastOrOCRRouter:
     """
-    Разбивает источники PDF на две группы:
-      – fast: файлы с текстовым слоем (PyPDFToDocument);
-      – ocr : сканы и пустые (OCRPDFToDocument).
+    Разбивает источники PDF на две группы, открывая каждый файл один раз:
+      – documents  : файлы, где текстовый слой есть на всех страницах, — сразу
+                     извлечённый текст (PyMuPDF);
+      – ocr        : сканы, пустые и смешанные файлы (OCRPDFToDocument);
+      – text_layers: для каждого файла из ocr — уже извлечённый текст страниц
+                     (None на месте страниц, которые нужно распознать), чтобы
+                     OCRPDFToDocument не открывал файл повторно.
+
+    Файлы, которые не удалось прочитать ни PyMuPDF, ни pdfinfo, пропускаются с
+    ошибкой в логе. Текст страниц разделяется символом \f, как у
+    PyPDFToDocument, чтобы HeaderFooterCleaner находил колонтитулы по страницам.
     """
-    @component.output_types(fast=List[str], ocr=List[str])
+    def __init__(self, min_page_chars: int = 20):
+        """
+        Args:
+            min_page_chars: Сколько символов нужно странице, чтобы её не распознавать.
+        """
+        self.min_page_chars = min_page_chars
+
+    @component.output_types(documents=List[Document], ocr=List[str], text_layers=Dict[str, List[Optional[str]]])
     def run(self, sources: List[Union[str, Path, ByteStream]]) -> dict:
-        fast, ocr = [], []
+        documents, ocr = [], []
+        text_layers: Dict[str, List[Optional[str]]] = {}
         for src in sources:
             # Подготовка пути: если ByteStream, сохраняем во временный файл
             if isinstance(src, ByteStream):
@@ -95,19 +397,94 @@ class PDFFastOrOCRRouter:
             else:
                 path = Path(src)
 
-            # Пытаемся быстрый текстовый путь (PyMuPDF)
-            try:
-                pdf = fitz.open(path)
-                text = "".join(page.get_text("text", sort=True) for page in pdf).strip()
-                if len(text) >= 20:
-                    fast.append(str(path))
-                    continue
-            except Exception:
-                # если PyMuPDF упал — переходим к OCR
-                pass
+            # текстовый слой всех страниц за одно открытие файла (PyMuPDF)
+            pages = pdf_text_layer(path, self.min_page_chars)
+            if pages is None:
+                continue
+            if pages and all(text is not None for text in pages):
+                documents.append(Document(
+                    content="\f".join(pages),
+                    meta={"name": path.name, "file_path": str(path), "ocr_used": False, "page_count": len(pages)}
+                ))
+                continue
 
-            # Во всех остальных случаях — ветка OCR
+            # сканы, пустые и смешанные файлы — ветка OCR вместе с уже извлечённым текстом
+            text_layers[str(path)] = pages
             ocr.append(str(path))
 
-        # Возвращаем два списка путей
-        return {"fast": fast, "ocr": ocr}
\ No newline at end of file
+        return {"documents": documents, "ocr": ocr, "text_layers": text_layers}
+
+
+@component
+class StreamingTextFileToDocument:
+    """
+    Конвертирует большие текстовые файлы (логи, выгрузки) без промежуточной копии
+    всего файла в байтах и одной гигантской строки.
+
+    Кодировка определяется один раз по первым prefix_bytes байтам (UTF-8 или CP1251),
+    затем файл читается блоками и декодируется потоковым декодером, а текст
+    нарезается на документы примерно по chunk_chars символов по границам строк.
+    Документы файла возвращаются вместе, так что память пропорциональна его
+    тексту. Если UTF-8 по префиксу оказался не UTF-8 дальше (выгрузка с
+    CP1251-хвостом), файл перечитывается целиком как CP1251 — символы замены
+    U+FFFD в текст не попадают. Документы одного файла получают meta file_path,
+    encoding и part (номер части с 0).
+    """
+    def __init__(self, chunk_chars: int = 1_000_000, prefix_bytes: int = 64 * 1024, block_size: int = 1 << 20):
+        """
+        Args:
+            chunk_chars: Примерный размер документа в символах.
+            prefix_bytes: Сколько первых байт файла используется для определения кодировки.
+            block_size: Размер блока чтения в байтах.
+        """
+        self.chunk_chars = chunk_chars
+        self.prefix_bytes = prefix_bytes
+        self.block_size = block_size
+
+    @component.output_types(documents=List[Document])
+    def run(self, sources: List[Union[str, Path]]) -> dict:
+        documents: List[Document] = []
+        for src in sources:
+            path = Path(src)
+            with open(path, "rb") as f:
+                prefix = f.read(self.prefix_bytes)
+            encoding = detect_encoding(prefix, final=len(prefix) < self.prefix_bytes)
+            try:
+                parts = self._read_parts(path, encoding)
+            except UnicodeDecodeError:
+                logger.warning(f"{path.name}: файл не в UTF-8 дальше первых {len(prefix)} байт, читаем как cp1251")
+                encoding = "cp1251"
+                parts = self._read_parts(path, encoding)
+
+            for i, part in enumerate(parts):
+                if part.strip():
+                    documents.append(Document(
+                        content=part,
+                        meta={"name": path.name, "file_path": str(path), "encoding": encoding, "part": i}
+                    ))
+            logger.debug(f"{path.name}: {len(parts)} частей, кодировка {encoding}")
+        return {"documents": documents}
+
+    def _read_parts(self, path: Path, encoding: str) -> List[str]:
+        """
+        Читает файл блоками и режет текст на части по границам строк.
+
+        Raises:
+            UnicodeDecodeError: Если файл не декодируется как UTF-8.
+        """
+        # CP1251 декодирует любой байт, кроме неопределённого 0x98, — его пропускаем
+        decoder = codecs.getincrementaldecoder(encoding)(errors="strict" if encoding == "utf-8" else "ignore")
+        parts: List[str] = []
+        buffer = ""
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(self.block_size), b""):
+                buffer += decoder.decode(block)
+                while len(buffer) >= self.chunk_chars:
+                    # режем по последнему переводу строки, чтобы не разрывать строки
+                    cut = buffer.rfind("\n", 0, self.chunk_chars) + 1 or self.chunk_chars
+                    parts.append(buffer[:cut])
+                    buffer = buffer[cut:]
+            buffer += decoder.decode(b"", final=True)
+        if buffer:
+            parts.append(buffer)
+        return parts
@@ -0,0 +1,371 @@
+"""Параллельная конвертация файлов в пуле процессов с изоляцией сбоев по файлам."""
+
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from collections import Counter, defaultdict, deque
+from multiprocessing.connection import wait
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple, Union
+
+from haystack import Document, component
+from haystack.components.converters import (
+    CSVToDocument,
+    DOCXToDocument,
+    MarkdownToDocument,
+    TextFileToDocument,
+    TikaDocumentConverter,
+    XLSXToDocument,
+)
+from haystack.components.routers import FileTypeRouter
+
+from chathrd.components.converters.document_converters import (
+    OCRPDFToDocument,
+    PDFFastOrOCRRouter,
+    StreamingTextFileToDocument,
+)
+from chathrd.components.processors.document_processors import EncodingSplitter
+from chathrd.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# столько процессов подряд не смогли запуститься — значит, сломано окружение, а не файл
+MAX_START_FAILURES = 3
+
+# MIME-маршруты, как в FileTypeRouter пайплайна индексации; остальное — "unclassified" (Tika)
+MIME_TYPES = [
+    "text/plain",                        # .txt, .yml
+    "text/csv",                          # .csv
+    "text/markdown",                     # .md
+    "application/json",                  # .json
+    "application/pdf",                   # .pdf
+    "application/msword",                # .doc
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document",  # .docx
+    "application/epub+zip",              # .epub
+    "application/vnd.ms-excel",          # .xls
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",        # .xlsx
+]
+
+
+# ───────── рабочий процесс ─────────
+
+_converters: Dict[str, Any] = {}
+# полный путь в meta["file_path"] нужен манифесту индексации
+_FACTORIES: Dict[str, Callable[[], Any]] = {
+    "enc_split": EncodingSplitter,
+    "txt_utf8": lambda: TextFileToDocument(store_full_path=True),
+    "txt_cp": lambda: TextFileToDocument(encoding="cp1251", store_full_path=True),
+    "txt_stream": StreamingTextFileToDocument,
+    "csv": lambda: CSVToDocument(store_full_path=True),
+    "markdown": lambda: MarkdownToDocument(store_full_path=True),
+    "pdf_router": PDFFastOrOCRRouter,
+    "ocr_pdf": OCRPDFToDocument,
+    "docx": lambda: DOCXToDocument(store_full_path=True),
+    "xlsx": lambda: XLSXToDocument(table_format="markdown", store_full_path=True),
+    "tika": lambda: TikaDocumentConverter(store_full_path=True),
+}
+
+
+def _converter(name: str):
+    """Конвертеры создаются в рабочем процессе один раз, при первом файле своего типа."""
+    if name not in _converters:
+        _converters[name] = _FACTORIES[name]()
+    return _converters[name]
+
+
+def _route_converter(mime_type: str) -> str:
+    """Выбирает конвертер для файла MIME-маршрута."""
+    return {
+        "text/csv": "csv",
+        "text/markdown": "markdown",
+        "application/json": "txt_utf8",
+        "application/vnd.openxmlformats-officedocument.wordprocessingml.document": "docx",
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": "xlsx",
+    }.get(mime_type, "tika")
+
+
+def convert_file(path: str, mime_type: str) -> Tuple[str, List[Document]]:
+    """
+    Конвертирует один файл тем же конвертером, что и последовательный пайплайн.
+
+    Args:
+        path: Путь к файлу.
+        mime_type: MIME-маршрут файла (или "unclassified").
+
+    Returns:
+        Tuple[str, List[Document]]: Имя использованного конвертера и документы.
+    """
+    if mime_type == "application/pdf":
+        # текстовый слой извлекается при маршрутизации, страницы без него уходят в OCR
+        routed = _converter("pdf_router").run(sources=[path])
+        if routed["documents"]:
+            return "pdf_text", routed["documents"]
+        ocr = _converter("ocr_pdf").run(sources=routed["ocr"], text_layers=routed["text_layers"])
+        return "ocr_pdf", ocr["documents"]
+    if mime_type == "text/plain":
+        # файл читается один раз: маленькие уходят в конвертер байтами, большие — потоково
+        split = _converter("enc_split").run(sources=[path])
+        for name, output in (("txt_stream", "large"), ("txt_utf8", "utf8"), ("txt_cp", "cp")):
+            if split[output]:
+                return name, _converter(name).run(sources=split[output])["documents"]
+        return "txt_utf8", []
+    name = _route_converter(mime_type)
+    return name, _converter(name).run(sources=[path])["documents"]
+
+
+def _take_stats() -> Dict[str, int]:
+    """Счётчики конвертеров (например, OCR-кэша) с прошлого вызова; после чтения обнуляются."""
+    stats: Counter = Counter()
+    for converter in _converters.values():
+        counters = getattr(converter, "stats", None)
+        if counters:
+            stats.update(counters)
+            counters.clear()
+    return dict(stats)
+
+
+def _worker_main(conn, log_level: int) -> None:
+    """Цикл рабочего процесса: получает (путь, MIME), отвечает документами или ошибкой."""
+    # процесс запущен через spawn и не наследует настройки логирования
+    logging.basicConfig(
+        level=log_level,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        handlers=[logging.StreamHandler(sys.stdout)],
+    )
+    # модуль с конвертерами уже импортирован — таймаут файлов считается с этого момента
+    conn.send(("ready",))
+    while True:
+        task = conn.recv()
+        if task is None:
+            break
+        path, mime_type = task
+        start = time.perf_counter()
+        try:
+            name, docs = convert_file(path, mime_type)
+            conn.send(("ok", path, name, docs, time.perf_counter() - start, _take_stats()))
+        except Exception as e:
+            conn.send(("error", path, None, f"{type(e).__name__}: {e}", time.perf_counter() - start, _take_stats()))
+
+
+# ───────── управление пулом ─────────
+
+class _Worker:
+    """Рабочий процесс со своим каналом; занят не больше чем одним файлом."""
+
+    def __init__(self, ctx):
+        self.conn, child_conn = ctx.Pipe()
+        log_level = logging.getLogger().getEffectiveLevel()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn, log_level), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.spawned = time.monotonic()
+        self.ready = False
+        self.task: Optional[Tuple[str, str]] = None
+        self.started = 0.0
+
+    def submit(self, task: Tuple[str, str]) -> None:
+        self.task = task
+        self.started = time.monotonic()
+        self.conn.send(task)
+
+    def stop(self) -> None:
+        try:
+            if self.process.is_alive() and self.task is None:
+                self.conn.send(None)
+                self.process.join(timeout=5)
+        except (OSError, EOFError):
+            pass
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+@component
+class ParallelFileConverter:
+    """
+    Конвертирует файлы в пуле рабочих процессов вместо цепочки
+    FileTypeRouter → конвертеры → DocumentJoiner.
+
+    Файлы раскладываются по MIME-маршрутам тем же FileTypeRouter, а каждый файл
+    конвертируется в рабочем процессе тем же конвертером, что и раньше (текст —
+    по кодировке, PDF — с текстовым слоем или через OCR). Каждый процесс занят
+    одним файлом, поэтому падение процесса (например, в нативной библиотеке) или
+    превышение timeout затрагивает только этот файл: процесс перезапускается, а
+    файл попадает в выход failed. Тот же timeout действует на запуск процесса;
+    процесс, который завис или упал при запуске либо умер в простое, заменяется
+    новым, и только MAX_START_FAILURES неудачных запусков подряд прерывают
+    конвертацию. Документы собираются в порядке завершения
+    файлов; рабочие процессы живут между запусками, так что при индексации
+    пачками конвертеры инициализируются один раз на процесс. Счётчики
+    конвертеров (попадания и промахи OCR-кэша) суммируются по всем процессам в
+    stats и выводятся в лог после каждого запуска, а в route_stats копятся
+    число файлов, ошибок, документов, байт и время конвертации по MIME-маршрутам
+    (с разбивкой по конвертерам — например, PDF с текстовым слоем и OCR).
+
+    Вход:
+      - sources: List[str | Path] — пути к файлам
+    Выход:
+      - documents: List[Document] — документы всех сконвертированных файлов
+      - failed   : List[str]      — файлы, которые не удалось сконвертировать
+    """
+    def __init__(self, workers: int = settings.CONVERT_WORKERS, timeout: float = settings.CONVERT_TIMEOUT):
+        """
+        Args:
+            workers: Число рабочих процессов.
+            timeout: Сколько секунд можно конвертировать один файл.
+        """
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.router = FileTypeRouter(mime_types=MIME_TYPES)
+        self._ctx = multiprocessing.get_context("spawn")
+        self._pool: List[_Worker] = []
+        self._start_failures = 0
+        self.stats: Counter = Counter()
+        self.route_stats: Dict[str, Dict[str, Any]] = {}
+        self._file_routes: Dict[str, str] = {}
+
+    def _route(self, sources: List[Union[str, Path]]) -> Tuple[List[Tuple[str, str]], List[str]]:
+        routes = self.router.run(sources=list(sources))
+        failed = [str(path) for path in routes.pop("failed", [])]
+        tasks = [(str(path), mime_type) for mime_type, paths in routes.items() for path in paths]
+        return tasks, failed
+
+    def route_of(self, path: Union[str, Path]) -> str:
+        """MIME-маршрут файла (по уже сконвертированным файлам или по FileTypeRouter)."""
+        key = os.path.abspath(path)
+        if key not in self._file_routes:
+            tasks, _ = self._route([key])
+            self._file_routes[key] = tasks[0][1] if tasks else "failed"
+        return self._file_routes[key]
+
+    def _record_route(
+        self, path: str, mime_type: str, converter: Optional[str], documents: int, elapsed: float,
+    ) -> None:
+        """Учитывает файл в route_stats; converter=None — файл не сконвертирован."""
+        self._file_routes[os.path.abspath(path)] = mime_type
+        stats = self.route_stats.setdefault(mime_type, {
+            "files": 0, "failed": 0, "documents": 0, "bytes": 0, "seconds": 0.0, "converters": defaultdict(int),
+        })
+        stats["files"] += 1
+        stats["failed"] += converter is None
+        stats["documents"] += documents
+        stats["bytes"] += os.path.getsize(path) if os.path.isfile(path) else 0
+        stats["seconds"] += elapsed
+        stats["converters"][converter or "failed"] += 1
+
+    @component.output_types(documents=List[Document], failed=List[str])
+    def run(self, sources: List[Union[str, Path]]) -> Dict[str, Any]:
+        tasks, failed = self._route(sources)
+        documents: List[Document] = []
+        pending: Deque[Tuple[str, str]] = deque(tasks)
+
+        stats: Counter = Counter()
+        busy: List[_Worker] = []
+        while pending or busy:
+            # процессы, умершие в простое (между файлами или запусками), просто заменяются
+            for worker in [w for w in self._pool if w.ready and w.task is None and not w.process.is_alive()]:
+                logger.warning(f"Простаивающий процесс конвертации завершился с кодом {worker.process.exitcode}, перезапуск")
+                worker.stop()
+                self._pool.remove(worker)
+            # процессы запускаются по мере надобности и заменяют упавшие
+            while len(self._pool) < min(self.workers, len(pending) + len(busy)):
+                self._pool.append(_Worker(self._ctx))
+            for worker in self._pool:
+                if pending and worker.ready and worker.task is None:
+                    worker.submit(pending.popleft())
+                    busy.append(worker)
+
+            # ждём ответа, готовности нового процесса, падения процесса или ближайшего таймаута
+            active = [worker for worker in self._pool if worker.task is not None or not worker.ready]
+            deadlines = [worker.started + self.timeout for worker in busy]
+            deadlines += [worker.spawned + self.timeout for worker in active if not worker.ready]
+            timeout = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+            wait([worker.conn for worker in active] + [worker.process.sentinel for worker in active], timeout)
+
+            for worker in active:
+                message = None
+                if worker.conn.poll():
+                    try:
+                        message = worker.conn.recv()
+                    except EOFError:
+                        # канал закрылся — процесс упал; дожидаемся его кода завершения
+                        worker.process.join(timeout=5)
+                if message is not None:
+                    if message[0] == "ready":
+                        worker.ready = True
+                        self._start_failures = 0
+                        continue
+                    status, path, name, payload, elapsed, file_stats = message
+                    stats.update(file_stats)
+                    mime_type = worker.task[1]
+                    worker.task = None
+                    busy.remove(worker)
+                    if status == "ok":
+                        documents.extend(payload)
+                        self._record_route(path, mime_type, name, len(payload), elapsed)
+                        logger.debug(f"{path}: {name}, {len(payload)} документов за {elapsed:.2f} сек")
+                    else:
+                        failed.append(path)
+                        self._record_route(path, mime_type, None, 0, elapsed)
+                        logger.error(f"Ошибка конвертации {path} ({mime_type}): {payload}")
+                    continue
+
+                crashed = not worker.process.is_alive()
+                if not worker.ready:
+                    if crashed or time.monotonic() - worker.spawned > self.timeout:
+                        self._replace_starting(worker, crashed)
+                    continue
+                timed_out = worker.task is not None and time.monotonic() - worker.started > self.timeout
+                if crashed or timed_out:
+                    path, mime_type = worker.task
+                    reason = (
+                        f"процесс завершился с кодом {worker.process.exitcode}" if crashed
+                        else f"превышен таймаут {self.timeout:.0f} сек"
+                    )
+                    logger.error(f"Конвертация {path} ({mime_type}) прервана: {reason}")
+                    failed.append(path)
+                    self._record_route(path, mime_type, None, 0, time.monotonic() - worker.started)
+                    busy.remove(worker)
+                    worker.task = None
+                    worker.process.kill()
+                    worker.stop()
+                    self._pool.remove(worker)
+
+        if failed:
+            logger.warning(f"Не удалось сконвертировать {len(failed)} файлов")
+        if stats:
+            logger.info(
+                f"OCR-кэш: попаданий {stats['ocr_cache_hits']}, промахов {stats['ocr_cache_misses']}",
+            )
+            self.stats.update(stats)
+        return {"documents": documents, "failed": failed}
+
+    def _replace_starting(self, worker: _Worker, crashed: bool) -> None:
+        """Убирает процесс, который упал или завис при запуске; на его место запустится новый."""
+        reason = (
+            f"завершился при запуске с кодом {worker.process.exitcode}" if crashed
+            else f"не запустился за {self.timeout:.0f} сек"
+        )
+        worker.process.kill()
+        worker.stop()
+        self._pool.remove(worker)
+        self._start_failures += 1
+        if self._start_failures >= MAX_START_FAILURES:
+            self._start_failures = 0
+            raise RuntimeError(
+                f"Рабочий процесс конвертации {reason}; неудачных запусков подряд: {MAX_START_FAILURES}",
+            )
+        logger.error(f"Рабочий процесс конвертации {reason}, перезапуск")
+
+    def close(self) -> None:
+        """Останавливает рабочие процессы."""
+        for worker in self._pool:
+            worker.stop()
+        self._pool = []
+
+    def __del__(self):
+        if getattr(self, "_pool", None):
+            self.close()
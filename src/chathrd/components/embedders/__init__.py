@@ -0,0 +1 @@
+"""Компоненты для эмбеддинга документов."""
@@ -0,0 +1,251 @@
+"""Эмбеддер документов с батчами по длине в токенах и опциональным int8 ONNX-бэкендом."""
+
+import logging
+import time
+from dataclasses import replace
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from haystack import Document, component
+from sentence_transformers import SentenceTransformer
+
+from chathrd.components.embedders.embedding_pool import EmbeddingWorkerPool
+from chathrd.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# torch — исходная модель fp32; onnx-int8 — динамически квантованная модель в ONNX Runtime (CPU)
+BACKENDS = ("torch", "onnx-int8")
+
+
+def load_embedding_model(
+    model: str, backend: str = "torch", device: Optional[str] = None, threads: Optional[int] = None,
+) -> SentenceTransformer:
+    """
+    Загружает модель эмбеддингов.
+
+    Для onnx-int8 берётся квантованный файл settings.EMBEDDER_ONNX_FILE из репозитория
+    модели; если его там нет, модель один раз экспортируется в ONNX и квантуется
+    локально в DATA_DIR/onnx/<модель>. Нужен пакет sentence-transformers[onnx].
+
+    Args:
+        model: Имя или путь модели SentenceTransformers.
+        backend: Один из BACKENDS.
+        device: Устройство (по умолчанию выбирает SentenceTransformers).
+        threads: Сколько потоков использовать на CPU (по умолчанию — решает бэкенд).
+
+    Returns:
+        SentenceTransformer: Загруженная модель.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Неизвестный бэкенд эмбеддера: {backend} (доступны: {', '.join(BACKENDS)})")
+    if backend == "torch":
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        return SentenceTransformer(model, device=device)
+
+    session_kwargs = {}
+    if threads:
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        session_kwargs["session_options"] = options
+    try:
+        return SentenceTransformer(
+            model, device=device, backend="onnx",
+            model_kwargs={"file_name": settings.EMBEDDER_ONNX_FILE, **session_kwargs},
+        )
+    except Exception as e:
+        logger.info(f"В {model} нет {settings.EMBEDDER_ONNX_FILE} ({e}), квантуем модель локально")
+
+    from sentence_transformers.backend import export_dynamic_quantized_onnx_model
+
+    local_dir = Path(settings.DATA_DIR) / "onnx" / model.replace("/", "__")
+    quantized = sorted(local_dir.glob("onnx/model_*int8_avx2.onnx"))
+    if not quantized:
+        fp32 = SentenceTransformer(model, device=device, backend="onnx")
+        fp32.save_pretrained(str(local_dir))
+        export_dynamic_quantized_onnx_model(fp32, "avx2", str(local_dir))
+        quantized = sorted(local_dir.glob("onnx/model_*int8_avx2.onnx"))
+    file_name = str(quantized[0].relative_to(local_dir))
+    return SentenceTransformer(
+        str(local_dir), device=device, backend="onnx", model_kwargs={"file_name": file_name, **session_kwargs},
+    )
+
+
+def length_buckets(lengths: List[int], batch_size: int) -> List[np.ndarray]:
+    """
+    Раскладывает тексты по батчам близкой длины.
+
+    Args:
+        lengths: Длины текстов в токенах.
+        batch_size: Размер батча.
+
+    Returns:
+        List[np.ndarray]: Индексы текстов каждого батча (от коротких к длинным).
+    """
+    order = np.argsort(np.asarray(lengths), kind="stable")
+    return [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+
+
+def padded_tokens(lengths: List[int], batches: List[np.ndarray]) -> int:
+    """Сколько токенов с учётом пэддинга до самого длинного текста батча обработает модель."""
+    lengths = np.asarray(lengths)
+    return int(sum(lengths[batch].max() * len(batch) for batch in batches if len(batch)))
+
+
+@component
+class BucketedDocumentEmbedder:
+    """
+    Эмбеддер документов, совместимый по входу и выходу с
+    SentenceTransformersDocumentEmbedder.
+
+    Чанки после DocumentSplitter сильно различаются по длине, а батч дополняется
+    пэддингом до самого длинного текста. Поэтому тексты сортируются по длине в
+    токенах (токенизатором самой модели, с учётом max_seq_length), режутся на
+    батчи по batch_size близкой длины, а эмбеддинги возвращаются в исходном
+    порядке документов. Доля пэддинга до и после сортировки пишется в лог.
+
+    Бэкенд onnx-int8 запускает динамически квантованную модель в ONNX Runtime —
+    быстрее на CPU ценой небольшого расхождения векторов (его показывает
+    scripts/benchmark_embedder.py).
+
+    При workers > 1 батчи эмбеддятся в EmbeddingWorkerPool — процессах с моделью,
+    привязанных к своим группам ядер; в основном процессе остаётся только
+    токенизатор для сортировки по длине. Пул останавливается методом close().
+    Скорость каждого запуска (чанков/с и число процессов) пишется в лог.
+
+    Вход:
+      - documents: List[Document] — чанки
+    Выход:
+      - documents: List[Document] — те же чанки с заполненным embedding
+    """
+    def __init__(
+        self,
+        model: str = settings.EMBEDDER_MODEL,
+        backend: str = settings.EMBEDDER_BACKEND,
+        batch_size: int = settings.EMBEDDER_BATCH_SIZE,
+        device: Optional[str] = None,
+        normalize_embeddings: bool = False,
+        meta_fields_to_embed: Optional[List[str]] = None,
+        embedding_separator: str = "\n",
+        prefix: str = "",
+        suffix: str = "",
+        workers: int = settings.EMBEDDER_WORKERS,
+    ):
+        """
+        Args:
+            model: Имя или путь модели SentenceTransformers.
+            backend: Один из BACKENDS.
+            batch_size: Размер батча.
+            device: Устройство (по умолчанию выбирает SentenceTransformers).
+            normalize_embeddings: Нормировать ли векторы.
+            meta_fields_to_embed: Поля meta, которые добавляются к тексту чанка.
+            embedding_separator: Разделитель полей meta и текста.
+            prefix: Префикс текста (для моделей, которые его ожидают).
+            suffix: Суффикс текста.
+            workers: Число процессов эмбеддинга (1 — в текущем процессе).
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f"Неизвестный бэкенд эмбеддера: {backend} (доступны: {', '.join(BACKENDS)})")
+        self.model = model
+        self.backend = backend
+        self.batch_size = max(1, batch_size)
+        self.device = device
+        self.normalize_embeddings = normalize_embeddings
+        self.meta_fields_to_embed = meta_fields_to_embed or []
+        self.embedding_separator = embedding_separator
+        self.prefix = prefix
+        self.suffix = suffix
+        self.workers = max(1, workers)
+        self._model: Optional[SentenceTransformer] = None
+        self._pool: Optional[EmbeddingWorkerPool] = None
+        self._tokenizer = None
+        self._max_seq_length: Optional[int] = None
+
+    def warm_up(self) -> None:
+        if self.workers > 1:
+            if self._pool is None:
+                from transformers import AutoTokenizer
+
+                self._pool = EmbeddingWorkerPool(self.model, self.backend, self.workers)
+                self._tokenizer = AutoTokenizer.from_pretrained(self.model)
+                self._max_seq_length = self._pool.max_seq_length
+        elif self._model is None:
+            self._model = load_embedding_model(self.model, self.backend, self.device)
+            self._tokenizer = self._model.tokenizer
+            self._max_seq_length = self._model.max_seq_length
+
+    def close(self) -> None:
+        """Останавливает процессы эмбеддинга."""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+
+    def _text(self, doc: Document) -> str:
+        values = [str(doc.meta[key]) for key in self.meta_fields_to_embed if doc.meta.get(key) is not None]
+        return self.prefix + self.embedding_separator.join(values + [doc.content or ""]) + self.suffix
+
+    def token_lengths(self, texts: List[str]) -> List[int]:
+        """Длины текстов в токенах модели (с учётом обрезки до max_seq_length)."""
+        encoded = self._tokenizer(
+            texts, truncation=True, max_length=self._max_seq_length, return_attention_mask=False,
+        )
+        return [len(ids) for ids in encoded["input_ids"]]
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        Эмбеддит тексты батчами близкой длины.
+
+        Args:
+            texts: Тексты.
+
+        Returns:
+            np.ndarray: Матрица эмбеддингов в порядке texts.
+        """
+        self.warm_up()
+        start = time.perf_counter()
+        lengths = self.token_lengths(texts)
+        batches = length_buckets(lengths, self.batch_size)
+        arrival = [
+            np.arange(start, min(start + self.batch_size, len(texts)))
+            for start in range(0, len(texts), self.batch_size)
+        ]
+        useful = sum(lengths)
+        logger.debug(
+            f"Эмбеддинг {len(texts)} чанков: пэддинг {1 - useful / padded_tokens(lengths, arrival):.0%} "
+            f"по порядку поступления, {1 - useful / padded_tokens(lengths, batches):.0%} после сортировки по длине",
+        )
+
+        if self._pool is not None:
+            results = self._pool.encode([[texts[i] for i in batch] for batch in batches], self.normalize_embeddings)
+        else:
+            results = [
+                self._model.encode(
+                    [texts[i] for i in batch],
+                    batch_size=len(batch),
+                    convert_to_numpy=True,
+                    normalize_embeddings=self.normalize_embeddings,
+                    show_progress_bar=False,
+                )
+                for batch in batches
+            ]
+        embeddings = np.empty((len(texts), results[0].shape[1]), dtype=np.float32)
+        for batch, vectors in zip(batches, results):
+            embeddings[batch] = vectors
+
+        elapsed = time.perf_counter() - start
+        logger.info(
+            f"Эмбеддинг: {len(texts)} чанков за {elapsed:.1f} сек "
+            f"({len(texts) / elapsed:.1f} чанков/с, процессов: {self.workers})",
+        )
+        return embeddings
+
+    @component.output_types(documents=List[Document])
+    def run(self, documents: List[Document]) -> Dict[str, List[Document]]:
+        if not documents:
+            return {"documents": []}
+        embeddings = self.embed([self._text(doc) for doc in documents])
+        return {"documents": [replace(doc, embedding=vector.tolist()) for doc, vector in zip(documents, embeddings)]}
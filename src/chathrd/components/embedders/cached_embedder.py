@@ -0,0 +1,91 @@
+"""Эмбеддер документов с постоянным кэшем векторов."""
+
+import logging
+from dataclasses import replace
+from typing import Any, Dict, List
+
+import numpy as np
+from haystack import Document, component
+
+from chathrd.config.settings import settings
+from chathrd.utils.embedding_cache import EmbeddingCache
+
+logger = logging.getLogger(__name__)
+
+
+@component
+class CachedDocumentEmbedder:
+    """
+    Обёртка над эмбеддером документов (BucketedDocumentEmbedder или
+    SentenceTransformersDocumentEmbedder),
+    которая эмбеддит только чанки, которых ещё нет в EmbeddingCache.
+
+    Ключ кэша — имя модели и бэкенд, параметры эмбеддинга (префикс, суффикс, нормализация,
+    поля meta) и текст чанка в том виде, в каком он уходит в модель, поэтому
+    одинаковые чанки не эмбеддятся повторно ни при переиндексации, ни в разных
+    файлах. Векторы хранятся в float16; новые векторы тоже округляются до
+    float16, чтобы индекс не зависел от того, был ли чанк в кэше. Модель
+    загружается только при первом промахе кэша.
+
+    Вход:
+      - documents: List[Document] — чанки
+    Выход:
+      - documents: List[Document] — те же чанки с заполненным embedding
+    """
+    def __init__(self, embedder: Any, cache_path: str = settings.EMBEDDING_CACHE_PATH):
+        """
+        Args:
+            embedder: Эмбеддер документов с методом run(documents=...).
+            cache_path: Путь к базе кэша эмбеддингов.
+        """
+        self.embedder = embedder
+        self.cache = EmbeddingCache(cache_path)
+        self.cache_model = "|".join(str(part) for part in (
+            getattr(embedder, "model", type(embedder).__name__),
+            getattr(embedder, "backend", "torch"),
+            getattr(embedder, "prefix", ""),
+            getattr(embedder, "suffix", ""),
+            getattr(embedder, "normalize_embeddings", False),
+            getattr(embedder, "meta_fields_to_embed", None) or [],
+            getattr(embedder, "embedding_separator", "\n"),
+        ))
+        self._warmed_up = False
+
+    def warm_up(self) -> None:
+        """Модель загружается лениво — при первом промахе кэша."""
+
+    def close(self) -> None:
+        """Останавливает процессы обёрнутого эмбеддера (если они есть)."""
+        if hasattr(self.embedder, "close"):
+            self.embedder.close()
+
+    def _text(self, doc: Document) -> str:
+        """Текст чанка с полями meta, как его видит эмбеддер."""
+        fields = getattr(self.embedder, "meta_fields_to_embed", None) or []
+        separator = getattr(self.embedder, "embedding_separator", "\n")
+        values = [str(doc.meta[key]) for key in fields if doc.meta.get(key) is not None]
+        return separator.join(values + [doc.content or ""])
+
+    @component.output_types(documents=List[Document])
+    def run(self, documents: List[Document]) -> Dict[str, List[Document]]:
+        keys = [EmbeddingCache.key(self.cache_model, self._text(doc)) for doc in documents]
+        cached = self.cache.get_many(keys)
+
+        misses = {}
+        for doc, key in zip(documents, keys):
+            if key not in cached and key not in misses:
+                misses[key] = doc
+        if misses:
+            if not self._warmed_up and hasattr(self.embedder, "warm_up"):
+                self.embedder.warm_up()
+                self._warmed_up = True
+            embedded = self.embedder.run(documents=list(misses.values()))["documents"]
+            fresh = {key: np.asarray(doc.embedding, dtype=np.float16) for key, doc in zip(misses, embedded)}
+            self.cache.put_many(fresh)
+            cached.update(fresh)
+
+        hits = len(documents) - len(misses)
+        logger.info(f"Кэш эмбеддингов: {hits} из {len(documents)} чанков найдены, эмбеддинг {len(misses)}")
+        return {"documents": [
+            replace(doc, embedding=cached[key].astype(np.float32).tolist()) for doc, key in zip(documents, keys)
+        ]}
@@ -0,0 +1,252 @@
+"""Пул процессов эмбеддинга: по модели на процесс, каждый на своём наборе ядер."""
+
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from multiprocessing.connection import wait
+from typing import Deque, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# сколько раз за один вызов encode можно перезапустить упавшие процессы
+MAX_RESTARTS = 3
+
+
+def core_groups(workers: int) -> List[List[int]]:
+    """
+    Делит доступные процессу ядра на workers непересекающихся групп.
+
+    Args:
+        workers: Число процессов.
+
+    Returns:
+        List[List[int]]: Номера ядер каждой группы (группы могут быть пустыми, если ядер меньше).
+    """
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+    return [group.tolist() for group in np.array_split(np.asarray(cores, dtype=int), workers)]
+
+
+def _worker_main(model: str, backend: str, cores: List[int], log_level: int, conn) -> None:
+    """Загружает модель на своих ядрах и эмбеддит присланные батчи."""
+    logging.basicConfig(level=log_level, format="%(asctime)s [%(levelname)s] %(message)s")
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    from chathrd.components.embedders.bucketed_embedder import load_embedding_model
+
+    try:
+        model_ = load_embedding_model(model, backend, device="cpu", threads=max(1, len(cores)))
+    except Exception as e:
+        conn.send(("error", None, f"{type(e).__name__}: {e}"))
+        return
+    conn.send(("ready", None, model_.max_seq_length))
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        key, texts, normalize = task
+        try:
+            vectors = model_.encode(
+                texts,
+                batch_size=len(texts),
+                convert_to_numpy=True,
+                normalize_embeddings=normalize,
+                show_progress_bar=False,
+            )
+            conn.send(("ok", key, vectors))
+        except Exception as e:
+            conn.send(("error", key, f"{type(e).__name__}: {e}"))
+
+
+class _Worker:
+    """Процесс эмбеддинга со своим каналом; занят не больше чем одним батчем."""
+
+    def __init__(self, ctx, model: str, backend: str, cores: List[int]):
+        self.conn, child_conn = ctx.Pipe()
+        log_level = logging.getLogger().getEffectiveLevel()
+        self.process = ctx.Process(
+            target=_worker_main, args=(model, backend, cores, log_level, child_conn), daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self.cores = cores
+        self.ready = False
+        self.task: Optional[Tuple[int, int]] = None
+
+    def submit(self, key: Tuple[int, int], texts: List[str], normalize: bool) -> None:
+        self.task = key
+        self.conn.send((key, texts, normalize))
+
+    def receive(self):
+        """Ответ процесса или None, если канал закрылся (процесс упал)."""
+        try:
+            return self.conn.recv()
+        except (EOFError, OSError):
+            self.process.join(timeout=5)
+            return None
+
+    def stop(self) -> None:
+        try:
+            if self.process.is_alive() and self.task is None:
+                self.conn.send(None)
+                self.process.join(timeout=5)
+        except (OSError, EOFError):
+            pass
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class EmbeddingWorkerPool:
+    """
+    Процессы эмбеддинга с моделью в каждом.
+
+    MiniLM-модели плохо масштабируются внутрипроцессными потоками PyTorch дальше
+    нескольких ядер, поэтому ядра делятся между workers процессами: каждый
+    привязан к своей группе ядер (sched_setaffinity) и использует столько
+    потоков, сколько ядер в группе. У каждого процесса свой канал, и батч
+    отдаётся первому свободному — так длинные батчи не задерживают остальные;
+    результаты собираются по номерам батчей. Батчи помечены номером вызова
+    encode: если вызов прервался ошибкой, ответы на его батчи, которые процессы
+    ещё считали, отбрасываются следующим вызовом.
+
+    Упавший процесс заменяется новым на тех же ядрах: умерший в простое — перед
+    следующим вызовом encode, умерший во время вызова — сразу, а его батч
+    отдаётся другому процессу. Больше MAX_RESTARTS перезапусков за вызов
+    (например, батч, на котором процесс падает каждый раз) прерывают encode
+    ошибкой.
+    """
+
+    def __init__(self, model: str, backend: str, workers: int, timeout: float = 600.0):
+        """
+        Запускает процессы и ждёт загрузки модели в каждом.
+
+        Args:
+            model: Имя или путь модели SentenceTransformers.
+            backend: Бэкенд модели (см. BACKENDS).
+            workers: Число процессов.
+            timeout: Сколько секунд ждать загрузки модели.
+        """
+        self._ctx = multiprocessing.get_context("spawn")
+        self.model = model
+        self.backend = backend
+        self.workers = workers
+        groups = core_groups(workers)
+        if not all(groups):
+            logger.warning(f"Процессов эмбеддинга ({workers}) больше, чем доступных ядер: часть работает без привязки")
+        self._run = 0
+        self._pool = [_Worker(self._ctx, model, backend, cores) for cores in groups]
+
+        self.max_seq_length: Optional[int] = None
+        try:
+            deadline = time.monotonic() + timeout
+            while not all(worker.ready for worker in self._pool):
+                starting = [worker for worker in self._pool if not worker.ready]
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError("Процессы эмбеддинга не загрузили модель вовремя")
+                wait([worker.conn for worker in starting] + [worker.process.sentinel for worker in starting], remaining)
+                for worker in starting:
+                    message = worker.receive() if worker.conn.poll() else None
+                    if message is None:
+                        if not worker.process.is_alive():
+                            raise RuntimeError(
+                                f"Процесс эмбеддинга завершился при запуске с кодом {worker.process.exitcode}",
+                            )
+                        continue
+                    status, _, payload = message
+                    if status == "error":
+                        raise RuntimeError(f"Не удалось загрузить модель эмбеддингов в процессе: {payload}")
+                    worker.ready = True
+                    self.max_seq_length = payload
+        except Exception:
+            self.close()
+            raise
+        logger.info(f"Запущено процессов эмбеддинга: {workers} (ядра: {groups})")
+
+    def _replace(self, worker: _Worker) -> None:
+        """Заменяет процесс новым на тех же ядрах."""
+        worker.task = None
+        worker.stop()
+        self._pool[self._pool.index(worker)] = _Worker(self._ctx, self.model, self.backend, worker.cores)
+
+    def encode(self, batches: List[List[str]], normalize_embeddings: bool = False) -> List[np.ndarray]:
+        """
+        Эмбеддит батчи текстов в процессах пула.
+
+        Args:
+            batches: Батчи текстов.
+            normalize_embeddings: Нормировать ли векторы.
+
+        Returns:
+            List[np.ndarray]: Эмбеддинги каждого батча в порядке batches.
+        """
+        # процессы, умершие в простое (между вызовами), просто заменяются
+        for worker in [w for w in self._pool if w.task is None and not w.process.is_alive()]:
+            logger.warning(f"Простаивающий процесс эмбеддинга завершился с кодом {worker.process.exitcode}, перезапуск")
+            self._replace(worker)
+
+        self._run += 1
+        run = self._run
+        # длинные батчи раздаются первыми, чтобы процессы заканчивали одновременно
+        pending: Deque[int] = deque(sorted(range(len(batches)), key=lambda i: -sum(map(len, batches[i]))))
+        results: List[Optional[np.ndarray]] = [None] * len(batches)
+        remaining = len(batches)
+        restarts = 0
+        while remaining:
+            for worker in self._pool:
+                if pending and worker.ready and worker.task is None:
+                    batch_id = pending.popleft()
+                    worker.submit((run, batch_id), batches[batch_id], normalize_embeddings)
+
+            # ждём ответа, готовности нового процесса или падения процесса
+            active = [worker for worker in self._pool if worker.task is not None or not worker.ready]
+            wait([worker.conn for worker in active] + [worker.process.sentinel for worker in active])
+
+            for worker in active:
+                message = worker.receive() if worker.conn.poll() else None
+                if message is not None:
+                    status, key, payload = message
+                    if status == "ready":
+                        worker.ready = True
+                        continue
+                    if key is None:
+                        # перезапущенный процесс не загрузил модель — он завершится и будет заменён
+                        logger.error(f"Не удалось загрузить модель эмбеддингов в процессе: {payload}")
+                        continue
+                    worker.task = None
+                    if key[0] != run:
+                        # ответ на батч прерванного раньше вызова
+                        continue
+                    if status == "error":
+                        raise RuntimeError(f"Ошибка эмбеддинга батча {key[1]}: {payload}")
+                    results[key[1]] = payload
+                    remaining -= 1
+                    continue
+
+                if worker.process.is_alive():
+                    continue
+                restarts += 1
+                if restarts > MAX_RESTARTS:
+                    raise RuntimeError(
+                        f"Процесс эмбеддинга завершился с кодом {worker.process.exitcode}; "
+                        f"перезапусков за вызов больше {MAX_RESTARTS}",
+                    )
+                logger.error(f"Процесс эмбеддинга завершился с кодом {worker.process.exitcode}, перезапуск")
+                if worker.task is not None and worker.task[0] == run:
+                    pending.appendleft(worker.task[1])
+                self._replace(worker)
+        return results
+
+    def close(self) -> None:
+        """Останавливает процессы."""
+        for worker in self._pool:
+            worker.stop()
+        self._pool = []
@@ -1,9 +1,9 @@
 """Обработчики для мультизапросных поисковых сессий."""
 
 import logging
-from typing import List, Dict
+from typing import List, Dict, Optional
 from haystack.dataclasses import ChatMessage
-from haystack import component
+from haystack import component, Document
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
@@ -31,8 +31,32 @@ class MultiQueryHandler:
         self.gen = generator
         self.logger = logging.getLogger(self.__class__.__name__)
 
+    def _retrieve(
+        self, name: str, retriever, queries: List[str], sources: Optional[List[str]]
+    ) -> List[List[Document]]:
+        """
+        Пакетный поиск одним ретривером с изоляцией ошибок.
+
+        Если пакет не удался, подзапросы повторяются по одному: упавший подзапрос
+        получает пустой список, остальные — свои документы. Ошибка одного
+        ретривера не влияет на результаты другого.
+        """
+        try:
+            return retriever.run_batch(queries=queries, sources=sources)["documents"]
+        except Exception as e:
+            self.logger.error("%s batch retrieval failed for %s: %s", name, queries, e, exc_info=True)
+
+        docs = []
+        for sq in queries:
+            try:
+                docs.append(retriever.run(query=sq, sources=sources)["documents"])
+            except Exception as e:
+                self.logger.error("%s retrieval failed for subquery '%s': %s", name, sq, e, exc_info=True)
+                docs.append([])
+        return docs
+
     @component.output_types(answer=str)
-    def run(self, multi: List[str], original_query: str) -> Dict[str, str]:
+    def run(self, multi: List[str], original_query: str, sources: Optional[List[str]] = None) -> Dict[str, str]:
         self.logger.debug("Starting MultiQueryHandler.run: original_query='%s', multi=%s", original_query, multi)
         parts = []
         # Ограничиваем количество подзапросов тремя
@@ -40,15 +64,15 @@ class MultiQueryHandler:
         if len(multi) > 3:
             self.logger.debug("Ограничиваем число подзапросов с %d до 3", len(multi))
 
-        for sq in limited_multi:
+        # retrieval: все подзапросы одним пакетом в каждый ретривер
+        bm25_docs = self._retrieve("BM25", self.bm25, limited_multi, sources)
+        chroma_docs = self._retrieve("Chroma", self.chroma, limited_multi, sources)
+
+        for sq, d1, d2 in zip(limited_multi, bm25_docs, chroma_docs):
             self.logger.debug("Processing subquery: '%s'", sq)
+            self.logger.debug("BM25 returned %d documents", len(d1))
+            self.logger.debug("Chroma returned %d documents", len(d2))
             try:
-                # retrieval
-                d1 = self.bm25.run(query=sq)["documents"]
-                self.logger.debug("BM25 returned %d documents", len(d1))
-                d2 = self.chroma.run(query=sq)["documents"]
-                self.logger.debug("Chroma returned %d documents", len(d2))
-
                 # join + rank (reciprocal rank fusion)
                 jdocs = self.joiner.run(documents=[d1, d2])["documents"]
                 self.logger.debug("After joiner: %d documents", len(jdocs))
@@ -0,0 +1,67 @@
+"""Контрольные точки пайплайна индексации."""
+
+import logging
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from haystack import Document, component
+
+from chathrd.utils.file_manifest import FileManifest
+from chathrd.utils.spill_store import SpillStore
+
+logger = logging.getLogger(__name__)
+
+
+@component
+class SpillCheckpoint:
+    """
+    Сохраняет документы после стадии пайплайна в SpillStore и подмешивает
+    восстановленные с прошлого запуска.
+
+    Документы раскладываются по файлам по meta["file_path"] (у канонической
+    копии дубликатов — только по её собственному файлу) и сохраняются под путём
+    файла и его SHA-256 из file_hashes. Файл без документов тоже сохраняется (пустым списком),
+    если он не попал в failed: так повторный запуск не обрабатывает его заново.
+    Документы restored — восстановленные из хранилища результаты этой стадии для
+    файлов, которые в этот раз не проходили через предыдущие компоненты, —
+    передаются дальше вместе с новыми.
+
+    Вход:
+      - documents  : List[Document]           — документы после стадии
+      - restored   : List[Document], optional — документы, восстановленные из хранилища
+      - file_hashes: Dict[str, str], optional — SHA-256 обрабатываемых файлов (ключ — путь в манифесте)
+      - failed     : List[str], optional      — файлы, которые не удалось сконвертировать
+    Выход:
+      - documents: List[Document] — новые и восстановленные документы
+    """
+    def __init__(self, store: SpillStore, stage: str, tag: str = ""):
+        """
+        Args:
+            store: Хранилище промежуточных результатов.
+            stage: Имя стадии.
+            tag: Настройки, от которых зависят документы стадии.
+        """
+        self.store = store
+        self.stage = stage
+        self.tag = tag
+
+    @component.output_types(documents=List[Document])
+    def run(
+        self,
+        documents: List[Document],
+        restored: Optional[List[Document]] = None,
+        file_hashes: Optional[Dict[str, str]] = None,
+        failed: Optional[List[str]] = None,
+    ) -> Dict[str, List[Document]]:
+        if file_hashes:
+            by_file: Dict[str, List[Document]] = defaultdict(list)
+            for doc in documents:
+                file_path = doc.meta.get("file_path")
+                if file_path:
+                    by_file[FileManifest.key(file_path)].append(doc)
+            skipped = {FileManifest.key(path) for path in failed or []}
+            saved = [path for path in file_hashes if path not in skipped]
+            for path in saved:
+                self.store.save(self.stage, path, file_hashes[path], by_file.get(path, []), self.tag)
+            logger.debug(f"Контрольная точка {self.stage}: сохранено файлов {len(saved)}")
+        return {"documents": list(documents) + list(restored or [])}
@@ -0,0 +1,207 @@
+"""Поиск почти одинаковых чанков и документов по MinHash/LSH."""
+
+import logging
+import os
+import re
+import zlib
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from haystack import Document, component
+
+from chathrd.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r"\w+")
+# коэффициенты хэш-функций фиксированы, чтобы сигнатуры не зависели от запуска
+_RNG = np.random.default_rng(20240607)
+_MAX_PERM = 256
+_A = _RNG.integers(1, 2**63, size=_MAX_PERM, dtype=np.uint64) | np.uint64(1)
+_B = _RNG.integers(0, 2**63, size=_MAX_PERM, dtype=np.uint64)
+
+
+def minhash(text: str, num_perm: int = 128, shingle: int = 3) -> Optional[np.ndarray]:
+    """
+    MinHash-сигнатура текста по словесным шинглам.
+
+    Слова приводятся к нижнему регистру, шинглы из shingle подряд идущих слов
+    хэшируются в 32 бита, а каждая из num_perm хэш-функций вида
+    (a·x + b) mod 2⁶⁴ >> 32 оставляет минимум по шинглам. Доля совпадающих
+    позиций двух сигнатур оценивает коэффициент Жаккара их множеств шинглов.
+
+    Args:
+        text: Текст.
+        num_perm: Длина сигнатуры (не больше 256).
+        shingle: Число слов в шингле.
+
+    Returns:
+        Optional[np.ndarray]: Сигнатура uint32 или None, если в тексте нет слов.
+    """
+    words = np.fromiter(
+        (zlib.crc32(word.encode("utf-8")) for word in _WORD.findall(text.lower())), dtype=np.uint64,
+    )
+    if not len(words):
+        return None
+    shingles = words
+    if len(words) >= shingle:
+        shingles = np.zeros(len(words) - shingle + 1, dtype=np.uint64)
+        for offset in range(shingle):
+            shingles = shingles * np.uint64(0x9E3779B1) + words[offset:len(words) - shingle + 1 + offset]
+        shingles &= np.uint64(0xFFFFFFFF)
+    shingles = np.unique(shingles)
+    hashed = (shingles[:, None] * _A[None, :num_perm] + _B[None, :num_perm]) >> np.uint64(32)
+    return hashed.min(axis=0).astype(np.uint32)
+
+
+class MinHashLSH:
+    """
+    LSH-индекс MinHash-сигнатур: сигнатура режется на bands полос, и кандидатами
+    считаются сигнатуры, совпавшие хотя бы в одной полосе целиком. Кандидаты
+    проверяются оценкой Жаккара, так что полосы влияют только на полноту.
+    """
+
+    def __init__(self, threshold: float, num_perm: int = 128, bands: int = 32):
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self._buckets: Dict[Tuple[int, bytes], List[int]] = defaultdict(list)
+        self._signatures: List[np.ndarray] = []
+
+    def _keys(self, signature: np.ndarray):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def query(self, signature: np.ndarray) -> Optional[int]:
+        """Номер первой добавленной сигнатуры с похожестью не ниже threshold (или None)."""
+        seen = set()
+        for key in self._keys(signature):
+            for item in self._buckets.get(key, ()):
+                if item in seen:
+                    continue
+                seen.add(item)
+                if np.mean(self._signatures[item] == signature) >= self.threshold:
+                    return item
+        return None
+
+    def add(self, signature: np.ndarray) -> int:
+        """Добавляет сигнатуру и возвращает её номер."""
+        item = len(self._signatures)
+        self._signatures.append(signature)
+        for key in self._keys(signature):
+            self._buckets[key].append(item)
+        return item
+
+
+@component
+class NearDuplicateFilter:
+    """
+    Оставляет одну каноническую копию почти одинаковых чанков.
+
+    Для каждого чанка считается MinHash-сигнатура, и через LSH ищутся чанки,
+    почти совпадающие с уже встреченными (копии файлов в разных папках, версии
+    положения с мелкими правками, шаблонные письма). Отбрасываются только такие
+    чанки: изменённые разделы новой версии документа остаются в индексе.
+    Документы (чанки с общим source_id) обходятся от самого нового файла к самому
+    старому (по mtime meta["file_path"]), поэтому канонической копией становится
+    чанк самой свежей версии. Пути файлов отброшенных копий записываются в
+    meta["duplicate_sources"] канонической (через перевод строки, так как Chroma
+    хранит только скалярные метаданные), а их число — в meta["duplicate_count"].
+    Поэтому дубликаты не эмбеддятся и не занимают место в Chroma и BM25, а
+    манифест индексации относит каноническую копию ко всем её файлам.
+
+    Копии ищутся только внутри одного вызова run, то есть одной пачки
+    индексации: сигнатуры уже проиндексированных чанков не сохраняются. Копия
+    файла, попавшая в другую пачку, другой шард или следующий запуск
+    индексации (например, новый файл, совпадающий с давно проиндексированным),
+    эмбеддится и записывается заново.
+
+    Вход:
+      - documents: List[Document] — чанки
+    Выход:
+      - documents : List[Document] — чанки без дубликатов
+      - duplicates: int            — сколько чанков отброшено
+    """
+    def __init__(
+        self,
+        threshold: float = settings.DEDUP_THRESHOLD,
+        num_perm: int = 128,
+        bands: int = 32,
+        shingle: int = 3,
+    ):
+        """
+        Args:
+            threshold: Оценка Жаккара, начиная с которой тексты считаются копиями (0 — не искать).
+            num_perm: Длина MinHash-сигнатуры.
+            bands: Число полос LSH (num_perm должно делиться на него).
+            shingle: Число слов в шингле.
+        """
+        if num_perm > _MAX_PERM or num_perm % bands:
+            raise ValueError(f"num_perm должно быть не больше {_MAX_PERM} и делиться на bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.shingle = shingle
+
+    @staticmethod
+    def _point(canonical: Document, duplicate: Document) -> None:
+        """Записывает в каноническую копию путь файла дубликата."""
+        canonical.meta["duplicate_count"] = canonical.meta.get("duplicate_count", 0) + 1
+        path = duplicate.meta.get("file_path")
+        if not path or path == canonical.meta.get("file_path"):
+            return
+        sources = canonical.meta.get("duplicate_sources", "")
+        if path not in sources.split("\n"):
+            canonical.meta["duplicate_sources"] = f"{sources}\n{path}" if sources else path
+
+    @staticmethod
+    def _mtime(doc: Document) -> float:
+        """Время изменения файла документа (0, если файла нет)."""
+        path = doc.meta.get("file_path")
+        try:
+            return os.path.getmtime(path) if path else 0.0
+        except OSError:
+            return 0.0
+
+    @component.output_types(documents=List[Document], duplicates=int)
+    def run(self, documents: List[Document]) -> Dict[str, Any]:
+        if self.threshold <= 0 or not documents:
+            return {"documents": documents, "duplicates": 0}
+
+        signatures = [minhash(doc.content or "", self.num_perm, self.shingle) for doc in documents]
+        groups: Dict[str, List[int]] = defaultdict(list)
+        for i, doc in enumerate(documents):
+            groups[doc.meta.get("source_id") or doc.meta.get("file_path") or doc.id].append(i)
+        # более новые версии документа обходятся первыми и дают канонические копии;
+        # при равном mtime сохраняется исходный порядок
+        ordered = sorted(groups.values(), key=lambda indices: -self._mtime(documents[indices[0]]))
+
+        # совпадающие чанки разных (и одного) документов
+        chunk_lsh = MinHashLSH(self.threshold, self.num_perm, self.bands)
+        canonical: List[int] = []
+        dropped = set()
+        copies = 0
+        for indices in ordered:
+            group_dropped = 0
+            for i in indices:
+                signature = signatures[i]
+                if signature is None:
+                    continue
+                match = chunk_lsh.query(signature)
+                if match is None:
+                    chunk_lsh.add(signature)
+                    canonical.append(i)
+                else:
+                    dropped.add(i)
+                    group_dropped += 1
+                    self._point(documents[canonical[match]], documents[i])
+            copies += group_dropped == len(indices)
+
+        unique = [doc for i, doc in enumerate(documents) if i not in dropped]
+        if dropped:
+            logger.info(
+                f"Дедупликация: отброшено {len(dropped)} из {len(documents)} чанков "
+                f"(документов, целиком совпавших с другими: {copies})",
+            )
+        return {"documents": unique, "duplicates": len(dropped)}
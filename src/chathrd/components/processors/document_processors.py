@@ -1,10 +1,49 @@
 """Компоненты для обработки документов."""
 
-from typing import List, Dict, Union
+import codecs
+import logging
+import re
+from typing import List, Dict, Tuple, Union
 from haystack import component, Document
 from pathlib import Path
 from haystack.dataclasses import ByteStream
 
+from chathrd.config.settings import settings
+from chathrd.utils.text_analyzer import get_analyzer
+
+logger = logging.getLogger(__name__)
+
+
+def detect_encoding(prefix: bytes, final: bool = False) -> str:
+    """
+    Определяет кодировку текста по его началу.
+
+    Args:
+        prefix: Первые байты файла.
+        final: Префикс — это весь файл (иначе обрезанный на границе символ UTF-8 не считается ошибкой).
+
+    Returns:
+        str: "utf-8" или "cp1251".
+    """
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(prefix, final=final)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "cp1251"
+
+
+def is_utf8(data: bytes, block_size: int = 1 << 20) -> bool:
+    """Проверяет, что данные — корректный UTF-8, декодируя их блоками без создания всей строки."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    view = memoryview(data)
+    try:
+        for start in range(0, len(view), block_size):
+            decoder.decode(view[start:start + block_size])
+        decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        return False
+    return True
+
 
 @component
 class OverlapToStr:
@@ -29,35 +68,272 @@ class OverlapToStr:
 @component
 class EncodingSplitter:
     """
-    Разделяет файлы на две группы по кодировке: UTF-8 и CP1251.
+    Разделяет текстовые файлы по кодировке (UTF-8 и CP1251), читая каждый файл один раз.
+
+    Кодировка определяется по первым prefix_bytes байтам. Файлы до stream_threshold
+    байт читаются целиком и передаются дальше как ByteStream с кодировкой в
+    meta["encoding"] (её использует TextFileToDocument), поэтому повторного чтения с
+    диска нет; остаток такого файла проверяется потоковым декодером, и файл, который
+    оказался не UTF-8 дальше префикса, уходит в CP1251. Файлы больше stream_threshold
+    не загружаются: их пути уходят в large для StreamingTextFileToDocument.
     """
-    @component.output_types(utf8=List[str], cp=List[str])
-    def run(self, sources: List[Union[str, Path, ByteStream]]) -> Dict[str, List[str]]:
-        utf8_files, cp_files = [], []
+    def __init__(self, prefix_bytes: int = 64 * 1024, stream_threshold: int = settings.TEXT_STREAM_MB * 2**20):
+        """
+        Args:
+            prefix_bytes: Сколько первых байт файла используется для определения кодировки.
+            stream_threshold: Размер файла в байтах, начиная с которого он читается потоково.
+        """
+        self.prefix_bytes = prefix_bytes
+        self.stream_threshold = stream_threshold
+
+    @component.output_types(utf8=List[ByteStream], cp=List[ByteStream], large=List[str])
+    def run(self, sources: List[Union[str, Path, ByteStream]]) -> Dict[str, list]:
+        utf8_files, cp_files, large_files = [], [], []
         for src in sources:
             # превращаем путь в Path
             path = Path(src) if isinstance(src, (str, Path)) else None
             if not path:
                 continue
-            try:
-                path.read_text(encoding="utf-8")
-                utf8_files.append(str(path))
-            except UnicodeDecodeError:
-                cp_files.append(str(path))
-        return {"utf8": utf8_files, "cp": cp_files}
+            size = path.stat().st_size
+            if size > self.stream_threshold:
+                large_files.append(str(path))
+                continue
+            with open(path, "rb") as f:
+                prefix = f.read(self.prefix_bytes)
+                encoding = detect_encoding(prefix, final=len(prefix) == size)
+                data = prefix + f.read()
+            if encoding == "utf-8" and len(data) > len(prefix) and not is_utf8(data):
+                encoding = "cp1251"
+            stream = ByteStream(data=data, meta={"file_path": str(path), "encoding": encoding})
+            (utf8_files if encoding == "utf-8" else cp_files).append(stream)
+        return {"utf8": utf8_files, "cp": cp_files, "large": large_files}
+
+
+@component
+class HeaderFooterCleaner:
+    """
+    Удаляет колонтитулы — повторяющиеся в начале или в конце страниц фрагменты.
+
+    Страницы разделены символом \f (так их отдают конвертеры PDF и DOCX). Для
+    каждой страницы берутся первые и последние max_words слов; слова нормализуются
+    (нижний регистр, номера страниц вида «3», «-3-», «3/40» → "#", поэтому
+    «Страница 3 из 40» совпадает на всех страницах, а «Приказ № 15» и «Приказ
+    № 16» — нет) и сворачиваются в полиномиальные rolling-хэши префиксов и
+    суффиксов. Префикс из L слов считается колонтитулом, если тот же хэш
+    встречается не менее чем на min_ratio страниц документа; с каждой страницы
+    снимается самый длинный такой префикс (и суффикс), заканчивающийся на границе
+    строки, чтобы не задеть текст страницы. Верхний и нижний колонтитулы вместе
+    занимают не больше max_share страницы, а страница, от которой ничего бы не
+    осталось, не меняется. Разные колонтитулы чётных и нечётных страниц
+    находятся независимо.
+
+    В документах без \f (текстовые файлы, HTML) страниц нет, и повторы ищутся
+    по строкам: нормализованная строка из min_words и более слов, которая
+    встречается в документе не меньше min_repeats раз, остаётся только в первом
+    вхождении; если повторы заняли бы больше max_share текста, документ не
+    меняется. Оба прохода линейны по длине текста, в отличие от перебора n-грамм
+    в DocumentCleaner(remove_repeated_substrings=True), который к тому же
+    работает только со страницами через \f.
+
+    Вход:
+      - documents: List[Document]
+    Выход:
+      - documents     : List[Document] — документы без колонтитулов и повторов
+      - stripped_bytes: int            — сколько байт (UTF-8) удалено
+    """
+    _TOKEN = re.compile(r"\S+")
+    _DIGITS = re.compile(r"\d+")
+    # номер страницы: "3", "-3-", "3/40", "(3)"; после нормализации — "#", "-#-", "#/#", "(#)"
+    _PAGE_NUMBER = re.compile(r"^[-–(\[]?\d{1,4}(/\d{1,4})?[-–)\]]?$")
+    _PAGE_NUMBER_MASK = re.compile(r"^[-–(\[]?#(/#)?[-–)\]]?$")
+    _LINE_END = re.compile(r"[ \t\r]*(\n|$)")
+    _MOD = (1 << 61) - 1
+    _BASE = 1_000_003
+
+    def __init__(
+        self,
+        min_pages: int = 3,
+        min_ratio: float = 0.5,
+        max_words: int = 40,
+        min_words: int = 2,
+        max_share: float = 0.4,
+        min_repeats: int = 3,
+    ):
+        """
+        Args:
+            min_pages: Сколько страниц должно быть в документе, чтобы искать колонтитулы.
+            min_ratio: Доля страниц, на которых должен повторяться фрагмент.
+            max_words: Сколько слов с начала и с конца страницы проверять.
+            min_words: Минимальная длина колонтитула или повторяющейся строки в словах
+                (номера страниц — исключение).
+            max_share: Какую долю страницы (или документа без страниц) можно удалить.
+            min_repeats: Сколько раз строка должна встретиться в документе без страниц,
+                чтобы её повторы удалялись.
+        """
+        self.min_pages = min_pages
+        self.min_ratio = min_ratio
+        self.max_words = max_words
+        self.min_words = min_words
+        self.max_share = max_share
+        self.min_repeats = min_repeats
+
+    def _normalize(self, word: str) -> str:
+        word = word.lower()
+        return self._DIGITS.sub("#", word) if self._PAGE_NUMBER.match(word) else word
+
+    def _edge_tokens(self, page: str, tail: bool) -> List[Tuple[int, int, str]]:
+        """Первые (или последние) max_words слов страницы: (начало, конец, нормализованное слово)."""
+        if not tail:
+            tokens = []
+            for match in self._TOKEN.finditer(page):
+                tokens.append((match.start(), match.end(), self._normalize(match.group())))
+                if len(tokens) == self.max_words:
+                    break
+            return tokens
+        # с конца — по окну, которого заведомо хватает на max_words слов
+        window = 16 * self.max_words
+        while True:
+            offset = max(0, len(page) - window)
+            matches = list(self._TOKEN.finditer(page, offset))
+            if offset == 0 or len(matches) > self.max_words:
+                # первое слово окна могло быть обрезано — его не берём
+                matches = matches[::-1][:self.max_words if offset == 0 else min(self.max_words, len(matches) - 1)]
+                return [(m.start(), m.end(), self._normalize(m.group())) for m in matches]
+            window *= 2
+
+    def _rolling(self, tokens: List[Tuple[int, int, str]]) -> List[int]:
+        """Хэши префиксов последовательности слов: h[L] — хэш первых L + 1 слов."""
+        hashes, h = [], 0
+        for _, _, word in tokens:
+            h = (h * self._BASE + (hash(word) & self._MOD)) % self._MOD
+            hashes.append(h)
+        return hashes
+
+    def _is_page_number(self, tokens: List[Tuple[int, int, str]], length: int) -> bool:
+        return all(self._PAGE_NUMBER_MASK.match(word) for _, _, word in tokens[:length])
+
+    def _at_line_break(self, page: str, tokens: List[Tuple[int, int, str]], length: int, tail: bool) -> bool:
+        """Заканчивается ли край из length слов на границе строки (колонтитул — отдельные строки)."""
+        if not tail:
+            return self._LINE_END.match(page, tokens[length - 1][1]) is not None
+        start = tokens[length - 1][0]
+        return not page[page.rfind("\n", 0, start) + 1:start].strip()
+
+    def _common_lengths(
+        self, pages: List[str], edges: List[List[Tuple[int, int, str]]], budgets: List[float], tail: bool,
+    ) -> List[int]:
+        """
+        Для каждой страницы — длина самого длинного повторяющегося края (0, если его нет
+        или он занимает больше budgets символов страницы — тогда это уже не колонтитул).
+        """
+        hashes = [self._rolling(tokens) for tokens in edges]
+        counts: Dict[Tuple[int, int], int] = {}
+        for page_hashes in hashes:
+            for length, h in enumerate(page_hashes, 1):
+                counts[(length, h)] = counts.get((length, h), 0) + 1
+        threshold = max(2, int(self.min_ratio * len(hashes) + 0.999))
+        result = []
+        for page, tokens, page_hashes, budget in zip(pages, edges, hashes, budgets):
+            best = 0
+            for length in range(len(page_hashes), 0, -1):
+                if counts[(length, page_hashes[length - 1])] >= threshold and (
+                    length >= self.min_words or self._is_page_number(tokens, length)
+                ) and self._at_line_break(page, tokens, length, tail):
+                    best = length
+                    break
+            span = (len(page) - tokens[best - 1][0] if tail else tokens[best - 1][1]) if best else 0
+            result.append(best if span <= budget else 0)
+        return result
+
+    def clean(self, text: str) -> str:
+        """
+        Удаляет колонтитулы из текста со страницами через \f, а из текста без
+        страниц — повторяющиеся строки.
+
+        Args:
+            text: Текст документа.
+
+        Returns:
+            str: Текст без колонтитулов.
+        """
+        if "\f" not in text:
+            return self._remove_repeated_lines(text)
+        pages = text.split("\f")
+        if len(pages) < self.min_pages:
+            return text
+
+        heads = [self._edge_tokens(page, tail=False) for page in pages]
+        head_len = self._common_lengths(pages, heads, [self.max_share * len(page) for page in pages], tail=False)
+        starts = [tokens[n - 1][1] if n else 0 for tokens, n in zip(heads, head_len)]
+
+        # нижнему колонтитулу остаётся то, что не занял верхний
+        tails = [self._edge_tokens(page, tail=True) for page in pages]
+        budgets = [self.max_share * len(page) - start for page, start in zip(pages, starts)]
+        tail_len = self._common_lengths(pages, tails, budgets, tail=True)
+        ends = [tokens[n - 1][0] if n else len(page) for page, tokens, n in zip(pages, tails, tail_len)]
+
+        cleaned = []
+        for page, start, end in zip(pages, starts, ends):
+            body = page[start:end].strip() if start < end else ""
+            # страница целиком из повторяющихся строк (например, пустой бланк) остаётся как есть
+            cleaned.append(body if body and (start or end < len(page)) else page)
+        return "\f".join(cleaned)
+
+    def _remove_repeated_lines(self, text: str) -> str:
+        """Оставляет только первое вхождение строк, которые повторяются не меньше min_repeats раз."""
+        lines = text.split("\n")
+        keys = []
+        counts: Dict[str, int] = {}
+        for line in lines:
+            words = [self._normalize(word) for word in line.split()]
+            key = " ".join(words) if len(words) >= self.min_words else ""
+            keys.append(key)
+            if key:
+                counts[key] = counts.get(key, 0) + 1
+
+        seen = set()
+        kept = []
+        removed = 0
+        for line, key in zip(lines, keys):
+            if key and counts[key] >= self.min_repeats:
+                if key in seen:
+                    removed += len(line) + 1
+                    continue
+                seen.add(key)
+            kept.append(line)
+        if not removed or removed > self.max_share * len(text):
+            return text
+        return "\n".join(kept)
+
+    @component.output_types(documents=List[Document], stripped_bytes=int)
+    def run(self, documents: List[Document]) -> Dict[str, object]:
+        cleaned_docs: List[Document] = []
+        stripped = 0
+        for doc in documents:
+            if not doc.content:
+                cleaned_docs.append(doc)
+                continue
+            text = self.clean(doc.content)
+            if text == doc.content:
+                cleaned_docs.append(doc)
+                continue
+            removed = len(doc.content.encode("utf-8")) - len(text.encode("utf-8"))
+            logger.debug(f"{doc.meta.get('name', doc.id)}: удалено {removed} байт колонтитулов и повторов")
+            stripped += removed
+            cleaned_docs.append(Document(content=text, meta=dict(doc.meta)))
+        if stripped:
+            logger.info(f"Колонтитулы и повторы: удалено {stripped} байт из {len(documents)} документов")
+        return {"documents": cleaned_docs, "stripped_bytes": stripped}
 
 
 @component
 class QueryCleaner:
     """
     Приводит строку к нижнему регистру, токенизирует и оставляет только слово-числовые токены.
+
+    Использует токенизатор общего анализатора (без стемминга: очищенный запрос
+    уходит и в BM25, и в dense-поиск).
     """
     @component.output_types(query=str)
     def run(self, query: str) -> Dict[str, str]:
-        import re
-        from nltk.tokenize import word_tokenize
-        
-        q = query.lower()
-        tokens = word_tokenize(q)
-        filt = [t for t in tokens if re.fullmatch(r"\w+", t)]
-        return {"query": " ".join(filt)} 
\ No newline at end of file
+        return {"query": " ".join(get_analyzer().tokenize(query))} 
\ No newline at end of file
@@ -0,0 +1,529 @@
+"""Инвертированный индекс BM25 в версионированном бинарном формате с чтением через mmap.
+
+Формат файла сегмента (все числа little-endian, описание — docs/bm25_index_format.md):
+
+    заголовок (HEADER_SIZE байт):
+      magic         8s   b"CHRDBM25"
+      version       u16  FORMAT_VERSION
+      tf_bits       u16  ширина частот в postings_tf: 8 или 16
+      reserved      u32
+      num_docs      u64
+      num_terms     u64
+      num_postings  u64
+      checksum      u32  CRC32 всех секций (всё после заголовка)
+      reserved      u32
+      sections      9 × (offset u64, length u64)
+
+    секции (каждая выровнена на 8 байт), в порядке SECTIONS:
+      term_offsets  u64[V+1]  границы терминов в term_blob
+      term_blob     u8[]      UTF-8 термины, отсортированные по возрастанию
+      indptr        u64[V+1]  границы списков словопозиций (CSR)
+      postings_doc  u32[P]    номера документов
+      postings_tf   u8|u16[P] частоты терминов (насыщаются на максимуме типа)
+      doc_lens      u32[N]    длины документов в токенах
+      id_offsets    u64[N+1]  границы id в id_blob
+      id_blob       u8[]      UTF-8 id документов (Document.id)
+      id_order      u32[N]    номера документов в порядке возрастания id
+"""
+
+import logging
+import math
+import mmap
+import multiprocessing
+import os
+import pickle
+import struct
+import zlib
+from collections import Counter
+from collections.abc import Iterator, Mapping, Sequence
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from chathrd.utils.text_analyzer import get_analyzer
+
+logger = logging.getLogger(__name__)
+
+# Параметры BM25L — те же, что у rank_bm25.BM25L по умолчанию
+K1 = 1.5
+B = 0.75
+DELTA = 0.5
+
+MAGIC = b"CHRDBM25"
+FORMAT_VERSION = 2
+SECTIONS = (
+    "term_offsets", "term_blob", "indptr", "postings_doc",
+    "postings_tf", "doc_lens", "id_offsets", "id_blob", "id_order",
+)
+_HEADER = struct.Struct("<8sHHIQQQII")
+_SECTION = struct.Struct("<QQ")
+HEADER_SIZE = _HEADER.size + _SECTION.size * len(SECTIONS)
+
+
+class BM25FormatError(ValueError):
+    """Файл индекса повреждён или записан в неподдерживаемой версии формата."""
+
+
+class StringTable:
+    """
+    Таблица строк: UTF-8 байты подряд и массив границ.
+
+    Работает поверх mmap без копирования; строки декодируются только при обращении.
+    Для отсортированных таблиц (словарь терминов) find ищет двоичным поиском,
+    так что словарь не нужно разворачивать в dict при загрузке. Неотсортированные
+    таблицы (id документов) хранят перестановку order, упорядочивающую строки,
+    и ищут двоичным поиском по ней (find_all).
+    """
+
+    def __init__(
+        self,
+        offsets: np.ndarray,
+        blob: Union[np.ndarray, bytes],
+        order: Optional[np.ndarray] = None,
+    ):
+        self.offsets = offsets
+        self.blob = memoryview(blob).cast("B") if not isinstance(blob, bytes) else memoryview(blob)
+        self.order = order
+
+    @classmethod
+    def from_list(cls, strings: Sequence[str], with_order: bool = False) -> "StringTable":
+        encoded = [s.encode("utf-8") for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+        order = None
+        if with_order:
+            order = np.array(
+                sorted(range(len(encoded)), key=encoded.__getitem__), dtype=np.uint32,
+            )
+        return cls(offsets, b"".join(encoded), order)
+
+    def sort_order(self) -> np.ndarray:
+        """Перестановка, упорядочивающая строки таблицы (устойчивая)."""
+        return np.array(sorted(range(len(self)), key=self._raw), dtype=np.uint32)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def _raw(self, i: int) -> bytes:
+        return bytes(self.blob[int(self.offsets[i]):int(self.offsets[i + 1])])
+
+    def __getitem__(self, i: int) -> str:
+        return self._raw(i).decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def _bisect(self, key: bytes, order: Optional[np.ndarray], right: bool = False) -> int:
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            raw = self._raw(mid if order is None else int(order[mid]))
+            if raw < key or (right and raw == key):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def find(self, s: str) -> Optional[int]:
+        """Номер строки в отсортированной таблице или None (порядок байт UTF-8 = порядок str)."""
+        key = s.encode("utf-8")
+        lo = self._bisect(key, None)
+        return lo if lo < len(self) and self._raw(lo) == key else None
+
+    def find_all(self, s: str) -> np.ndarray:
+        """
+        Номера всех вхождений строки в таблицу с перестановкой order.
+
+        Двоичный поиск по order: O(log N) сравнений, остальные строки не декодируются.
+        """
+        if self.order is None:
+            raise ValueError("find_all требует таблицу с перестановкой order")
+        key = s.encode("utf-8")
+        lo = self._bisect(key, self.order)
+        hi = self._bisect(key, self.order, right=True)
+        return np.sort(self.order[lo:hi])
+
+
+class BM25Index:
+    """
+    Сегмент BM25L-индекса в виде плоских массивов (CSR):
+      - terms        : StringTable  — отсортированный словарь, номер термина = строка postings
+      - indptr       : u64[V+1]     — границы списков словопозиций терминов
+      - postings_doc : u32[P]       — номера документов в списках словопозиций
+      - postings_tf  : u8|u16[P]    — частоты терминов в документах
+      - doc_lens     : u32[N]       — длины документов в токенах
+      - doc_ids      : StringTable  — внешние id документов (Document.id) с перестановкой
+                                      order для поиска документа по id
+
+    На диске сегмент — один файл (формат описан в docstring модуля). При загрузке
+    массивы — представления поверх mmap только для чтения, без копирования, поэтому
+    открытие не зависит от размера корпуса, а экземпляр разделяется между потоками.
+    Поиск по индексу и глобальная статистика BM25 — в SegmentedBM25Index.
+    """
+
+    def __init__(
+        self,
+        terms: StringTable,
+        indptr: np.ndarray,
+        postings_doc: np.ndarray,
+        postings_tf: np.ndarray,
+        doc_lens: np.ndarray,
+        doc_ids: StringTable,
+    ):
+        self.terms = terms
+        self.indptr = indptr
+        self.postings_doc = postings_doc
+        self.postings_tf = postings_tf
+        self.doc_lens = doc_lens
+        if doc_ids.order is None:
+            doc_ids.order = doc_ids.sort_order()
+        self.doc_ids = doc_ids
+        self.num_docs = len(doc_ids)
+
+    @classmethod
+    def from_counts(
+        cls,
+        counts: Sequence[Mapping[str, int]],
+        doc_lens: Sequence[int],
+        doc_ids: Sequence[str],
+    ) -> "BM25Index":
+        """
+        Строит индекс по частотам терминов в документах.
+
+        Args:
+            counts: Для каждого документа — словарь термин → частота.
+            doc_lens: Длины документов в токенах.
+            doc_ids: Id документов в том же порядке.
+
+        Returns:
+            BM25Index: Индекс в памяти.
+        """
+        postings: Dict[str, List[int]] = {}
+        freqs: Dict[str, List[int]] = {}
+        for doc_no, doc_counts in enumerate(counts):
+            for term, tf in doc_counts.items():
+                postings.setdefault(term, []).append(doc_no)
+                freqs.setdefault(term, []).append(tf)
+
+        terms = sorted(postings)
+        indptr = np.zeros(len(terms) + 1, dtype=np.uint64)
+        np.cumsum([len(postings[t]) for t in terms], out=indptr[1:])
+        total = int(indptr[-1])
+        postings_doc = np.fromiter(
+            (d for term in terms for d in postings[term]), dtype=np.uint32, count=total,
+        )
+        postings_tf = np.fromiter(
+            (f for term in terms for f in freqs[term]), dtype=np.int64, count=total,
+        )
+        return cls(
+            StringTable.from_list(terms),
+            indptr,
+            postings_doc,
+            postings_tf,
+            np.asarray(doc_lens, dtype=np.uint32),
+            StringTable.from_list(doc_ids, with_order=True),
+        )
+
+    @classmethod
+    def build(cls, corpus: Sequence[Sequence[str]], doc_ids: Sequence[str]) -> "BM25Index":
+        """
+        Строит индекс по токенизированному корпусу.
+
+        Args:
+            corpus: Списки токенов для каждого документа.
+            doc_ids: Id документов в том же порядке.
+
+        Returns:
+            BM25Index: Индекс в памяти.
+        """
+        return cls.from_counts(
+            [Counter(tokens) for tokens in corpus], [len(tokens) for tokens in corpus], doc_ids,
+        )
+
+    def save(self, path: Union[str, Path]) -> None:
+        """
+        Записывает сегмент в файл.
+
+        Файл пишется во временный и подменяется через os.replace, поэтому процессы,
+        уже отобразившие старую версию в память, продолжают работать с ней, а не
+        падают на усечённом файле.
+
+        Args:
+            path: Путь к файлу сегмента.
+        """
+        tf = np.asarray(self.postings_tf)
+        tf_bits = 8 if not len(tf) or int(tf.max()) <= 0xFF else 16
+        tf_dtype = np.uint8 if tf_bits == 8 else np.uint16
+        sections = {
+            "term_offsets": np.asarray(self.terms.offsets, dtype="<u8").tobytes(),
+            "term_blob": bytes(self.terms.blob),
+            "indptr": np.asarray(self.indptr, dtype="<u8").tobytes(),
+            "postings_doc": np.asarray(self.postings_doc, dtype="<u4").tobytes(),
+            "postings_tf": np.minimum(tf, np.iinfo(tf_dtype).max).astype(tf_dtype).tobytes(),
+            "doc_lens": np.asarray(self.doc_lens, dtype="<u4").tobytes(),
+            "id_offsets": np.asarray(self.doc_ids.offsets, dtype="<u8").tobytes(),
+            "id_blob": bytes(self.doc_ids.blob),
+            "id_order": np.asarray(self.doc_ids.order, dtype="<u4").tobytes(),
+        }
+
+        table, payload, checksum = [], bytearray(), 0
+        for name in SECTIONS:
+            data = sections[name]
+            table.append((HEADER_SIZE + len(payload), len(data)))
+            padded = data + b"\0" * (-len(data) % 8)
+            payload += padded
+            checksum = zlib.crc32(padded, checksum)
+        header = _HEADER.pack(
+            MAGIC, FORMAT_VERSION, tf_bits, 0,
+            self.num_docs, len(self.terms), len(self.postings_doc), checksum, 0,
+        ) + b"".join(_SECTION.pack(offset, length) for offset, length in table)
+
+        out_path = Path(path)
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = out_path.with_name(out_path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            f.write(header)
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, out_path)
+
+    @classmethod
+    def load(cls, path: Union[str, Path], verify: bool = True) -> "BM25Index":
+        """
+        Открывает сегмент через mmap; массивы — представления без копирования.
+
+        Args:
+            path: Путь к файлу сегмента.
+            verify: Сверять CRC32 секций (один последовательный проход по файлу).
+
+        Returns:
+            BM25Index: Индекс, разделяемый между потоками.
+
+        Raises:
+            BM25FormatError: Если файл не является сегментом, повреждён или другой версии.
+        """
+        with open(path, "rb") as f:
+            # mmap не открывает пустой файл, поэтому длину проверяем до него
+            if os.fstat(f.fileno()).st_size < _HEADER.size:
+                raise BM25FormatError(f"{path}: файл короче заголовка")
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, tf_bits, _, num_docs, num_terms, num_postings, checksum, _ = (
+            _HEADER.unpack_from(buf, 0)
+        )
+        if magic != MAGIC:
+            raise BM25FormatError(f"{path}: это не BM25-сегмент")
+        if version != FORMAT_VERSION:
+            raise BM25FormatError(
+                f"{path}: версия формата {version}, поддерживается {FORMAT_VERSION}",
+            )
+        if len(buf) < HEADER_SIZE:
+            raise BM25FormatError(f"{path}: файл короче заголовка")
+        if verify and zlib.crc32(memoryview(buf)[HEADER_SIZE:]) != checksum:
+            raise BM25FormatError(f"{path}: не совпадает контрольная сумма")
+
+        dtypes = {
+            "term_offsets": "<u8", "term_blob": "u1", "indptr": "<u8", "postings_doc": "<u4",
+            "postings_tf": "u1" if tf_bits == 8 else "<u2", "doc_lens": "<u4",
+            "id_offsets": "<u8", "id_blob": "u1", "id_order": "<u4",
+        }
+        arrays = {}
+        for i, name in enumerate(SECTIONS):
+            offset, length = _SECTION.unpack_from(buf, _HEADER.size + i * _SECTION.size)
+            if offset + length > len(buf):
+                raise BM25FormatError(f"{path}: секция {name} выходит за конец файла")
+            dtype = np.dtype(dtypes[name])
+            arrays[name] = np.frombuffer(buf, dtype=dtype, count=length // dtype.itemsize, offset=offset)
+
+        if (
+            len(arrays["term_offsets"]) != num_terms + 1
+            or len(arrays["postings_doc"]) != num_postings
+            or len(arrays["doc_lens"]) != num_docs
+            or len(arrays["id_order"]) != num_docs
+        ):
+            raise BM25FormatError(f"{path}: размеры секций не совпадают с заголовком")
+
+        index = cls(
+            StringTable(arrays["term_offsets"], arrays["term_blob"]),
+            arrays["indptr"],
+            arrays["postings_doc"],
+            arrays["postings_tf"],
+            arrays["doc_lens"],
+            StringTable(arrays["id_offsets"], arrays["id_blob"], arrays["id_order"]),
+        )
+        logger.debug(
+            f"Загружен BM25-сегмент {path}: {num_docs} документов, "
+            f"{num_terms} терминов, {num_postings} словопозиций",
+        )
+        return index
+
+    @classmethod
+    def from_pickle(cls, path: Union[str, Path]) -> "BM25Index":
+        """
+        Читает прежний индекс bm25.pkl — кортеж (rank_bm25.BM25L, doc_ids).
+
+        Частоты терминов берутся из BM25L.doc_freqs, поэтому повторная токенизация
+        не нужна. Распаковка pickle выполняет код из файла — вызывать только для
+        собственных индексов.
+
+        Args:
+            path: Путь к bm25.pkl.
+
+        Returns:
+            BM25Index: Индекс в памяти.
+        """
+        with open(path, "rb") as f:
+            bm25, doc_ids = pickle.load(f)
+        return cls.from_counts(bm25.doc_freqs, bm25.doc_len, doc_ids)
+
+    def find_doc(self, doc_id: str) -> np.ndarray:
+        """
+        Номера документов сегмента с данным id (двоичный поиск по id_order).
+
+        Args:
+            doc_id: Id документа.
+
+        Returns:
+            np.ndarray: Номера документов по возрастанию (обычно ноль или один).
+        """
+        return self.doc_ids.find_all(doc_id)
+
+    def gather(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Возвращает список словопозиций термина без копирования.
+
+        Args:
+            term: Термин.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Номера документов и частоты термина в них.
+        """
+        term_id = self.terms.find(term)
+        if term_id is None:
+            return np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.uint8)
+        start, end = int(self.indptr[term_id]), int(self.indptr[term_id + 1])
+        return self.postings_doc[start:end], self.postings_tf[start:end]
+
+    @classmethod
+    def merge(cls, parts: Sequence[Tuple["BM25Index", Optional[np.ndarray]]]) -> "BM25Index":
+        """
+        Сливает несколько индексов в один, отбрасывая удалённые документы.
+
+        Документы нумеруются подряд в порядке частей, поэтому результат совпадает
+        с BM25Index.build по живым документам всех частей. Слияние идёт на уровне
+        словопозиций, без повторной токенизации.
+
+        Args:
+            parts: Пары (индекс, маска живых документов или None, если удалённых нет).
+
+        Returns:
+            BM25Index: Слитый индекс в памяти.
+        """
+        part_terms = [list(index.terms) for index, _ in parts]
+        terms = sorted(set().union(*part_terms))
+        term_pos = {t: i for i, t in enumerate(terms)}
+
+        term_chunks, doc_chunks, tf_chunks, len_chunks = [], [], [], []
+        doc_ids: List[str] = []
+        offset = 0
+        for (index, live), seg_term_list in zip(parts, part_terms):
+            if live is None:
+                live = np.ones(index.num_docs, dtype=bool)
+            new_no = np.cumsum(live) - 1 + offset
+            seg_terms = np.fromiter(
+                (term_pos[t] for t in seg_term_list), dtype=np.int64, count=len(seg_term_list),
+            )
+            posting_terms = np.repeat(seg_terms, np.diff(index.indptr.astype(np.int64)))
+            keep = live[index.postings_doc]
+            term_chunks.append(posting_terms[keep])
+            doc_chunks.append(new_no[index.postings_doc[keep]])
+            tf_chunks.append(np.asarray(index.postings_tf, dtype=np.int64)[keep])
+            len_chunks.append(np.asarray(index.doc_lens)[live])
+            doc_ids.extend(doc_id for doc_id, alive in zip(index.doc_ids, live) if alive)
+            offset += int(live.sum())
+
+        posting_terms = np.concatenate(term_chunks) if term_chunks else np.empty(0, dtype=np.int64)
+        postings_doc = np.concatenate(doc_chunks) if doc_chunks else np.empty(0, dtype=np.int64)
+        postings_tf = np.concatenate(tf_chunks) if tf_chunks else np.empty(0, dtype=np.int64)
+        # части идут по возрастанию номеров документов, а внутри термина номера уже
+        # упорядочены, поэтому достаточно устойчивой сортировки по термину
+        order = np.argsort(posting_terms, kind="stable")
+        posting_terms, postings_doc, postings_tf = (
+            posting_terms[order], postings_doc[order], postings_tf[order],
+        )
+
+        # термины, встречавшиеся только в удалённых документах, выпадают из словаря
+        counts = np.bincount(posting_terms, minlength=len(terms))
+        present = np.flatnonzero(counts)
+        indptr = np.zeros(len(present) + 1, dtype=np.uint64)
+        np.cumsum(counts[present], out=indptr[1:])
+        doc_lens = np.concatenate(len_chunks) if len_chunks else np.empty(0, dtype=np.uint32)
+        return cls(
+            StringTable.from_list([terms[i] for i in present]),
+            indptr,
+            postings_doc.astype(np.uint32),
+            postings_tf,
+            doc_lens.astype(np.uint32),
+            StringTable.from_list(doc_ids, with_order=True),
+        )
+
+
+def _build_shard(
+    texts: Sequence[str], analyzer_name: str,
+) -> Tuple[List[str], np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Разбирает и индексирует один шард в процессе-обработчике; возвращает сырые массивы."""
+    analyzer = get_analyzer(analyzer_name)
+    shard = BM25Index.build(analyzer.analyze_many(texts), [""] * len(texts))
+    return list(shard.terms), shard.indptr, shard.postings_doc, shard.postings_tf, shard.doc_lens
+
+
+def build_index(
+    texts: Sequence[str],
+    doc_ids: Sequence[str],
+    analyzer_name: str,
+    workers: int = 1,
+    min_shard_docs: int = 500,
+) -> BM25Index:
+    """
+    Разбирает тексты анализатором и строит индекс, при workers > 1 — шардами в пуле процессов.
+
+    Документы режутся на последовательные шарды, каждый шард токенизируется и
+    индексируется в отдельном процессе, затем шарды сливаются BM25Index.merge в
+    исходном порядке. Словарь сортируется, а документы нумеруются подряд, поэтому
+    результат побайтно совпадает с последовательной сборкой.
+
+    Args:
+        texts: Тексты документов.
+        doc_ids: Id документов в том же порядке.
+        analyzer_name: Имя анализатора текста.
+        workers: Число процессов (1 — собирать в текущем процессе).
+        min_shard_docs: Минимальный размер шарда; мелкие корпуса собираются без пула.
+
+    Returns:
+        BM25Index: Индекс в памяти.
+    """
+    num_shards = min(workers * 4, math.ceil(len(texts) / min_shard_docs))
+    if workers <= 1 or num_shards <= 1:
+        analyzer = get_analyzer(analyzer_name)
+        return BM25Index.build(analyzer.analyze_many(texts), doc_ids)
+
+    shard_size = math.ceil(len(texts) / num_shards)
+    bounds = [(i, min(i + shard_size, len(texts))) for i in range(0, len(texts), shard_size)]
+    # spawn: к этому моменту в процессе могут работать потоки torch, fork с ними небезопасен
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=min(workers, len(bounds)), mp_context=context) as pool:
+        futures = [pool.submit(_build_shard, texts[lo:hi], analyzer_name) for lo, hi in bounds]
+        shards = [future.result() for future in futures]
+
+    parts = []
+    for (lo, hi), (terms, indptr, postings_doc, postings_tf, doc_lens) in zip(bounds, shards):
+        shard = BM25Index(
+            StringTable.from_list(terms), indptr, postings_doc, postings_tf, doc_lens,
+            StringTable.from_list(doc_ids[lo:hi]),
+        )
+        parts.append((shard, None))
+    logger.debug(f"BM25: {len(texts)} документов собраны в {len(bounds)} шардах, процессов: {workers}")
+    return BM25Index.merge(parts)
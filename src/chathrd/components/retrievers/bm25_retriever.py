@@ -1,74 +1,244 @@
 """Компоненты для поиска документов с использованием BM25."""
 
-import pickle
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import replace
 from pathlib import Path
-from typing import List, Dict, Optional
-from nltk.tokenize import word_tokenize
+from typing import Dict, List, Optional, Tuple
 
-from haystack import component, Document
+import numpy as np
+from haystack import Document, component
 from haystack_integrations.document_stores.chroma import ChromaDocumentStore
 
+from chathrd.components.retrievers.bm25_index import build_index
+from chathrd.components.retrievers.bm25_segments import (
+    MANIFEST_FILE,
+    SegmentedBM25Index,
+    convert_pickle_index,
+)
+from chathrd.config.settings import settings
+from chathrd.utils.chroma_store import ChromaStoreReader
+from chathrd.utils.text_analyzer import DEFAULT_ANALYZER
+
+logger = logging.getLogger(__name__)
+
 
 @component
 class BM25Builder:
     """
-    Строит BM25‑индекс из списка документов и сохраняет его в файл.
+    Добавляет документы в сегментированный BM25‑индекс на диске.
+
+    Документы запуска разбираются анализатором текста индекса (для нового индекса —
+    analyzer, см. TextAnalyzer) шардами в пуле из workers процессов и записываются новым сегментом, их старые
+    копии (те же id) помечаются удалёнными; остальной корпус не перестраивается.
+    Когда сегментов становится слишком много, они сливаются в фоне.
     
     Вход:
       - documents: List[Document]  — документы с .content и .id
-      - path     : str             — путь для сохранения (pickle)
+      - path     : str             — директория индекса (см. SegmentedBM25Index)
     Выход:
       - documents: List[Document]  — тот же список документов
     """
-    @component.output_types(documents=List[Document])
-    def run(self, documents: List[Document], path: str = "../data/bm25.pkl") -> Dict[str, List[Document]]:
-        # создаём папку, если её нет
+    def __init__(
+        self,
+        max_segments: int = settings.BM25_MAX_SEGMENTS,
+        analyzer: str = DEFAULT_ANALYZER,
+        workers: int = settings.BM25_BUILD_WORKERS,
+    ):
+        self.max_segments = max_segments
+        self.analyzer = analyzer
+        self.workers = workers
+        self._indexes: Dict[str, SegmentedBM25Index] = {}
+
+    def open_index(self, path: str) -> SegmentedBM25Index:
+        """
+        Возвращает индекс в директории path, открытый этим построителем.
+
+        Экземпляр один на директорию на всё время жизни построителя: при индексации
+        пачками фоновое слияние сегментов, начатое после одной пачки, идёт под той
+        же блокировкой, что и запись следующей.
+
+        Args:
+            path: Директория индекса.
+
+        Returns:
+            SegmentedBM25Index: Индекс.
+        """
         output_path = Path(path)
-        output_path.parent.mkdir(parents=True, exist_ok=True)
+        key = str(output_path.resolve())
+        if key not in self._indexes:
+            # создаём папку, если её нет
+            output_path.mkdir(parents=True, exist_ok=True)
+            index = SegmentedBM25Index(output_path, max_segments=self.max_segments, analyzer=self.analyzer)
+            if index.analyzer_name != self.analyzer:
+                # например, индекс перенесён из bm25.pkl: новые документы разбираются тем же
+                # анализатором, что и корпус, иначе их термины не совпадут с терминами запроса
+                logger.warning(
+                    f"BM25-индекс {output_path} построен анализатором {index.analyzer_name}, "
+                    f"новые документы разбираются им же; чтобы перейти на {self.analyzer}, "
+                    f"пересоберите индекс в пустую директорию",
+                )
+            self._indexes[key] = index
+        return self._indexes[key]
 
-        # подготавливаем корпус: токенизируем каждое содержание
-        corpus = [
-            word_tokenize(doc.content.lower() if doc.content else "")
-            for doc in documents
-        ]
-        doc_ids = [doc.id for doc in documents]
+    @component.output_types(documents=List[Document])
+    def run(self, documents: List[Document], path: str = "../data/bm25_index") -> Dict[str, List[Document]]:
+        index = self.open_index(path)
 
-        # строим индекс BM25L (можно BM25Okapi или BM25Plus)
-        from rank_bm25 import BM25L
-        bm25 = BM25L(corpus)
+        # разбираем тексты на термины и строим сегмент (параллельно по шардам)
+        segment = build_index(
+            [doc.content or "" for doc in documents],
+            [doc.id for doc in documents],
+            analyzer_name=index.analyzer_name,
+            workers=self.workers,
+        )
 
-        # сохраняем в pickle: кортеж (bm25, doc_ids)
-        with open(output_path, "wb") as f:
-            pickle.dump((bm25, doc_ids), f)
+        # дописываем новый сегмент; слияние, если нужно, запускается в фоне
+        index.add_segment(segment)
 
         # возвращаем документы дальше по пайплайну
         return {"documents": documents}
 
 
+class DocumentCache:
+    """
+    Ограниченный LRU-кэш документов по id, безопасный для нескольких потоков.
+    """
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._items: OrderedDict[str, Document] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, ids: List[str]) -> Dict[str, Document]:
+        found = {}
+        with self._lock:
+            for doc_id in ids:
+                doc = self._items.get(doc_id)
+                if doc is not None:
+                    self._items.move_to_end(doc_id)
+                    found[doc_id] = doc
+        return found
+
+    def put_many(self, docs: List[Document]) -> None:
+        with self._lock:
+            for doc in docs:
+                self._items[doc.id] = doc
+                self._items.move_to_end(doc.id)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+
 @component
-class PickledBM25Retriever:
+class SegmentedBM25Retriever:
     """
-    Sparse Retriever на основе заранее построенного BM25-индекса в pickle.
+    Sparse Retriever на основе заранее построенного сегментированного BM25-индекса.
+
+    Индекс открывается один раз при создании через mmap и дальше только читается.
+    Поиск возвращает id и оценки, а содержимое подгружается из хранилища только
+    для top_k документов (без эмбеддингов) через ограниченный LRU-кэш, поэтому
+    ни время запуска, ни память не растут с размером корпуса.
     """
     def __init__(
         self,
         document_store: ChromaDocumentStore,
-        path_to_pickle: str,
-        top_k: int = 5
+        index_path: str,
+        top_k: int = 5,
+        cache_size: int = settings.BM25_DOC_CACHE_SIZE,
     ):
         self.top_k = top_k
-        self.path = path_to_pickle
-        # загрузка всех документов для быстрого доступа
-        all_docs = document_store.filter_documents(filters={})
-        self.doc_map = {d.id: d for d in all_docs}
+        self.path = index_path
+        self.document_store = document_store
+        self.reader = ChromaStoreReader(document_store)
+        self.index = SegmentedBM25Index(index_path)
+        self.cache = DocumentCache(cache_size)
+
+    def _fetch_documents(self, ids: List[str]) -> List[Document]:
+        """Загружает документы из Chroma по id, без эмбеддингов."""
+        return self.reader.get_documents(ids)
 
     @component.output_types(documents=List[Document])
     def run(self, query: str, top_k: Optional[int] = None) -> Dict[str, List[Document]]:
+        return {"documents": self.run_batch([query], top_k)["documents"][0]}
+
+    def run_batch(self, queries: List[str], top_k: Optional[int] = None) -> Dict[str, List[List[Document]]]:
+        """
+        Ищет несколько запросов за один проход по индексу.
+
+        Словопозиции общих терминов читаются один раз (см. SegmentedBM25Index.search_batch),
+        а недостающие в кэше документы всех запросов подгружаются одним обращением к хранилищу.
+
+        Args:
+            queries: Тексты запросов.
+            top_k: Сколько документов вернуть на запрос.
+
+        Returns:
+            Dict[str, List[List[Document]]]: Документы для каждого запроса в том же порядке.
+        """
         k = top_k or self.top_k
-        with open(self.path, "rb") as f:
-            bm25, doc_ids = pickle.load(f)
-        tokens = word_tokenize(query.lower())
-        scores = bm25.get_scores(tokens)
-        top_idxs = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:k]
-        docs = [self.doc_map[doc_ids[i]] for i in top_idxs if doc_ids[i] in self.doc_map]
-        return {"documents": docs} 
\ No newline at end of file
+        # запросы разбираются тем же анализатором, что и проиндексированный корпус
+        analyzer = self.index.analyzer
+        hits = self.index.search_batch([analyzer.analyze(query) for query in queries], k)
+        return {"documents": self.hydrate(hits)}
+
+    def hydrate(self, hits: List[Tuple[List[str], np.ndarray]]) -> List[List[Document]]:
+        """
+        Превращает результаты поиска по индексу в документы с оценками.
+
+        Недостающие в кэше документы всех запросов подгружаются одним обращением к хранилищу.
+
+        Args:
+            hits: Id документов и оценки для каждого запроса (см. SegmentedBM25Index.search_batch).
+
+        Returns:
+            List[List[Document]]: Документы для каждого запроса в том же порядке.
+        """
+        all_ids = list(dict.fromkeys(doc_id for doc_ids, _ in hits for doc_id in doc_ids))
+        found = self.cache.get_many(all_ids)
+        missing = [doc_id for doc_id in all_ids if doc_id not in found]
+        if missing:
+            fetched = self._fetch_documents(missing)
+            self.cache.put_many(fetched)
+            found.update((d.id, d) for d in fetched)
+
+        # документы из кэша общие для всех запросов — оценку пишем в копию
+        return [
+            [
+                replace(found[doc_id], score=float(score))
+                for doc_id, score in zip(doc_ids, scores) if doc_id in found
+            ]
+            for doc_ids, scores in hits
+        ]
+
+    def reload(self) -> None:
+        """Подхватывает изменения индекса, записанные другим процессом (например, переиндексацией)."""
+        self.index.reload()
+
+
+@component
+class PickledBM25Retriever(SegmentedBM25Retriever):
+    """
+    Прежнее имя SegmentedBM25Retriever, сохранённое для совместимости.
+
+    path_to_pickle может указывать как на директорию сегментированного индекса,
+    так и на прежний bm25.pkl: тогда при первом создании он переносится
+    (см. convert_pickle_index) в директорию <имя>_index рядом с ним, а дальше
+    используется уже перенесённый индекс.
+    """
+    def __init__(
+        self,
+        document_store: ChromaDocumentStore,
+        path_to_pickle: str,
+        top_k: int = 5,
+        cache_size: int = settings.BM25_DOC_CACHE_SIZE,
+    ):
+        path = Path(path_to_pickle)
+        if path.is_file():
+            index_path = path.parent / f"{path.stem}_index"
+            if not (index_path / MANIFEST_FILE).exists():
+                logger.info(f"BM25: переносим {path} в {index_path}")
+                convert_pickle_index(path, index_path)
+            path = index_path
+        # @component пересоздаёт класс, поэтому super() без аргументов здесь не работает
+        SegmentedBM25Retriever.__init__(self, document_store, str(path), top_k=top_k, cache_size=cache_size)
+        self.path_to_pickle = path_to_pickle
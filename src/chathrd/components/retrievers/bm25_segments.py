@@ -0,0 +1,508 @@
+"""Сегментированный BM25-индекс с инкрементальным добавлением и фоновым слиянием."""
+
+import json
+import logging
+import os
+import threading
+from collections import Counter
+from collections.abc import Iterable, Sequence
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+import numpy as np
+
+from chathrd.components.retrievers.bm25_index import DELTA, K1, B, BM25FormatError, BM25Index
+from chathrd.utils.text_analyzer import (
+    DEFAULT_ANALYZER,
+    LEGACY_ANALYZER,
+    TextAnalyzer,
+    get_analyzer,
+)
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 2
+SEGMENT_SUFFIX = ".bm25"
+
+
+class _Segment:
+    """Сегмент индекса: неизменяемый BM25Index и множество удалённых (tombstone) документов."""
+
+    def __init__(self, name: str, index: BM25Index, deleted: Iterable[int] = ()):
+        self.name = name
+        self.index = index
+        self.deleted: Set[int] = set(deleted)
+        self.live: Optional[np.ndarray] = None
+        if self.deleted:
+            self.live = np.ones(index.num_docs, dtype=bool)
+            self.live[list(self.deleted)] = False
+
+    @property
+    def num_live(self) -> int:
+        return self.index.num_docs - len(self.deleted)
+
+    def live_len(self) -> int:
+        lens = np.asarray(self.index.doc_lens)
+        return int(lens.sum() if self.live is None else lens[self.live].sum())
+
+
+class QueryPostings:
+    """
+    Словопозиции терминов пакета запросов в одном снимке индекса (см. gather_batch).
+
+    Хранит веса терминов в запросах (строка — запрос, столбец — термин), живые
+    словопозиции по сегментам и статистику корпуса снимка: число и суммарную длину
+    живых документов и df каждого термина.
+    """
+
+    def __init__(self, query_weights: np.ndarray, segments: list, num_docs: int, total_len: int, df: np.ndarray):
+        self.query_weights = query_weights
+        self.segments = segments
+        self.num_docs = num_docs
+        self.total_len = total_len
+        self.df = df
+
+
+class SegmentedBM25Index:
+    """
+    BM25L-индекс из нескольких сегментов в одной директории:
+      - manifest.json      — список сегментов и удалённых в них документов;
+      - seg_NNNNNN.bm25    — сегменты в бинарном формате BM25Index.
+
+    Новые документы попадают в новый сегмент, удаления — в tombstone-множество
+    сегмента, поэтому добавление файла стоит O(файл), а не O(корпус). Повторное
+    добавление документа с тем же id удаляет его старую копию. Слияние сегментов
+    (compaction) выполняется в фоновом потоке и физически убирает удалённые документы.
+
+    Манифест хранит имя анализатора текста, которым построены сегменты: запросы
+    анализируются им же, а добавление документов другим анализатором запрещено.
+
+    Глобальная статистика (N, avgdl, df) считается по живым документам всех
+    сегментов, поэтому оценки совпадают с индексом, построенным заново по тем же
+    документам. Поиск работает по неизменяемому снимку сегментов и безопасен
+    при одновременных изменениях из другого потока.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        max_segments: int = 8,
+        max_deleted_ratio: float = 0.3,
+        analyzer: str = DEFAULT_ANALYZER,
+    ):
+        """
+        Открывает индекс (или создаёт пустой, если директории ещё нет).
+
+        Args:
+            path: Директория индекса.
+            max_segments: После скольких сегментов запускается слияние.
+            max_deleted_ratio: Доля удалённых документов, после которой запускается слияние.
+            analyzer: Анализатор текста для нового (пустого) индекса; у существующего
+                индекса используется анализатор из манифеста.
+        """
+        self.path = Path(path)
+        self.analyzer_name = analyzer
+        self.max_segments = max_segments
+        self.max_deleted_ratio = max_deleted_ratio
+        self._lock = threading.RLock()
+        self._merge_thread: Optional[threading.Thread] = None
+        self._next_segment = 1
+        self._state: Tuple[Tuple[_Segment, ...], Tuple[int, int]] = ((), (0, 0))
+        self.reload()
+
+    # ───────── чтение ─────────
+
+    def reload(self) -> None:
+        """Перечитывает manifest.json и открывает сегменты, изменившиеся на диске."""
+        manifest_path = self.path / MANIFEST_FILE
+        for attempt in range(3):
+            if not manifest_path.exists():
+                manifest = {"next_segment": 1, "segments": []}
+            else:
+                with open(manifest_path, encoding="utf-8") as f:
+                    manifest = json.load(f)
+                if manifest.get("version") != MANIFEST_VERSION:
+                    raise BM25FormatError(
+                        f"{manifest_path}: версия манифеста {manifest.get('version')}, "
+                        f"поддерживается {MANIFEST_VERSION}; пересоберите индекс",
+                    )
+            try:
+                current = {seg.name: seg for seg in self._segments}
+                segments = []
+                for entry in manifest["segments"]:
+                    old = current.get(entry["name"])
+                    # CRC не сверяем: полный проход по файлу при открытии свёл бы на нет
+                    # ленивое чтение через mmap; заголовок и границы секций проверяются
+                    index = old.index if old else BM25Index.load(
+                        self._segment_path(entry["name"]), verify=False,
+                    )
+                    segments.append(_Segment(entry["name"], index, entry.get("deleted", [])))
+                break
+            except FileNotFoundError:
+                # сегмент удалили после слияния между чтением манифеста и открытием
+                if attempt == 2:
+                    raise
+        with self._lock:
+            self._next_segment = manifest["next_segment"]
+            if manifest["segments"]:
+                # манифесты без поля analyzer записаны до появления общего анализатора
+                self.analyzer_name = manifest.get("analyzer", LEGACY_ANALYZER)
+            self._set_segments(segments)
+
+    @property
+    def _segments(self) -> Tuple[_Segment, ...]:
+        return self._state[0]
+
+    @property
+    def analyzer(self) -> TextAnalyzer:
+        return get_analyzer(self.analyzer_name)
+
+    @property
+    def num_docs(self) -> int:
+        return self._state[1][0]
+
+    @property
+    def num_segments(self) -> int:
+        return len(self._segments)
+
+    def search(self, tokens: Sequence[str], top_k: int) -> Tuple[List[str], np.ndarray]:
+        """
+        Находит top_k документов по BM25L, обходя только словопозиции терминов запроса.
+
+        Формула совпадает с rank_bm25.BM25L.get_scores (включая множитель tf и повторы
+        токенов в запросе), документы без совпадений не возвращаются.
+
+        Args:
+            tokens: Токены запроса.
+            top_k: Сколько документов вернуть.
+
+        Returns:
+            Tuple[List[str], np.ndarray]: Id документов и их оценки по убыванию оценки.
+        """
+        return self.search_batch([tokens], top_k)[0]
+
+    def search_batch(
+        self, queries: Sequence[Sequence[str]], top_k: int,
+    ) -> List[Tuple[List[str], np.ndarray]]:
+        """
+        Ищет сразу несколько запросов за один проход по объединению их терминов.
+
+        Словопозиции каждого термина читаются и фильтруются по tombstone-маскам один
+        раз, df и нормированный по длине документа вклад словопозиции тоже считаются
+        один раз; на запрос остаются только взвешивание вкладов его терминов,
+        суммирование по кандидатам через np.bincount и частичная сортировка
+        (np.argpartition) — сначала внутри сегментов, затем среди их победителей.
+
+        Args:
+            queries: Токены каждого запроса.
+            top_k: Сколько документов вернуть на запрос.
+
+        Returns:
+            List[Tuple[List[str], np.ndarray]]: Для каждого запроса — id документов
+            и их оценки по убыванию оценки.
+        """
+        return self.score_batch(self.gather_batch(queries), top_k)
+
+    def gather_batch(self, queries: Sequence[Sequence[str]]) -> QueryPostings:
+        """
+        Первая фаза поиска: живые словопозиции терминов запросов и статистика корпуса.
+
+        Args:
+            queries: Токены каждого запроса.
+
+        Returns:
+            QueryPostings: Словопозиции по сегментам текущего снимка, N, суммарная
+            длина живых документов и df каждого термина.
+        """
+        segments, (num_docs, total_len) = self._state
+        query_tfs = [Counter(tokens) for tokens in queries]
+        term_pos: Dict[str, int] = {}
+        for query_tf in query_tfs:
+            for term in query_tf:
+                term_pos.setdefault(term, len(term_pos))
+
+        # веса терминов в запросах: строка — запрос, столбец — термин объединения
+        query_weights = np.zeros((len(queries), len(term_pos)), dtype=np.float64)
+        for q, query_tf in enumerate(query_tfs):
+            for term, count in query_tf.items():
+                query_weights[q, term_pos[term]] = count
+
+        df = np.zeros(len(term_pos), dtype=np.float64)
+        gathered = []
+        for seg in segments:
+            per_term = []
+            for i, term in enumerate(term_pos):
+                docs, tf = seg.index.gather(term)
+                if seg.live is not None and len(docs):
+                    keep = seg.live[docs]
+                    docs, tf = docs[keep], tf[keep]
+                df[i] += len(docs)
+                per_term.append((docs, tf))
+            gathered.append((seg, per_term))
+        return QueryPostings(query_weights, gathered, num_docs, total_len, df)
+
+    def score_batch(
+        self,
+        postings: QueryPostings,
+        top_k: int,
+        num_docs: Optional[int] = None,
+        total_len: Optional[float] = None,
+        df: Optional[np.ndarray] = None,
+    ) -> List[Tuple[List[str], np.ndarray]]:
+        """
+        Вторая фаза поиска: оценки BM25L и top_k по собранным словопозициям.
+
+        По умолчанию используется статистика самого индекса. Чтобы оценки нескольких
+        независимых индексов (шардов) были сопоставимы, им передаётся общая
+        статистика — суммы num_docs, total_len и df их QueryPostings.
+
+        Args:
+            postings: Результат gather_batch этого индекса.
+            top_k: Сколько документов вернуть на запрос.
+            num_docs: Число живых документов для idf.
+            total_len: Суммарная длина живых документов для avgdl.
+            df: Документная частота терминов (в порядке терминов postings).
+
+        Returns:
+            List[Tuple[List[str], np.ndarray]]: Для каждого запроса — id документов
+            и их оценки по убыванию оценки.
+        """
+        num_docs = postings.num_docs if num_docs is None else num_docs
+        total_len = postings.total_len if total_len is None else total_len
+        df = postings.df if df is None else df
+        query_weights = postings.query_weights
+        num_queries, num_terms = query_weights.shape
+        if not num_docs or not num_terms or top_k <= 0:
+            return [([], np.empty(0, dtype=np.float64)) for _ in range(num_queries)]
+        avgdl = total_len / num_docs
+
+        present = df > 0
+        idf = np.zeros(num_terms, dtype=np.float64)
+        idf[present] = np.log(num_docs + 1) - np.log(df[present] + 0.5)
+
+        # 1) вклады словопозиций (общие для всех запросов) и частичный top_k по сегментам
+        cand_scores: List[List[np.ndarray]] = [[] for _ in range(num_queries)]
+        cand_ids: List[List[str]] = [[] for _ in range(num_queries)]
+        for seg, per_term in postings.segments:
+            lengths = np.array([len(docs) for docs, _ in per_term], dtype=np.int64)
+            if not lengths.sum():
+                continue
+            docs = np.concatenate([d for d, _ in per_term])
+            tf = np.concatenate([t for _, t in per_term]).astype(np.float64)
+            posting_term = np.repeat(np.arange(num_terms), lengths)
+            ctd = tf / (1 - B + B * seg.index.doc_lens[docs] / avgdl)
+            base = idf[posting_term] * tf * (K1 + 1) * (ctd + DELTA) / (K1 + ctd + DELTA)
+            candidates, inverse = np.unique(docs, return_inverse=True)
+
+            for q in range(num_queries):
+                weights = query_weights[q, posting_term]
+                matched = weights > 0
+                if not matched.any():
+                    continue
+                hits = np.bincount(inverse[matched], minlength=len(candidates))
+                scores = np.bincount(inverse, weights=base * weights, minlength=len(candidates))
+                local = np.flatnonzero(hits)
+                scores = scores[local]
+                if len(local) > top_k:
+                    # индексы по возрастанию — при равных оценках выигрывает более ранний документ
+                    part = np.sort(np.argpartition(-scores, top_k - 1)[:top_k])
+                    local, scores = local[part], scores[part]
+                cand_scores[q].append(scores)
+                cand_ids[q].extend(seg.index.doc_ids[i] for i in candidates[local])
+
+        # 2) общий top_k каждого запроса среди победителей сегментов
+        results = []
+        for q in range(num_queries):
+            if not cand_ids[q]:
+                results.append(([], np.empty(0, dtype=np.float64)))
+                continue
+            scores = np.concatenate(cand_scores[q])
+            order = np.argsort(-scores, kind="stable")[:top_k]
+            results.append(([cand_ids[q][i] for i in order], scores[order]))
+        return results
+
+    # ───────── изменение ─────────
+
+    def add(self, corpus: Sequence[Sequence[str]], doc_ids: Sequence[str]) -> None:
+        """
+        Добавляет документы новым сегментом; старые копии тех же id помечаются удалёнными.
+
+        Args:
+            corpus: Списки токенов документов.
+            doc_ids: Id документов в том же порядке.
+        """
+        if not doc_ids:
+            return
+        self.add_segment(BM25Index.build(corpus, doc_ids))
+
+    def add_segment(self, segment: BM25Index) -> None:
+        """
+        Записывает готовый сегмент и подключает его к индексу.
+
+        Старые копии документов с теми же id помечаются удалёнными. В памяти
+        остаётся mmap-представление записанного файла, а не построенные массивы.
+
+        Args:
+            segment: Сегмент в памяти.
+        """
+        if not segment.num_docs:
+            return
+        with self._lock:
+            name = f"seg_{self._next_segment:06d}"
+            self._next_segment += 1
+            path = self._segment_path(name)
+            segment.save(path)
+            segment = BM25Index.load(path, verify=False)
+            segments = self._tombstone(self._segments, set(segment.doc_ids))
+            self._commit(segments + (_Segment(name, segment),))
+        logger.info(f"BM25: добавлен сегмент {name} ({segment.num_docs} документов)")
+        self._maybe_merge()
+
+    def delete(self, doc_ids: Iterable[str]) -> None:
+        """
+        Помечает документы удалёнными во всех сегментах.
+
+        Args:
+            doc_ids: Id удаляемых документов.
+        """
+        ids = set(doc_ids)
+        if not ids:
+            return
+        with self._lock:
+            self._commit(self._tombstone(self._segments, ids))
+        self._maybe_merge()
+
+    def merge(self) -> None:
+        """
+        Сливает все текущие сегменты в один, физически убирая удалённые документы.
+
+        Тяжёлая часть выполняется без блокировки: параллельные add/delete не ждут
+        слияния. Сегменты, добавленные во время слияния, остаются как есть, а
+        удаления, попавшие в сливаемые сегменты за это время, переносятся в новый.
+        """
+        with self._lock:
+            snapshot = self._segments
+            if len(snapshot) < 2 and not any(seg.deleted for seg in snapshot):
+                return
+            name = f"seg_{self._next_segment:06d}"
+            self._next_segment += 1
+            deleted_before = [set(seg.deleted) for seg in snapshot]
+
+        merged = BM25Index.merge([(seg.index, seg.live) for seg in snapshot])
+        merged.save(self._segment_path(name))
+        merged = BM25Index.load(self._segment_path(name), verify=False)
+
+        with self._lock:
+            current = {seg.name: seg for seg in self._segments}
+            # номер каждого живого документа снимка в слитом сегменте
+            late_deleted: List[int] = []
+            offset = 0
+            for seg, before in zip(snapshot, deleted_before):
+                now = current[seg.name].deleted if seg.name in current else set(range(seg.index.num_docs))
+                live = np.ones(seg.index.num_docs, dtype=bool)
+                if before:
+                    live[list(before)] = False
+                new_no = np.cumsum(live) - 1 + offset
+                late_deleted.extend(int(new_no[i]) for i in now - before)
+                offset += int(live.sum())
+            merged_names = {seg.name for seg in snapshot}
+            rest = tuple(seg for seg in self._segments if seg.name not in merged_names)
+            self._commit((_Segment(name, merged, late_deleted),) + rest)
+
+        for seg in snapshot:
+            # открытые mmap продолжают работать: файл удаляется только из директории
+            self._segment_path(seg.name).unlink(missing_ok=True)
+        logger.info(f"BM25: {len(snapshot)} сегментов слиты в {name} ({merged.num_docs} документов)")
+
+    def merge_in_background(self) -> threading.Thread:
+        """
+        Запускает merge в отдельном потоке (не более одного одновременно).
+
+        Returns:
+            threading.Thread: Поток слияния; его можно дождаться через wait_for_merge.
+        """
+        with self._lock:
+            if self._merge_thread is None or not self._merge_thread.is_alive():
+                self._merge_thread = threading.Thread(
+                    target=self.merge, name="bm25-merge", daemon=False,
+                )
+                self._merge_thread.start()
+            return self._merge_thread
+
+    def wait_for_merge(self) -> None:
+        """Дожидается завершения фонового слияния, если оно идёт."""
+        thread = self._merge_thread
+        if thread is not None:
+            thread.join()
+
+    # ───────── внутреннее ─────────
+
+    def _segment_path(self, name: str) -> Path:
+        return self.path / f"{name}{SEGMENT_SUFFIX}"
+
+    def _tombstone(self, segments: Tuple[_Segment, ...], ids: Set[str]) -> Tuple[_Segment, ...]:
+        # обычно входящих id немного, и они ищутся двоичным поиском по id_order
+        # сегмента; при массовой замене дешевле один проход по id сегмента
+        result = []
+        for seg in segments:
+            if len(ids) * max(seg.index.num_docs.bit_length(), 1) < seg.index.num_docs:
+                hits = {int(no) for doc_id in ids for no in seg.index.find_doc(doc_id)}
+            else:
+                hits = {no for no, doc_id in enumerate(seg.index.doc_ids) if doc_id in ids}
+            if hits - seg.deleted:
+                seg = _Segment(seg.name, seg.index, seg.deleted | hits)
+            result.append(seg)
+        return tuple(result)
+
+    def _commit(self, segments: Tuple[_Segment, ...]) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "next_segment": self._next_segment,
+            "analyzer": self.analyzer_name,
+            "segments": [
+                {"name": seg.name, "deleted": sorted(seg.deleted)} for seg in segments
+            ],
+        }
+        tmp = self.path / f"{MANIFEST_FILE}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp, self.path / MANIFEST_FILE)
+        self._set_segments(segments)
+
+    def _set_segments(self, segments: Sequence[_Segment]) -> None:
+        num_docs = sum(seg.num_live for seg in segments)
+        total_len = sum(seg.live_len() for seg in segments)
+        # снимок меняется одним присваиванием — поиск всегда видит согласованное состояние
+        self._state = (tuple(segments), (num_docs, total_len))
+
+    def _maybe_merge(self) -> None:
+        segments = self._segments
+        total = sum(seg.index.num_docs for seg in segments)
+        deleted = sum(len(seg.deleted) for seg in segments)
+        if len(segments) > self.max_segments or (total and deleted / total > self.max_deleted_ratio):
+            self.merge_in_background()
+
+
+def convert_pickle_index(pickle_path: Union[str, Path], index_path: Union[str, Path]) -> SegmentedBM25Index:
+    """
+    Переносит прежний bm25.pkl в сегментированный индекс без пересборки корпуса.
+
+    Args:
+        pickle_path: Путь к bm25.pkl (кортеж rank_bm25.BM25L и списка id).
+        index_path: Директория нового индекса; документы добавляются в неё новым сегментом.
+
+    Returns:
+        SegmentedBM25Index: Открытый индекс с перенесёнными документами.
+    """
+    legacy = BM25Index.from_pickle(pickle_path)
+    index = SegmentedBM25Index(index_path, analyzer=LEGACY_ANALYZER)
+    if index.analyzer_name != LEGACY_ANALYZER:
+        raise BM25FormatError(
+            f"{index_path}: индекс построен анализатором {index.analyzer_name}, "
+            f"а bm25.pkl — {LEGACY_ANALYZER}; укажите пустую директорию",
+        )
+    index.add_segment(legacy)
+    logger.info(f"BM25: {pickle_path} перенесён в {index_path} ({legacy.num_docs} документов)")
+    return index
@@ -0,0 +1,41 @@
+"""Dense-поиск по Chroma с пакетной обработкой нескольких запросов."""
+
+from typing import Any, Dict, List, Optional
+
+from haystack import Document, component
+from haystack.document_stores.types.filter_policy import apply_filter_policy
+from haystack_integrations.components.retrievers.chroma import ChromaQueryTextRetriever
+
+
+@component
+class BatchChromaQueryTextRetriever(ChromaQueryTextRetriever):
+    """
+    ChromaQueryTextRetriever, который умеет искать несколько запросов сразу.
+
+    run_batch отправляет все запросы одним вызовом collection.query: эмбеддинги
+    запросов считаются одним батчем, а индекс коллекции обходится за один запрос
+    к Chroma вместо отдельного обращения на каждый подзапрос.
+    """
+
+    def run_batch(
+        self,
+        queries: List[str],
+        filters: Optional[Dict[str, Any]] = None,
+        top_k: Optional[int] = None,
+    ) -> Dict[str, List[List[Document]]]:
+        """
+        Ищет документы для каждого запроса из списка.
+
+        Args:
+            queries: Тексты запросов.
+            filters: Фильтры (применяются согласно filter_policy, как в run).
+            top_k: Сколько документов вернуть на запрос.
+
+        Returns:
+            Dict[str, List[List[Document]]]: Документы для каждого запроса в том же порядке.
+        """
+        if not queries:
+            return {"documents": []}
+        filters = apply_filter_policy(self.filter_policy, self.filters, filters)
+        top_k = top_k or self.top_k
+        return {"documents": self.document_store.search(queries, top_k, filters)}
@@ -0,0 +1,173 @@
+"""Scatter-gather поиск по шардам источников (cms, lists, filestorage)."""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+from haystack import Document, component
+
+from chathrd.components.retrievers.bm25_retriever import SegmentedBM25Retriever
+from chathrd.components.retrievers.chroma_retriever import BatchChromaQueryTextRetriever
+from chathrd.utils.chroma_store import ChromaStoreReader
+
+logger = logging.getLogger(__name__)
+
+
+def _select(shards: Dict[str, object], sources: Optional[List[str]]) -> List[str]:
+    """Шарды, к которым относится запрос: все или только указанные источники."""
+    if sources is None:
+        return list(shards)
+    missing = [source for source in sources if source not in shards]
+    if missing:
+        logger.debug(f"Нет шардов для источников: {', '.join(missing)}")
+    return [source for source in shards if source in sources]
+
+
+@component
+class ShardedBM25Retriever:
+    """
+    BM25-поиск по независимым индексам источников.
+
+    Каждый шард — свой SegmentedBM25Retriever (свой сегментированный индекс и своё
+    хранилище Chroma), поэтому источники собираются, перезагружаются и
+    переиндексируются по отдельности. Поиск идёт в две фазы: шарды параллельно
+    собирают словопозиции терминов запросов и свою статистику (N, суммарная длина,
+    df), затем оцениваются по общей статистике — так оценки из разных шардов
+    совпадают с оценками единого индекса и сравнимы при слиянии top_k.
+    Запрос, ограниченный источниками, обращается только к их шардам.
+    """
+    def __init__(self, shards: Dict[str, SegmentedBM25Retriever], top_k: int = 5):
+        self.shards = shards
+        self.top_k = top_k
+        self._pool = ThreadPoolExecutor(max_workers=max(1, len(shards)), thread_name_prefix="bm25-shard")
+
+    @component.output_types(documents=List[Document])
+    def run(
+        self, query: str, top_k: Optional[int] = None, sources: Optional[List[str]] = None,
+    ) -> Dict[str, List[Document]]:
+        return {"documents": self.run_batch([query], top_k, sources)["documents"][0]}
+
+    def run_batch(
+        self, queries: List[str], top_k: Optional[int] = None, sources: Optional[List[str]] = None,
+    ) -> Dict[str, List[List[Document]]]:
+        """
+        Ищет несколько запросов во всех (или указанных) шардах и сливает результаты.
+
+        Args:
+            queries: Тексты запросов.
+            top_k: Сколько документов вернуть на запрос.
+            sources: Источники, в которых искать (по умолчанию все).
+
+        Returns:
+            Dict[str, List[List[Document]]]: Документы для каждого запроса в том же порядке.
+        """
+        k = top_k or self.top_k
+        selected = _select(self.shards, sources)
+        if not selected:
+            return {"documents": [[] for _ in queries]}
+
+        # 1) scatter: словопозиции и статистика каждого шарда
+        def gather(source: str):
+            index = self.shards[source].index
+            return index.gather_batch([index.analyzer.analyze(query) for query in queries])
+
+        postings = dict(zip(selected, self._pool.map(gather, selected)))
+
+        # общая статистика — по шардам с одинаковым анализатором (их термины совпадают)
+        stats: Dict[str, list] = {}
+        for source in selected:
+            p = postings[source]
+            name = self.shards[source].index.analyzer_name
+            if name not in stats:
+                stats[name] = [0, 0, np.zeros_like(p.df)]
+            stats[name][0] += p.num_docs
+            stats[name][1] += p.total_len
+            stats[name][2] = stats[name][2] + p.df
+
+        # 2) оценки по общей статистике и загрузка документов top_k
+        def score(source: str) -> List[List[Document]]:
+            retriever = self.shards[source]
+            num_docs, total_len, df = stats[retriever.index.analyzer_name]
+            hits = retriever.index.score_batch(postings[source], k, num_docs, total_len, df)
+            return retriever.hydrate(hits)
+
+        per_shard = list(self._pool.map(score, selected))
+
+        # 3) gather: общий top_k каждого запроса
+        merged = []
+        for q in range(len(queries)):
+            docs = [doc for shard_docs in per_shard for doc in shard_docs[q]]
+            docs.sort(key=lambda doc: doc.score, reverse=True)
+            merged.append(docs[:k])
+        return {"documents": merged}
+
+    def reload(self, sources: Optional[List[str]] = None) -> None:
+        """
+        Перечитывает индексы шардов после их переиндексации.
+
+        Args:
+            sources: Какие источники перечитать (по умолчанию все).
+        """
+        for source in _select(self.shards, sources):
+            self.shards[source].reload()
+
+
+@component
+class ShardedChromaRetriever:
+    """
+    Dense-поиск по коллекциям Chroma источников.
+
+    Шарды опрашиваются параллельно (каждый — одним пакетным запросом на все
+    подзапросы), результаты сливаются по расстоянию: эмбеддинги всех шардов
+    построены одной моделью, поэтому расстояния сравнимы. Для метрик l2 и cosine
+    меньшее расстояние лучше, для ip — большее.
+    """
+    def __init__(self, shards: Dict[str, BatchChromaQueryTextRetriever], top_k: int = 5):
+        self.shards = shards
+        self.top_k = top_k
+        self._pool = ThreadPoolExecutor(max_workers=max(1, len(shards)), thread_name_prefix="chroma-shard")
+
+    @component.output_types(documents=List[Document])
+    def run(
+        self, query: str, top_k: Optional[int] = None, sources: Optional[List[str]] = None,
+    ) -> Dict[str, List[Document]]:
+        return {"documents": self.run_batch([query], top_k, sources)["documents"][0]}
+
+    def run_batch(
+        self, queries: List[str], top_k: Optional[int] = None, sources: Optional[List[str]] = None,
+    ) -> Dict[str, List[List[Document]]]:
+        """
+        Ищет несколько запросов во всех (или указанных) шардах и сливает результаты.
+
+        Args:
+            queries: Тексты запросов.
+            top_k: Сколько документов вернуть на запрос.
+            sources: Источники, в которых искать (по умолчанию все).
+
+        Returns:
+            Dict[str, List[List[Document]]]: Документы для каждого запроса в том же порядке.
+        """
+        k = top_k or self.top_k
+        selected = _select(self.shards, sources)
+        if not queries or not selected:
+            return {"documents": [[] for _ in queries]}
+
+        per_shard = list(self._pool.map(
+            lambda source: self.shards[source].run_batch(queries=queries, top_k=k)["documents"], selected,
+        ))
+        higher_is_better = {
+            source: ChromaStoreReader(self.shards[source].document_store).distance_function == "ip"
+            for source in selected
+        }
+        if len(set(higher_is_better.values())) > 1:
+            logger.warning("Шарды Chroma используют разные метрики расстояния, оценки несравнимы")
+        reverse = higher_is_better[selected[0]]
+        worst = float("-inf") if reverse else float("inf")
+
+        merged = []
+        for q in range(len(queries)):
+            docs = [doc for shard_docs in per_shard for doc in shard_docs[q]]
+            docs.sort(key=lambda doc: worst if doc.score is None else doc.score, reverse=reverse)
+            merged.append(docs[:k])
+        return {"documents": merged}
@@ -19,7 +19,13 @@ class Settings:
     
     # Пути к индексам
     CHROMA_INDEX_PATH: str = os.getenv("CHROMA_INDEX_PATH", os.path.join(DATA_DIR, "chroma_index"))
-    BM25_INDEX_PATH: str = os.getenv("BM25_INDEX_PATH", os.path.join(DATA_DIR, "bm25.pkl"))
+    BM25_INDEX_PATH: str = os.getenv("BM25_INDEX_PATH", os.path.join(DATA_DIR, "bm25_index"))
+    # После скольких сегментов BM25-индекс сливается в один (в фоне)
+    BM25_MAX_SEGMENTS: int = int(os.getenv("BM25_MAX_SEGMENTS", "8"))
+    # Сколько документов BM25-ретривер держит в LRU-кэше (содержимое без эмбеддингов)
+    BM25_DOC_CACHE_SIZE: int = int(os.getenv("BM25_DOC_CACHE_SIZE", "2048"))
+    # Сколько процессов токенизируют и индексируют документы при сборке BM25
+    BM25_BUILD_WORKERS: int = int(os.getenv("BM25_BUILD_WORKERS", str(os.cpu_count() or 1)))
     
     # Настройки LLM
     MODEL_NAME: str = os.getenv("MODEL_NAME", "hf.co/IlyaGusev/saiga_yandexgpt_8b_gguf:Q4_0")
@@ -30,10 +36,41 @@ class Settings:
         "EMBEDDER_MODEL", 
         "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
     )
+    # бэкенд эмбеддера при индексации: torch или onnx-int8 (нужен sentence-transformers[onnx])
+    EMBEDDER_BACKEND: str = os.getenv("EMBEDDER_BACKEND", "torch")
+    EMBEDDER_BATCH_SIZE: int = int(os.getenv("EMBEDDER_BATCH_SIZE", "32"))
+    # процессов эмбеддинга при индексации (ядра делятся между ними поровну)
+    EMBEDDER_WORKERS: int = int(os.getenv("EMBEDDER_WORKERS", "1"))
+    # квантованный файл модели в её репозитории; если его нет, модель квантуется локально
+    EMBEDDER_ONNX_FILE: str = os.getenv("EMBEDDER_ONNX_FILE", "onnx/model_quint8_avx2.onnx")
     
     # Настройки индексации
     MAX_SPLIT_LENGTH: int = int(os.getenv("MAX_SPLIT_LENGTH", "200"))
     SPLIT_OVERLAP: int = int(os.getenv("SPLIT_OVERLAP", "50"))
+    # Индексация идёт пачками: не больше стольких файлов и мегабайт исходных файлов за раз
+    INDEX_BATCH_FILES: int = int(os.getenv("INDEX_BATCH_FILES", "32"))
+    INDEX_BATCH_MB: int = int(os.getenv("INDEX_BATCH_MB", "64"))
+    # чанки с оценкой Жаккара (MinHash) не ниже порога индексируются один раз; 0 — отключить
+    DEDUP_THRESHOLD: float = float(os.getenv("DEDUP_THRESHOLD", "0.9"))
+    # Конвертация файлов: число рабочих процессов и таймаут на один файл (сек)
+    CONVERT_WORKERS: int = int(os.getenv("CONVERT_WORKERS", str(os.cpu_count() or 1)))
+    CONVERT_TIMEOUT: float = float(os.getenv("CONVERT_TIMEOUT", "900"))
+    # текстовые файлы больше этого размера (МБ) читаются потоково и режутся на части
+    TEXT_STREAM_MB: int = int(os.getenv("TEXT_STREAM_MB", "32"))
+    # OCR сканов: потоков распознавания на файл и максимум растеризованных страниц в памяти.
+    # Лимиты действуют в каждом из CONVERT_WORKERS процессов конвертации, поэтому по
+    # умолчанию ядра делятся между ними: всего не больше ~cpu_count процессов Tesseract
+    OCR_WORKERS: int = int(os.getenv("OCR_WORKERS", str(max(1, (os.cpu_count() or 1) // max(1, CONVERT_WORKERS)))))
+    OCR_MAX_IN_FLIGHT: int = int(os.getenv("OCR_MAX_IN_FLIGHT", str(2 * OCR_WORKERS)))
+    # разрешение растеризации для OCR выбирается в этих пределах; ниже OCR_MIN_CONFIDENCE — повтор с OCR_MAX_DPI
+    OCR_MIN_DPI: int = int(os.getenv("OCR_MIN_DPI", "150"))
+    OCR_MAX_DPI: int = int(os.getenv("OCR_MAX_DPI", "300"))
+    OCR_MIN_CONFIDENCE: float = float(os.getenv("OCR_MIN_CONFIDENCE", "60"))
+    # постоянный кэш распознанных страниц (пустой путь отключает кэш) и его предельный размер
+    OCR_CACHE_PATH: str = os.getenv("OCR_CACHE_PATH", os.path.join(DATA_DIR, "ocr_cache.sqlite3"))
+    OCR_CACHE_MB: int = int(os.getenv("OCR_CACHE_MB", "1024"))
+    # кэш эмбеддингов чанков (по модели и тексту); пустой путь отключает кэш
+    EMBEDDING_CACHE_PATH: str = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(DATA_DIR, "embedding_cache.sqlite3"))
     
     # Настройки поиска
     TOP_K_RETRIEVAL: int = int(os.getenv("TOP_K_RETRIEVAL", "5"))
@@ -70,7 +107,7 @@ class Settings:
         Path(cls.DATA_DIR).mkdir(parents=True, exist_ok=True)
         Path(cls.DOWNLOADED_FILES_DIR).mkdir(parents=True, exist_ok=True)
         Path(cls.CHROMA_INDEX_PATH).mkdir(parents=True, exist_ok=True)
-        Path(os.path.dirname(cls.BM25_INDEX_PATH)).mkdir(parents=True, exist_ok=True)
+        Path(cls.BM25_INDEX_PATH).mkdir(parents=True, exist_ok=True)
 
 
 # Экземпляр настроек для использования в приложении
@@ -61,7 +61,7 @@ class Client:
                     model_name=self.model,
                     api_url=self.api_base,
                     persist_path=os.path.join(os.path.dirname(docs_dir), "chroma_index"),
-                    bm25_path=os.path.join(os.path.dirname(docs_dir), "bm25.pkl"),
+                    bm25_path=os.path.join(os.path.dirname(docs_dir), "bm25_index"),
                 )
                 logger.info("Пайплайн запросов успешно инициализирован")
             except Exception as e:
@@ -7,29 +7,26 @@ import os
 import logging
 import time
 from pathlib import Path
-from typing import List, Optional
+from typing import Iterator, List, Optional, Set
 
 from haystack import Pipeline
-from haystack.components.routers import FileTypeRouter
-from haystack.components.converters import (
-    TextFileToDocument, 
-    PyPDFToDocument,
-    DOCXToDocument,
-    CSVToDocument,
-    XLSXToDocument,
-    MarkdownToDocument,
-    TikaDocumentConverter
-)
-from haystack.components.joiners.document_joiner import DocumentJoiner
 from haystack.components.preprocessors import DocumentCleaner, DocumentSplitter
-from haystack.components.embedders import SentenceTransformersDocumentEmbedder
 from haystack.components.writers import DocumentWriter
+from haystack.document_stores.types import DuplicatePolicy
 from haystack_integrations.document_stores.chroma import ChromaDocumentStore
 
-from chathrd.components.converters.document_converters import OCRPDFToDocument, PDFFastOrOCRRouter
-from chathrd.components.processors.document_processors import OverlapToStr, EncodingSplitter
+from chathrd.components.converters.parallel_converter import ParallelFileConverter
+from chathrd.components.embedders.bucketed_embedder import BucketedDocumentEmbedder
+from chathrd.components.embedders.cached_embedder import CachedDocumentEmbedder
+from chathrd.components.processors.checkpoint import SpillCheckpoint
+from chathrd.components.processors.deduplicator import NearDuplicateFilter
+from chathrd.components.processors.document_processors import HeaderFooterCleaner, OverlapToStr
 from chathrd.components.retrievers.bm25_retriever import BM25Builder
 from chathrd.config.settings import settings
+from chathrd.utils.file_manifest import MANIFEST_FILE, FileChange, FileManifest, assign_chunks
+from chathrd.utils.pipeline_profiler import PipelineProfiler
+from chathrd.utils.sources import SOURCES, adopt_root_index, group_by_source, list_source_files, shard_path
+from chathrd.utils.spill_store import SPILL_DIR, SpillStore
 
 logger = logging.getLogger(__name__)
 
@@ -37,6 +34,19 @@ logger = logging.getLogger(__name__)
 def create_indexing_pipeline(persist_path: str = "../data/chroma_index") -> Pipeline:
     """
     Создает и настраивает пайплайн для индексации документов.
+
+    Конвертация выполняется компонентом ParallelFileConverter: файлы
+    раскладываются по MIME-типам и конвертируются в пуле процессов (текст по
+    кодировке, PDF с текстовым слоем или через OCR, Office/EPUB через Tika),
+    затем из документов вырезаются повторяющиеся колонтитулы страниц (в текстах
+    без страниц — повторяющиеся строки), они очищаются и режутся на чанки, почти одинаковые чанки отбрасываются
+    (остаётся одна каноническая копия), а остальные эмбеддятся и записываются
+    в Chroma и BM25.
+
+    После конвертации и после эмбеддинга стоят контрольные точки
+    (SpillCheckpoint), которые сохраняют результаты по файлам в
+    persist_path/spill: после сбоя эти стадии для файлов незавершённой пачки не
+    повторяются (см. _index_source).
     
     Args:
         persist_path: Путь для сохранения индекса Chroma.
@@ -52,43 +62,18 @@ def create_indexing_pipeline(persist_path: str = "../data/chroma_index") -> Pipe
 
     # Инициализация компонентов
     logger.debug("Инициализация компонентов пайплайна...")
-    file_router = FileTypeRouter(
-        mime_types=[
-            "text/plain",                        # .txt, .yml
-            "text/csv",                          # .csv
-            "text/markdown",                     # .md
-            "application/json",                  # .json
-            "application/pdf",                   # .pdf
-            "application/msword",                # .doc
-            "application/vnd.openxmlformats-officedocument.wordprocessingml.document",  # .docx
-            "application/epub+zip",              # .epub
-            "application/vnd.ms-excel",          # .xls
-            "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",        # .xlsx
-        ]
-    )
-    logger.debug("Создан маршрутизатор файлов по MIME-типам")
-    # --- конвертеры ---
-    txt_utf8 = TextFileToDocument()                 # encoding="utf-8" по умолчанию
-    txt_cp = TextFileToDocument(encoding="cp1251")  # второй конвертер под Windows‑1251
-    csv_converter = CSVToDocument()
-    json_converter = TextFileToDocument()  # просто читаем json файлы как текст
-    
-    tika_doc_converter = TikaDocumentConverter()   # .doc
-    tika_epub_converter = TikaDocumentConverter()  # .epub
-    tika_xls_converter = TikaDocumentConverter()   # .xls
-    docx_converter = DOCXToDocument()
-    xlsx_converter = XLSXToDocument(table_format="markdown")
-    tika_unclassified_converter = TikaDocumentConverter()   # for all other
-    md_converter = MarkdownToDocument()
-
-    # --- объединитель ---
-    joiner = DocumentJoiner(join_mode="concatenate")
+    # --- конвертация (MIME-маршрутизация и конвертеры — в рабочих процессах) ---
+    converter = ParallelFileConverter()
+    logger.debug(f"Создан параллельный конвертер: {converter.workers} процессов")
 
     # --- процессоры ---
+    # колонтитулы ищутся по хэшам краёв страниц, а в текстах без \f — по повторам строк,
+    # за один проход вместо remove_repeated_substrings (он работает только со страницами)
+    header_footer = HeaderFooterCleaner()
     cleaner = DocumentCleaner(
         remove_empty_lines=True,
         remove_extra_whitespaces=True,
-        remove_repeated_substrings=True, 
+        remove_repeated_substrings=False,
     )
     splitter = DocumentSplitter(
         split_by="word",
@@ -97,136 +82,121 @@ def create_indexing_pipeline(persist_path: str = "../data/chroma_index") -> Pipe
     )
     
     # --- эмбеддеры ---
-    embedder = SentenceTransformersDocumentEmbedder(
-        settings.EMBEDDER_MODEL
-    )
-    embedding_writer = DocumentWriter(document_store=embedding_store)
+    # батчи из чанков близкой длины; бэкенд (torch или onnx-int8) — из настроек
+    embedder = BucketedDocumentEmbedder(settings.EMBEDDER_MODEL)
+    if settings.EMBEDDING_CACHE_PATH:
+        # эмбеддятся только чанки, которых нет в кэше
+        embedder = CachedDocumentEmbedder(embedder)
+    # при переиндексации файла его чанки перезаписываются, а не вызывают ошибку дубликата
+    embedding_writer = DocumentWriter(document_store=embedding_store, policy=DuplicatePolicy.OVERWRITE)
 
     # --- модифицированные компоненты ---
     overlap_fix = OverlapToStr()
-    enc_split = EncodingSplitter()
-
-    # Инициализируем конвертеры для PDF
-    pdf_router = PDFFastOrOCRRouter()
-    pdf_fast = PyPDFToDocument()
-    ocr_pdf = OCRPDFToDocument()
+    # копии эмбеддятся и записываются один раз
+    dedup = NearDuplicateFilter()
 
     # BM25 индексатор
     bm25_builder = BM25Builder()
 
+    # --- контрольные точки ---
+    # эмбеддинги чанков зависят от модели и параметров нарезки и дедупликации
+    spill = SpillStore(Path(persist_path) / SPILL_DIR)
+    converted_spill = SpillCheckpoint(spill, "converted")
+    embedded_spill = SpillCheckpoint(spill, "embedded", tag="|".join(str(value) for value in (
+        settings.EMBEDDER_MODEL, settings.EMBEDDER_BACKEND, settings.MAX_SPLIT_LENGTH,
+        settings.SPLIT_OVERLAP, settings.DEDUP_THRESHOLD,
+    )))
+
     # Построение пайплайна
     indexing_pipeline = Pipeline()
     logger.debug("Создан пустой пайплайн, добавление компонентов...")
 
     # Добавляем компоненты
-    indexing_pipeline.add_component("router", file_router)
-    indexing_pipeline.add_component("enc_split", enc_split)
-    indexing_pipeline.add_component("txt_utf8", txt_utf8)
-    indexing_pipeline.add_component("txt_cp", txt_cp)
-    indexing_pipeline.add_component("md_converter", md_converter)
-    indexing_pipeline.add_component("csv_converter", csv_converter)
-    indexing_pipeline.add_component("json_converter", json_converter)
-    
-    indexing_pipeline.add_component("pdf_router", pdf_router)
-    indexing_pipeline.add_component("pdf_fast", pdf_fast)
-    indexing_pipeline.add_component("ocr_pdf", ocr_pdf)
-
-    indexing_pipeline.add_component("docx_converter", docx_converter)
-    indexing_pipeline.add_component("xlsx_converter", xlsx_converter)
-    indexing_pipeline.add_component("tika_doc_converter", tika_doc_converter)
-    indexing_pipeline.add_component("tika_epub_converter", tika_epub_converter)
-    indexing_pipeline.add_component("tika_xls_converter", tika_xls_converter)
-    indexing_pipeline.add_component("tika_unclassified_converter", tika_unclassified_converter)
-
-    indexing_pipeline.add_component("join", joiner)
+    indexing_pipeline.add_component("converter", converter)
+    indexing_pipeline.add_component("converted_spill", converted_spill)
+    indexing_pipeline.add_component("header_footer", header_footer)
     indexing_pipeline.add_component("cleaner", cleaner)
     indexing_pipeline.add_component("splitter", splitter)
     indexing_pipeline.add_component("overlap_fix", overlap_fix)
+    indexing_pipeline.add_component("dedup", dedup)
     indexing_pipeline.add_component("embedder", embedder)
+    indexing_pipeline.add_component("embedded_spill", embedded_spill)
     indexing_pipeline.add_component("bm25_builder", bm25_builder)
     indexing_pipeline.add_component("embedding_writer", embedding_writer)
 
-    # ───────── Router → Converters ─────────
+    # Цепочка принимает ОДИН поток документов
     logger.debug("Настройка соединений между компонентами...")
-    # 1. текстовые файлы сначала идут в детектор
-    indexing_pipeline.connect("router.text/plain", "enc_split.sources")
-    # 2. две ветки на разные конвертеры
-    indexing_pipeline.connect("enc_split.utf8", "txt_utf8.sources")
-    indexing_pipeline.connect("enc_split.cp", "txt_cp.sources")
-    
-    indexing_pipeline.connect("router.text/csv", "csv_converter.sources")     # .csv
-    indexing_pipeline.connect("router.text/markdown", "md_converter.sources")    # .md
-    indexing_pipeline.connect("router.application/json", "json_converter.sources")  # .json
-
-    # PDF идут в роутер
-    indexing_pipeline.connect("router.application/pdf", "pdf_router.sources")
-    #    → «быстрые» PDF → PyPDFToDocument
-    indexing_pipeline.connect("pdf_router.fast", "pdf_fast.sources")
-    #    → «сканы» и пустые → OCRPDFToDocument
-    indexing_pipeline.connect("pdf_router.ocr", "ocr_pdf.sources")
-
-    # Office / EPUB / XLS — универсальный Tika
-    indexing_pipeline.connect("router.application/msword",
-                    "tika_doc_converter.sources")                          # .doc
-    indexing_pipeline.connect("router.application/epub+zip",
-                    "tika_epub_converter.sources")                          # .epub
-    indexing_pipeline.connect("router.application/vnd.ms-excel",
-                    "tika_xls_converter.sources")                          # .xls
-
-    # DOCX и XLSX — узкоспециализированные конвертеры
-    indexing_pipeline.connect("router.application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                    "docx_converter.sources")                          # .docx
-    indexing_pipeline.connect("router.application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                    "xlsx_converter.sources")                          # .xlsx
-
-    # Всё, что не распознано (или не перечислено)  →  Tika‑fallback
-    indexing_pipeline.connect("router.unclassified", "tika_unclassified_converter.sources")
-
-
-    # Подключаем каждый конвертер → joiner
-    # 3. оба конвертера → DocumentJoiner
-    indexing_pipeline.connect("txt_utf8.documents", "join.documents")
-    indexing_pipeline.connect("txt_cp.documents", "join.documents")
-    indexing_pipeline.connect("csv_converter.documents", "join.documents")    # .csv
-    indexing_pipeline.connect("md_converter.documents", "join.documents")     # .csv
-    indexing_pipeline.connect("json_converter.documents", "join.documents")   # .json
-    
-    indexing_pipeline.connect("pdf_fast.documents", "join.documents")
-    indexing_pipeline.connect("ocr_pdf.documents", "join.documents")
-    indexing_pipeline.connect("docx_converter.documents", "join.documents")   # .docx
-    indexing_pipeline.connect("xlsx_converter.documents", "join.documents")   # .xlsx
-    indexing_pipeline.connect("tika_doc_converter.documents", "join.documents")   # .doc
-    indexing_pipeline.connect("tika_epub_converter.documents", "join.documents")   # .epub
-    indexing_pipeline.connect("tika_xls_converter.documents", "join.documents")   # .xls
-    indexing_pipeline.connect("tika_unclassified_converter.documents", "join.documents")   # неопределенные
-
-
-    # Остальная цепочка принимает ОДИН поток документов
-    indexing_pipeline.connect("join.documents", "cleaner.documents")
+    indexing_pipeline.connect("converter.documents", "converted_spill.documents")
+    indexing_pipeline.connect("converter.failed", "converted_spill.failed")
+    indexing_pipeline.connect("converted_spill.documents", "header_footer.documents")
+    indexing_pipeline.connect("header_footer.documents", "cleaner.documents")
     indexing_pipeline.connect("cleaner.documents", "splitter.documents")
     indexing_pipeline.connect("splitter.documents", "overlap_fix.documents")
-    indexing_pipeline.connect("overlap_fix.documents", "embedder.documents")
-    indexing_pipeline.connect("embedder.documents", "bm25_builder.documents")
+    indexing_pipeline.connect("overlap_fix.documents", "dedup.documents")
+    indexing_pipeline.connect("dedup.documents", "embedder.documents")
+    indexing_pipeline.connect("embedder.documents", "embedded_spill.documents")
+    indexing_pipeline.connect("converter.failed", "embedded_spill.failed")
+    indexing_pipeline.connect("embedded_spill.documents", "bm25_builder.documents")
     indexing_pipeline.connect("bm25_builder.documents", "embedding_writer.documents")
     
     logger.info("Пайплайн индексации успешно создан и настроен")
     return indexing_pipeline
 
 
-def run_indexing(file_paths: Optional[List[str]] = None, data_dir: str = "../data/downloaded_files"):
+def run_indexing(
+    file_paths: Optional[List[str]] = None,
+    data_dir: str = "../data/downloaded_files",
+    bm25_path: str = settings.BM25_INDEX_PATH,
+    persist_path: str = settings.CHROMA_INDEX_PATH,
+    sources: Optional[List[str]] = None,
+    retry_failed: bool = False,
+):
     """
     Запускает индексацию для указанных файлов или всех файлов в каталоге.
+
+    Файлы раскладываются по источникам (cms, lists, filestorage — по поддиректории
+    в data_dir, файлы из корня относятся к filestorage), и каждый источник
+    индексируется в свой шард: persist_path/<источник> и bm25_path/<источник>.
+    Шарды не пересекаются, поэтому переиндексация одного источника не блокирует
+    поиск и индексацию остальных.
+
+    Индексация инкрементальная (см. FileManifest): неизменные файлы пропускаются,
+    у изменённых старые чанки удаляются из Chroma и BM25 после того, как записаны
+    новые (в той же пачке). Если file_paths не указан (индексируется весь
+    data_dir), из индекса удаляются и чанки файлов, которых больше нет на диске.
+
+    Прерванная индексация продолжается с незавершённой пачки (см. _index_source).
+    С retry_failed индексируются только файлы, которые не удалось
+    сконвертировать в прошлых запусках (например, после исправления конвертера).
     
     Args:
         file_paths: Список путей к файлам для индексации.
         data_dir: Директория с файлами (если file_paths не указан).
+        bm25_path: Директория для сохранения BM25-индекса.
+        persist_path: Директория для сохранения индекса Chroma.
+        sources: Какие источники индексировать (по умолчанию все найденные).
+        retry_failed: Индексировать только несконвертированные ранее файлы (file_paths не используется).
     """
+    # индекс, собранный до разделения по источникам, становится шардом filestorage
+    adopt_root_index(persist_path)
+    adopt_root_index(bm25_path)
+
+    if retry_failed:
+        file_paths = [
+            path
+            for source in sources or SOURCES
+            for path in SpillStore(shard_path(persist_path, source) / SPILL_DIR).failed()
+        ]
+        logger.info(f"Повтор файлов, которые не удалось сконвертировать: {len(file_paths)}")
+        if not file_paths:
+            return
     logger.info(f"Запуск индексации, указано файлов: {len(file_paths) if file_paths else 0}")
     
-    if not file_paths:
-        # Если пути не указаны, берем все файлы из директории
+    full_scan = not file_paths
+    if full_scan:
+        # Если пути не указаны, берем все файлы из директории и поддиректорий источников
         logger.info(f"Поиск файлов в директории: {data_dir}")
-        file_paths = [os.path.join(data_dir, name) for name in os.listdir(data_dir)]
+        file_paths = list_source_files(data_dir)
         logger.info(f"Найдено файлов: {len(file_paths)}")
     
     # Проверяем, что файлы существуют
@@ -243,33 +213,242 @@ def run_indexing(file_paths: Optional[List[str]] = None, data_dir: str = "../dat
         if len(missing_files) > 5:
             logger.warning(f"...и еще {len(missing_files) - 5} файлов")
     
-    if not existing_files:
+    groups = group_by_source(existing_files, data_dir)
+    if full_scan:
+        # источники, все файлы которых удалены, тоже нужно вычистить из индекса
+        for source in SOURCES:
+            if (shard_path(persist_path, source) / MANIFEST_FILE).exists():
+                groups.setdefault(source, [])
+    if sources:
+        groups = {source: files for source, files in groups.items() if source in sources}
+
+    if not groups:
         logger.error("Нет файлов для индексации")
         return
     
-    # Выводим статистику по файлам
-    logger.info(f"Начинаем индексацию {len(existing_files)} файлов")
-    
-    # Выводим информацию о размерах файлов
-    total_size = sum(os.path.getsize(path) for path in existing_files)
-    avg_size = total_size / len(existing_files) if existing_files else 0
-    logger.info(f"Общий размер файлов: {total_size/1024/1024:.2f} МБ, средний размер: {avg_size/1024:.2f} КБ")
-    
-    # Создаем и запускаем пайплайн
+    for source, source_files in groups.items():
+        _index_source(
+            source,
+            source_files,
+            persist_path=str(shard_path(persist_path, source)),
+            bm25_path=str(shard_path(bm25_path, source)),
+            purge_missing=full_scan,
+        )
+
+
+def iter_batches(changes: List[FileChange], max_files: int, max_bytes: int) -> Iterator[List[FileChange]]:
+    """
+    Режет список файлов на пачки не больше max_files файлов и max_bytes байт.
+
+    Файл крупнее max_bytes идёт отдельной пачкой.
+
+    Args:
+        changes: Файлы для индексации.
+        max_files: Максимум файлов в пачке.
+        max_bytes: Максимальный суммарный размер файлов пачки.
+
+    Yields:
+        List[FileChange]: Очередная пачка.
+    """
+    batch: List[FileChange] = []
+    batch_bytes = 0
+    for change in changes:
+        if batch and (len(batch) >= max_files or batch_bytes + change.size > max_bytes):
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.append(change)
+        batch_bytes += change.size
+    if batch:
+        yield batch
+
+
+def _index_source(
+    source: str,
+    files: List[str],
+    persist_path: str,
+    bm25_path: str,
+    purge_missing: bool,
+    batch_files: int = settings.INDEX_BATCH_FILES,
+    batch_bytes: int = settings.INDEX_BATCH_MB * 1024 * 1024,
+) -> None:
+    """
+    Индексирует новые и изменённые файлы одного источника в его шард.
+
+    Файлы подаются в пайплайн пачками (см. iter_batches): каждая пачка
+    конвертируется, эмбеддится и записывается в Chroma и BM25 до того, как
+    читается следующая, поэтому в памяти одновременно находятся документы только
+    одной пачки, а после сбоя записанные пачки уже учтены в манифесте.
+
+    Прежние чанки изменённого файла удаляются из Chroma и BM25 только после того,
+    как пачка с его новыми чанками записана и учтена в манифесте: если запуск
+    упал или файл не сконвертировался, в индексе остаётся его прежняя версия.
+    Чанки, которые остаются каноническими копиями ещё не переиндексированных
+    файлов, удаляются вместе с пачкой последнего из них (см. FileManifest.unreferenced).
+
+    Сконвертированные документы и чанки с эмбеддингами незавершённой пачки
+    сохраняются в SpillStore (ключ — SHA-256 файла), поэтому повторный запуск
+    после сбоя продолжает с прерванной пачки, не повторяя OCR и эмбеддинг.
+    Записи удаляются, как только пачка учтена в манифесте. Файлы, которые не
+    удалось сконвертировать, запоминаются в SpillStore (см. run_indexing, retry_failed).
+    """
+    manifest = FileManifest(Path(persist_path) / MANIFEST_FILE)
+    changes = manifest.changes(files)
+    deleted = manifest.missing(files) if purge_missing else []
+    logger.info(
+        f"Источник {source}: файлов {len(files)}, новых или изменённых {len(changes)}, "
+        f"без изменений {len(files) - len(changes)}, удалённых {len(deleted)}"
+    )
+    if not changes and not deleted:
+        manifest.save()  # могли обновиться mtime перезаписанных без изменений файлов
+        return
+
+    # Создаем пайплайн (один на все пачки: модели загружаются один раз)
     logger.info("Создание пайплайна индексации...")
-    pipeline = create_indexing_pipeline()
+    pipeline = create_indexing_pipeline(persist_path=persist_path)
+    bm25_index = pipeline.get_component("bm25_builder").open_index(bm25_path)
+    converter = pipeline.get_component("converter")
+    embedder = pipeline.get_component("embedder")
+
+    document_store = pipeline.get_component("embedding_writer").document_store
+
+    def delete_stale(old_ids: List[str], written: Set[str]) -> None:
+        """Удаляет из Chroma и BM25 прежние чанки, на которые больше не ссылается манифест."""
+        stale_ids = [chunk_id for chunk_id in manifest.unreferenced(old_ids) if chunk_id not in written]
+        if stale_ids:
+            logger.info(f"Удаление {len(stale_ids)} устаревших чанков из Chroma и BM25")
+            document_store.delete_documents(stale_ids)
+            bm25_index.delete(stale_ids)
+
+    # файлы, чьи копии хранились в устаревающих канонических чанках, индексируются заново
+    stale_ids = [chunk_id for change in changes for chunk_id in change.old_chunk_ids]
+    stale_ids += [chunk_id for key in deleted for chunk_id in manifest.chunk_ids(key)]
+    while True:
+        dependent = manifest.dependents(stale_ids, exclude=[change.path for change in changes] + deleted)
+        if not dependent:
+            break
+        logger.info(f"Переиндексация {len(dependent)} файлов, чьи дубликаты удаляются вместе с изменёнными")
+        changes += dependent
+        stale_ids += [chunk_id for change in dependent for chunk_id in change.old_chunk_ids]
+
+    # у удалённых с диска файлов новых чанков не будет — их чанки удаляются сразу
+    if deleted:
+        deleted_ids = [chunk_id for key in deleted for chunk_id in manifest.chunk_ids(key)]
+        for key in deleted:
+            manifest.forget(key)
+        delete_stale(deleted_ids, written=set())
+        manifest.save()
+
+    if not changes:
+        bm25_index.wait_for_merge()
+        return
+
+    # Выводим информацию о размерах файлов
+    total_size = sum(change.size for change in changes)
+    logger.info(f"Общий размер файлов: {total_size/1024/1024:.2f} МБ, "
+                f"средний размер: {total_size/len(changes)/1024:.2f} КБ")
     
+    # одноимённые файлы (копии из разных папок) попадают в одну пачку и дедуплицируются
+    changes.sort(key=lambda change: (os.path.basename(change.path).lower(), change.size))
+
     logger.info("Запуск процесса индексации...")
     start_time = time.time()
+    done_files = 0
+    # замеры компонентов с разбивкой по MIME-маршрутам — в persist_path/reports
+    profiler = PipelineProfiler(pipeline, route_of=converter.route_of)
+
+    def save_report(status: str) -> None:
+        path, report = profiler.save(
+            persist_path,
+            source=source,
+            status=status,
+            files=len(changes),
+            indexed_files=done_files,
+            bytes=total_size,
+            settings={key: getattr(settings, key) for key in (
+                "CONVERT_WORKERS", "OCR_WORKERS", "EMBEDDER_MODEL", "EMBEDDER_BACKEND", "EMBEDDER_BATCH_SIZE",
+                "EMBEDDER_WORKERS", "INDEX_BATCH_FILES", "INDEX_BATCH_MB", "DEDUP_THRESHOLD",
+            )},
+            routes=converter.route_stats,
+            converter_stats=dict(converter.stats),
+        )
+        slowest = sorted(report["components"].items(), key=lambda item: -item[1]["seconds"])[:3]
+        logger.info(
+            f"Отчёт о производительности: {path} (дольше всего: "
+            + ", ".join(f"{name} {stats['seconds']:.1f} сек" for name, stats in slowest) + ")"
+        )
     
-    try:
-        pipeline.run({"router": {"sources": existing_files}})
-        
-        # Вычисляем время выполнения
-        execution_time = time.time() - start_time
-        logger.info(f"Индексация завершена успешно. Проиндексировано {len(existing_files)} файлов за {execution_time:.2f} сек " 
-                    f"({execution_time/len(existing_files):.2f} сек/файл)")
-        
-    except Exception as e:
-        logger.error(f"Ошибка при индексации файлов: {str(e)}")
-        raise 
\ No newline at end of file
+    spill = pipeline.get_component("converted_spill").store
+    embedded_tag = pipeline.get_component("embedded_spill").tag
+    for batch_no, batch in enumerate(iter_batches(changes, batch_files, batch_bytes), 1):
+        # результаты стадий, сохранённые прерванным запуском, не пересчитываются
+        hashes = {change.path: change.sha256 for change in batch}
+        embedded, converted, to_embed, to_convert = [], [], {}, {}
+        for path, file_hash in hashes.items():
+            restored = spill.load("embedded", path, file_hash, embedded_tag)
+            if restored is not None:
+                embedded.extend(restored)
+                continue
+            to_embed[path] = file_hash
+            restored = spill.load("converted", path, file_hash)
+            if restored is not None:
+                converted.extend(restored)
+            else:
+                to_convert[path] = file_hash
+        if len(to_convert) < len(batch):
+            logger.info(
+                f"Пачка {batch_no}: из контрольных точек восстановлено файлов — "
+                f"с эмбеддингами {len(batch) - len(to_embed)}, сконвертированных {len(to_embed) - len(to_convert)}"
+            )
+
+        try:
+            result = pipeline.run(
+                {
+                    "converter": {"sources": list(to_convert)},
+                    "converted_spill": {"restored": converted, "file_hashes": to_convert},
+                    "embedded_spill": {"restored": embedded, "file_hashes": to_embed},
+                    "bm25_builder": {"path": bm25_path},
+                },
+                include_outputs_from={"converter", "bm25_builder"},
+            )
+        except Exception as e:
+            logger.error(
+                f"Ошибка при индексации пачки {batch_no} источника {source}: {str(e)}. "
+                f"Повторный запуск продолжит с этой пачки"
+            )
+            save_report("failed")
+            converter.close()
+            embedder.close()
+            raise
+
+        written = result["bm25_builder"]["documents"]
+        chunks = assign_chunks(written, batch)
+        # несконвертированные файлы не попадают в манифест и повторяются при следующем
+        # запуске, а их прежние чанки остаются в индексе
+        failed = {FileManifest.key(path) for path in result["converter"]["failed"]}
+        recorded = [change for change in batch if change.path not in failed]
+        for change in recorded:
+            manifest.record(change, chunks[change.path])
+        # новые чанки уже записаны — теперь можно убрать прежние
+        delete_stale(
+            [chunk_id for change in recorded for chunk_id in change.old_chunk_ids],
+            written={doc.id for doc in written},
+        )
+        manifest.save()
+        spill.update_failed(failed, done=[change.path for change in batch if change.path not in failed])
+        spill.discard(hashes.items())
+        del result, written, chunks, embedded, converted
+
+        done_files += len(batch)
+        logger.info(f"Пачка {batch_no}: записано {len(batch)} файлов, всего {done_files}/{len(changes)}")
+
+    # Вычисляем время выполнения
+    execution_time = time.time() - start_time
+    logger.info(f"Индексация источника {source} завершена успешно. Проиндексировано {len(changes)} файлов "
+                f"за {execution_time:.2f} сек ({execution_time/len(changes):.2f} сек/файл)")
+    if converter.stats:
+        logger.info(f"OCR-кэш источника {source}: попаданий {converter.stats['ocr_cache_hits']}, "
+                    f"промахов {converter.stats['ocr_cache_misses']}")
+    save_report("ok")
+    converter.close()
+    embedder.close()
+    bm25_index.wait_for_merge()
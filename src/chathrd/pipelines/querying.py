@@ -5,7 +5,7 @@
 
 import logging
 import time
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 
 from haystack import Pipeline
 from haystack.dataclasses import ChatMessage
@@ -16,14 +16,16 @@ from haystack.components.joiners.document_joiner import DocumentJoiner
 from haystack.components.rankers import TransformersSimilarityRanker
 from haystack.utils import Secret
 from haystack_integrations.document_stores.chroma import ChromaDocumentStore
-from haystack_integrations.components.retrievers.chroma import ChromaQueryTextRetriever
 
 from chathrd.components.classifiers.query_classifiers import QueryClassifierLLM, QueryDecomposerLLM
 from chathrd.components.processors.document_processors import QueryCleaner
-from chathrd.components.retrievers.bm25_retriever import PickledBM25Retriever
+from chathrd.components.retrievers.bm25_retriever import SegmentedBM25Retriever
+from chathrd.components.retrievers.chroma_retriever import BatchChromaQueryTextRetriever
+from chathrd.components.retrievers.sharded_retrievers import ShardedBM25Retriever, ShardedChromaRetriever
 from chathrd.components.generators.multi_query_handler import MultiQueryHandler
 from chathrd.components.selectors.response_selector import ResponseSelector
 from chathrd.config.settings import settings
+from chathrd.utils.sources import discover_shards
 
 logger = logging.getLogger(__name__)
 
@@ -32,7 +34,7 @@ def create_querying_pipeline(
     model_name: str = "hf.co/IlyaGusev/saiga_yandexgpt_8b_gguf:Q4_0",
     api_url: str = "http://localhost:11434/v1",
     persist_path: str = "../data/chroma_index",
-    bm25_path: str = "../data/bm25.pkl",
+    bm25_path: str = "../data/bm25_index",
 ) -> Pipeline:
     """
     Создает и настраивает пайплайн для обработки запросов.
@@ -89,13 +91,24 @@ def create_querying_pipeline(
 
     # Настраиваем компоненты поиска
     logger.debug("Инициализация компонентов поиска...")
-    ds = ChromaDocumentStore(persist_path=persist_path)
-    logger.debug(f"Инициализировано хранилище Chroma: {persist_path}")
-    
-    bm25 = PickledBM25Retriever(ds, bm25_path, top_k=5)
-    logger.debug(f"Инициализирован BM25 ретривер: {bm25_path}")
-    
-    chroma = ChromaQueryTextRetriever(document_store=ds, top_k=5)
+    # у каждого источника (cms, lists, filestorage) свой шард Chroma и свой BM25-индекс
+    stores = {
+        source: ChromaDocumentStore(persist_path=str(path))
+        for source, path in discover_shards(persist_path).items()
+    }
+    logger.debug(f"Инициализированы хранилища Chroma: {persist_path}, источники: {list(stores)}")
+
+    bm25_shards = {
+        source: SegmentedBM25Retriever(stores[source], str(path), top_k=5)
+        for source, path in discover_shards(bm25_path, list(stores)).items()
+    }
+    bm25 = ShardedBM25Retriever(bm25_shards, top_k=5)
+    logger.debug(f"Инициализирован BM25 ретривер: {bm25_path}, источники: {list(bm25_shards)}")
+
+    chroma = ShardedChromaRetriever(
+        {source: BatchChromaQueryTextRetriever(document_store=ds, top_k=5) for source, ds in stores.items()},
+        top_k=5,
+    )
     joiner = DocumentJoiner(join_mode="reciprocal_rank_fusion", top_k=10)
     ranker = TransformersSimilarityRanker(
         model=settings.RANKER_MODEL, 
@@ -219,13 +232,19 @@ def create_querying_pipeline(
     return pipe
 
 
-def process_query(query: str, pipeline: Optional[Pipeline] = None) -> Dict:
+def process_query(
+    query: str,
+    pipeline: Optional[Pipeline] = None,
+    sources: Optional[List[str]] = None,
+) -> Dict:
     """
     Обрабатывает запрос и возвращает ответ.
     
     Args:
         query: Текст запроса.
         pipeline: Опционально - готовый пайплайн для запросов (иначе создается новый).
+        sources: Опционально - источники (cms, lists, filestorage), в которых искать;
+            поиск обращается только к их шардам.
         
     Returns:
         Dict: Словарь с ответом.
@@ -245,7 +264,11 @@ def process_query(query: str, pipeline: Optional[Pipeline] = None) -> Dict:
     start_time = time.time()
     
     try:
-        result = pipeline.run({"query": query})
+        inputs = {"query": query}
+        if sources:
+            # уходит во все компоненты поиска со входом sources
+            inputs["sources"] = sources
+        result = pipeline.run(inputs)
         execution_time = time.time() - start_time
         
         answer_length = len(result["selector"]["answer"])
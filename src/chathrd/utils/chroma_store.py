@@ -0,0 +1,71 @@
+"""Чтение из ChromaDocumentStore, не привязанное к его внутреннему устройству."""
+
+import logging
+from dataclasses import replace
+from typing import List
+
+from haystack import Document
+from haystack_integrations.document_stores.chroma import ChromaDocumentStore
+
+logger = logging.getLogger(__name__)
+
+
+class ChromaStoreReader:
+    """
+    Обёртка над ChromaDocumentStore для выборки документов по id и метрики расстояния.
+
+    Публичный filter_documents фильтрует id только оператором "==" (ни "in", ни
+    "OR" по id chroma-haystack не поддерживает) и всегда тянет эмбеддинги, поэтому
+    документы читаются одним запросом к коллекции Chroma через внутренние члены
+    хранилища. Они есть в chroma-haystack 4.x — эта ветка зафиксирована в
+    pyproject.toml. Если в установленной версии их всё же нет, обёртка один раз
+    пишет предупреждение и дальше работает через filter_documents по одному id —
+    медленнее, но с тем же результатом.
+    """
+
+    def __init__(self, store: ChromaDocumentStore):
+        self.store = store
+        self._fast = all(
+            hasattr(store, name)
+            for name in ("_ensure_initialized", "_collection", "_get_result_to_documents")
+        )
+        if not self._fast:
+            logger.warning(
+                "ChromaDocumentStore без ожидаемых внутренних методов: "
+                "документы загружаются по одному через filter_documents",
+            )
+
+    def get_documents(self, ids: List[str]) -> List[Document]:
+        """
+        Загружает документы по id, без эмбеддингов.
+
+        Args:
+            ids: Id документов.
+
+        Returns:
+            List[Document]: Найденные документы (отсутствующие id пропускаются).
+        """
+        if not ids:
+            return []
+        if self._fast:
+            try:
+                return self._get_direct(ids)
+            except (AttributeError, TypeError) as e:
+                logger.warning(f"Прямое чтение коллекции Chroma не удалось ({e}), переходим на filter_documents")
+                self._fast = False
+        docs = []
+        for doc_id in ids:
+            for doc in self.store.filter_documents({"field": "id", "operator": "==", "value": doc_id}):
+                docs.append(replace(doc, embedding=None))
+        return docs
+
+    def _get_direct(self, ids: List[str]) -> List[Document]:
+        store = self.store
+        store._ensure_initialized()
+        result = store._collection.get(ids=ids, include=["documents", "metadatas"])
+        return store._get_result_to_documents(result)
+
+    @property
+    def distance_function(self) -> str:
+        """Метрика расстояния коллекции (l2, cosine или ip) из публичного to_dict."""
+        return self.store.to_dict()["init_parameters"].get("distance_function", "l2")
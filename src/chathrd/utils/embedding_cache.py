@@ -0,0 +1,88 @@
+"""Постоянный кэш эмбеддингов чанков, адресуемый по содержимому."""
+
+import hashlib
+import logging
+import sqlite3
+from collections.abc import Iterable
+from pathlib import Path
+from typing import Dict, List, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """
+    Кэш эмбеддингов в SQLite: ключ — хэш имени модели и текста чанка, значение —
+    вектор float16 (вдвое компактнее float32, для косинусной близости этой
+    точности достаточно). База работает в режиме WAL, поэтому ею могут
+    пользоваться несколько процессов индексации.
+    """
+
+    # ограничение SQLite на число параметров запроса
+    _BATCH = 500
+
+    def __init__(self, path: Union[str, Path]):
+        """
+        Открывает (или создаёт) кэш.
+
+        Args:
+            path: Путь к файлу базы SQLite.
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS vectors (key TEXT PRIMARY KEY, vec BLOB NOT NULL)")
+        self._conn.commit()
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        """
+        Ключ эмбеддинга.
+
+        Args:
+            model: Имя модели (и параметры, влияющие на вектор).
+            text: Текст, который эмбеддится.
+
+        Returns:
+            str: SHA-256 в шестнадцатеричном виде.
+        """
+        return hashlib.sha256(f"{model}\0{text}".encode()).hexdigest()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, np.ndarray]:
+        """
+        Возвращает найденные векторы.
+
+        Args:
+            keys: Ключи эмбеддингов.
+
+        Returns:
+            Dict[str, np.ndarray]: Векторы float16 для найденных ключей.
+        """
+        keys = list(dict.fromkeys(keys))
+        found: Dict[str, np.ndarray] = {}
+        for start in range(0, len(keys), self._BATCH):
+            batch = keys[start:start + self._BATCH]
+            rows = self._conn.execute(
+                f"SELECT key, vec FROM vectors WHERE key IN ({','.join('?' * len(batch))})", batch,
+            )
+            found.update((key, np.frombuffer(vec, dtype=np.float16)) for key, vec in rows)
+        return found
+
+    def put_many(self, items: Dict[str, np.ndarray]) -> None:
+        """
+        Сохраняет векторы.
+
+        Args:
+            items: Векторы по ключам (приводятся к float16).
+        """
+        rows: List[tuple] = [
+            (key, np.asarray(vec, dtype=np.float16).tobytes()) for key, vec in items.items()
+        ]
+        self._conn.executemany("INSERT OR REPLACE INTO vectors (key, vec) VALUES (?, ?)", rows)
+        self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.close()
@@ -0,0 +1,243 @@
+"""Манифест проиндексированных файлов для инкрементальной индексации."""
+
+import hashlib
+import json
+import logging
+import os
+from collections.abc import Iterable
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "indexed_files.json"
+MANIFEST_VERSION = 1
+
+
+def file_sha256(path: Union[str, Path], chunk_size: int = 1 << 20) -> str:
+    """
+    Считает SHA-256 содержимого файла, читая его блоками.
+
+    Args:
+        path: Путь к файлу.
+        chunk_size: Размер блока чтения в байтах.
+
+    Returns:
+        str: Хэш в шестнадцатеричном виде.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class FileChange:
+    """Файл, который нужно (пере)индексировать: его состояние на момент проверки."""
+
+    def __init__(self, path: str, size: int, mtime_ns: int, sha256: str, old_chunk_ids: List[str]):
+        self.path = path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.sha256 = sha256
+        self.old_chunk_ids = old_chunk_ids
+
+
+class FileManifest:
+    """
+    Манифест шарда индекса: для каждого проиндексированного файла хранит путь,
+    размер, mtime, SHA-256 содержимого и id чанков, записанных в Chroma и BM25.
+
+    Файл считается неизменным, если совпадают размер и mtime; иначе сравнивается
+    хэш содержимого (например, файл скачали заново без изменений). Манифест
+    записывается атомарно (временный файл + os.replace) после успешной индексации,
+    поэтому при сбое файлы просто переиндексируются при следующем запуске.
+
+    Формат:
+        {"version": 1, "files": {"<путь>": {"size": ..., "mtime_ns": ...,
+                                            "sha256": "...", "chunk_ids": [...]}}}
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        """
+        Загружает манифест (или создаёт пустой, если файла нет).
+
+        Args:
+            path: Путь к файлу манифеста.
+        """
+        self.path = Path(path)
+        self.files: Dict[str, Dict] = {}
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                self.files = data["files"]
+            else:
+                logger.warning(
+                    f"{self.path}: версия манифеста {data.get('version')} не поддерживается, "
+                    f"все файлы будут переиндексированы",
+                )
+
+    @staticmethod
+    def key(path: Union[str, Path]) -> str:
+        """Ключ файла в манифесте — абсолютный путь."""
+        return os.path.abspath(path)
+
+    def changes(self, file_paths: Iterable[str]) -> List[FileChange]:
+        """
+        Отбирает новые и изменившиеся файлы.
+
+        Args:
+            file_paths: Пути к файлам.
+
+        Returns:
+            List[FileChange]: Файлы, которые нужно индексировать, с id их прежних чанков.
+        """
+        changed = []
+        for path in file_paths:
+            key = self.key(path)
+            st = os.stat(key)
+            entry = self.files.get(key)
+            if entry and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+                continue
+            sha256 = file_sha256(key)
+            if entry and entry["sha256"] == sha256:
+                # содержимое то же (файл перезаписан) — запоминаем новый mtime и не индексируем
+                entry["size"], entry["mtime_ns"] = st.st_size, st.st_mtime_ns
+                continue
+            changed.append(FileChange(key, st.st_size, st.st_mtime_ns, sha256, entry["chunk_ids"] if entry else []))
+        return changed
+
+    def missing(self, file_paths: Iterable[str]) -> List[str]:
+        """
+        Возвращает файлы манифеста, которых нет среди file_paths (удалённые с диска).
+
+        Args:
+            file_paths: Пути ко всем текущим файлам шарда.
+
+        Returns:
+            List[str]: Ключи удалённых файлов.
+        """
+        current = {self.key(path) for path in file_paths}
+        return [key for key in self.files if key not in current]
+
+    def dependents(self, chunk_ids: Iterable[str], exclude: Iterable[str]) -> List[FileChange]:
+        """
+        Отбирает файлы, которые делят с удаляемыми чанками канонические копии.
+
+        После дедупликации один чанк записывается в манифест всех файлов-копий;
+        если он удаляется вместе с изменённым файлом, остальные копии нужно
+        переиндексировать, иначе их текст пропадёт из индекса.
+
+        Args:
+            chunk_ids: Id удаляемых чанков.
+            exclude: Ключи файлов, которые и так индексируются или удаляются.
+
+        Returns:
+            List[FileChange]: Файлы для переиндексации с id их прежних чанков.
+        """
+        stale = set(chunk_ids)
+        skip = set(exclude)
+        dependent = []
+        for key, entry in self.files.items():
+            if key in skip or stale.isdisjoint(entry["chunk_ids"]) or not os.path.exists(key):
+                continue
+            st = os.stat(key)
+            dependent.append(FileChange(key, st.st_size, st.st_mtime_ns, file_sha256(key), entry["chunk_ids"]))
+        return dependent
+
+    def unreferenced(self, chunk_ids: Iterable[str]) -> List[str]:
+        """
+        Отбирает чанки, на которые не ссылается ни один файл манифеста.
+
+        Прежние чанки переиндексированного файла удаляются из индекса, только если
+        они не совпали с новыми и не остались каноническими копиями других файлов
+        (те ещё ждут своей переиндексации, см. dependents).
+
+        Args:
+            chunk_ids: Id прежних чанков.
+
+        Returns:
+            List[str]: Id чанков, которые можно удалить из Chroma и BM25.
+        """
+        candidates = dict.fromkeys(chunk_ids)
+        for entry in self.files.values():
+            for chunk_id in entry["chunk_ids"]:
+                candidates.pop(chunk_id, None)
+        return list(candidates)
+
+    def chunk_ids(self, key: str) -> List[str]:
+        entry = self.files.get(key)
+        return list(entry["chunk_ids"]) if entry else []
+
+    def record(self, change: FileChange, chunk_ids: List[str]) -> None:
+        """
+        Запоминает проиндексированный файл.
+
+        Args:
+            change: Состояние файла на момент проверки.
+            chunk_ids: Id записанных чанков.
+        """
+        self.files[change.path] = {
+            "size": change.size,
+            "mtime_ns": change.mtime_ns,
+            "sha256": change.sha256,
+            "chunk_ids": chunk_ids,
+        }
+
+    def forget(self, key: str) -> None:
+        self.files.pop(key, None)
+
+    def save(self) -> None:
+        """Атомарно записывает манифест на диск."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "files": self.files}, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+
+def assign_chunks(documents: Iterable, changes: List[FileChange]) -> Dict[str, List[str]]:
+    """
+    Раскладывает записанные чанки по исходным файлам по meta["file_path"].
+
+    Конвертеры сохраняют полный путь к файлу; если какой-то конвертер оставил
+    только имя файла, чанк сопоставляется по имени, когда оно однозначно.
+    Каноническая копия дубликатов (см. NearDuplicateFilter) относится также ко
+    всем файлам из meta["duplicate_sources"].
+
+    Args:
+        documents: Записанные чанки.
+        changes: Индексированные файлы.
+
+    Returns:
+        Dict[str, List[str]]: Id чанков для каждого файла (ключ манифеста).
+    """
+    chunks: Dict[str, List[str]] = {change.path: [] for change in changes}
+    by_name: Dict[str, Optional[str]] = {}
+    for change in changes:
+        name = os.path.basename(change.path)
+        by_name[name] = None if name in by_name else change.path
+
+    def resolve(file_path: Optional[str]) -> Optional[str]:
+        key = FileManifest.key(file_path) if file_path else None
+        if file_path and key not in chunks:
+            key = by_name.get(os.path.basename(file_path))
+        return key if key in chunks else None
+
+    unmatched = 0
+    for doc in documents:
+        key = resolve(doc.meta.get("file_path"))
+        if key is None:
+            unmatched += 1
+            continue
+        chunks[key].append(doc.id)
+        for path in filter(None, doc.meta.get("duplicate_sources", "").split("\n")):
+            key = resolve(path)
+            if key is not None:
+                chunks[key].append(doc.id)
+    if unmatched:
+        logger.warning(f"{unmatched} чанков не сопоставлены с исходными файлами и не попадут в манифест")
+    return chunks
@@ -59,13 +59,13 @@ def get_index_dir(index_dir: Optional[str] = None) -> Path:
 
 def get_bm25_path(bm25_path: Optional[str] = None) -> Path:
     """
-    Возвращает путь к файлу индекса BM25.
+    Возвращает путь к директории индекса BM25.
     
     Args:
-        bm25_path: Опционально - путь к файлу индекса BM25.
+        bm25_path: Опционально - путь к директории индекса BM25.
         
     Returns:
-        Path: Путь к файлу индекса BM25.
+        Path: Путь к директории индекса BM25.
     """
     if bm25_path:
         path = Path(bm25_path)
@@ -75,9 +75,9 @@ def get_bm25_path(bm25_path: Optional[str] = None) -> Path:
         if env_bm25_path:
             path = Path(env_bm25_path)
         else:
-            # По умолчанию используем data/bm25.pkl относительно корня проекта
-            path = get_data_dir() / "bm25.pkl"
+            # По умолчанию используем data/bm25_index/ относительно корня проекта
+            path = get_data_dir() / "bm25_index"
     
-    # Создаем родительскую директорию, если она не существует
-    path.parent.mkdir(parents=True, exist_ok=True)
+    # Создаем директорию, если она не существует
+    path.mkdir(parents=True, exist_ok=True)
     return path 
\ No newline at end of file
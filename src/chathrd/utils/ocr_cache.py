@@ -0,0 +1,98 @@
+"""Постоянный кэш результатов OCR по страницам PDF."""
+
+import hashlib
+import logging
+import sqlite3
+import time
+from pathlib import Path
+from typing import Optional, Union
+
+logger = logging.getLogger(__name__)
+
+
+class OCRCache:
+    """
+    Кэш распознанного текста страниц в SQLite.
+
+    Ключ — SHA-256 содержимого PDF, номер страницы и параметры распознавания,
+    поэтому неизменные сканы при переиндексации не распознаются заново, а смена
+    параметров OCR не возвращает устаревший текст. База работает в режиме WAL,
+    так что ею одновременно пользуются все процессы конвертации. Когда суммарный
+    размер записей превышает max_bytes, удаляются давно не использованные записи.
+    """
+
+    # проверять размер кэша после стольких записей
+    EVICT_EVERY = 100
+
+    def __init__(self, path: Union[str, Path], max_bytes: int):
+        """
+        Открывает (или создаёт) кэш.
+
+        Args:
+            path: Путь к файлу базы SQLite.
+            max_bytes: Максимальный суммарный размер записей в байтах.
+        """
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "key TEXT PRIMARY KEY, text TEXT NOT NULL, size INTEGER NOT NULL, used REAL NOT NULL)",
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS pages_used ON pages(used)")
+        self._puts = 0
+        self.evict()
+
+    @staticmethod
+    def key(file_hash: str, page_no: int, params: str) -> str:
+        """
+        Ключ страницы.
+
+        Args:
+            file_hash: SHA-256 содержимого PDF.
+            page_no: Номер страницы (с 1).
+            params: Параметры распознавания, влияющие на результат.
+
+        Returns:
+            str: Ключ записи.
+        """
+        return hashlib.sha256(f"{file_hash}:{page_no}:{params}".encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Возвращает текст страницы или None, если его нет в кэше."""
+        row = self._conn.execute("SELECT text FROM pages WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self._conn.execute("UPDATE pages SET used = ? WHERE key = ?", (time.time(), key))
+        return row[0]
+
+    def put(self, key: str, text: str) -> None:
+        """Сохраняет текст страницы."""
+        size = len(key) + len(text.encode("utf-8"))
+        self._conn.execute(
+            "INSERT OR REPLACE INTO pages (key, text, size, used) VALUES (?, ?, ?, ?)",
+            (key, text, size, time.time()),
+        )
+        self._puts += 1
+        if self._puts % self.EVICT_EVERY == 0:
+            self.evict()
+
+    def evict(self) -> None:
+        """Удаляет давно не использованные записи, пока размер кэша не станет ≤ 90% max_bytes."""
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - int(self.max_bytes * 0.9)
+        freed, keys = 0, []
+        for key, size in self._conn.execute("SELECT key, size FROM pages ORDER BY used"):
+            keys.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self._conn.executemany("DELETE FROM pages WHERE key = ?", keys)
+        logger.info(f"OCR-кэш {self.path.name}: удалено {len(keys)} записей ({freed / 2**20:.1f} МБ)")
+
+    def close(self) -> None:
+        self._conn.close()
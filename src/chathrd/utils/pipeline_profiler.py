@@ -0,0 +1,183 @@
+"""Профилирование компонентов пайплайна индексации."""
+
+import functools
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from collections.abc import Iterable
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+from haystack import Document, Pipeline
+from haystack.dataclasses import ByteStream
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+REPORTS_DIR = "reports"
+
+
+def peak_rss_mb() -> float:
+    """Пиковый RSS текущего процесса в МБ (0, если платформа его не сообщает)."""
+    if resource is None:
+        return 0.0
+    # ru_maxrss — в КБ на Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _item_path(item: Any) -> Optional[str]:
+    if isinstance(item, Document):
+        return item.meta.get("file_path")
+    if isinstance(item, ByteStream):
+        return item.meta.get("file_path")
+    if isinstance(item, (str, Path)):
+        return str(item)
+    return None
+
+
+def _item_bytes(item: Any) -> int:
+    """Размер элемента: текст документа в UTF-8, данные ByteStream или размер файла по пути."""
+    if isinstance(item, Document):
+        return len(item.content.encode("utf-8")) if item.content else 0
+    if isinstance(item, ByteStream):
+        return len(item.data)
+    if isinstance(item, (str, Path)) and os.path.isfile(item):
+        return os.path.getsize(item)
+    return 0
+
+
+def _items(values: Dict[str, Any]) -> Iterable[Any]:
+    """
+    Элементы всех списочных входов или выходов компонента.
+
+    Пути файлов считаются только во входе sources (конвертеры); остальные списки
+    путей (например, failed) — служебные.
+    """
+    for key, value in values.items():
+        if isinstance(value, list):
+            yield from (item for item in value if key == "sources" or not isinstance(item, (str, Path)))
+
+
+class PipelineProfiler:
+    """
+    Замеряет каждый компонент пайплайна: время, число элементов и байт на входе
+    и выходе и прирост пикового RSS процесса.
+
+    Метод run каждого компонента заменяется обёрткой, поэтому пайплайн
+    запускается как обычно, а замеры копятся по всем запускам (пачкам).
+    Элементы — документы, ByteStream и пути файлов из списочных входов и
+    выходов; они дополнительно раскладываются по MIME-маршрутам функцией
+    route_of (по пути исходного файла), так что видно, сколько текста дают PDF,
+    Office или скан. Память рабочих процессов конвертера и эмбеддера в прирост
+    RSS не входит — он показывает только основной процесс.
+
+    Отчёт (report) — JSON-совместимый словарь; save пишет его с отметкой времени
+    в reports/ рядом с индексом, чтобы запуски можно было сравнивать.
+    """
+
+    def __init__(self, pipeline: Pipeline, route_of: Optional[Callable[[str], str]] = None):
+        """
+        Args:
+            pipeline: Пайплайн, компоненты которого замеряются.
+            route_of: Возвращает MIME-маршрут по пути исходного файла.
+        """
+        self.route_of = route_of
+        self.started = datetime.now()
+        self._start = time.perf_counter()
+        self.components: Dict[str, Dict[str, Any]] = {}
+        for name, instance in pipeline.walk():
+            self._wrap(name, instance)
+
+    def _wrap(self, name: str, instance: Any) -> None:
+        run = instance.run
+        stats = self.components[name] = {
+            "calls": 0, "seconds": 0.0, "items_in": 0, "items_out": 0,
+            "bytes_in": 0, "bytes_out": 0, "peak_rss_delta_mb": 0.0,
+            "routes": defaultdict(lambda: defaultdict(int)),
+        }
+
+        @functools.wraps(run)
+        def profiled(**kwargs):
+            rss = peak_rss_mb()
+            start = time.perf_counter()
+            outputs = run(**kwargs)
+            stats["seconds"] += time.perf_counter() - start
+            stats["peak_rss_delta_mb"] = max(stats["peak_rss_delta_mb"], peak_rss_mb() - rss)
+            stats["calls"] += 1
+            self._count(stats, "in", kwargs)
+            self._count(stats, "out", outputs or {})
+            return outputs
+
+        instance.run = profiled
+
+    def _count(self, stats: Dict[str, Any], side: str, values: Dict[str, Any]) -> None:
+        routes: Dict[str, str] = {}
+        for item in _items(values):
+            size = _item_bytes(item)
+            stats[f"items_{side}"] += 1
+            stats[f"bytes_{side}"] += size
+            if self.route_of is None:
+                continue
+            path = _item_path(item)
+            if path is None:
+                continue
+            if path not in routes:
+                routes[path] = self.route_of(path)
+            route = stats["routes"][routes[path]]
+            route[f"items_{side}"] += 1
+            route[f"bytes_{side}"] += size
+
+    def report(self, **extra: Any) -> Dict[str, Any]:
+        """
+        Собирает отчёт.
+
+        Args:
+            **extra: Дополнительные поля верхнего уровня (источник, число файлов и т.п.).
+
+        Returns:
+            Dict[str, Any]: Отчёт: время запуска и по каждому компоненту — замеры и пропускная способность.
+        """
+        components = {}
+        for name, stats in self.components.items():
+            if not stats["calls"]:
+                continue
+            seconds = stats["seconds"]
+            components[name] = {
+                **{key: value for key, value in stats.items() if key != "routes"},
+                "seconds": round(seconds, 3),
+                "peak_rss_delta_mb": round(stats["peak_rss_delta_mb"], 1),
+                "items_per_sec": round(stats["items_in"] / seconds, 2) if seconds else None,
+                "mb_per_sec": round(stats["bytes_in"] / 2**20 / seconds, 3) if seconds else None,
+                "routes": {route: dict(counts) for route, counts in sorted(stats["routes"].items())},
+            }
+        return {
+            "started": self.started.isoformat(timespec="seconds"),
+            "wall_seconds": round(time.perf_counter() - self._start, 3),
+            **extra,
+            "components": components,
+        }
+
+    def save(self, index_path: Union[str, Path], **extra: Any) -> Tuple[Path, Dict[str, Any]]:
+        """
+        Записывает отчёт в index_path/reports/indexing_<время запуска>.json.
+
+        Args:
+            index_path: Директория индекса (шарда).
+            **extra: Дополнительные поля отчёта.
+
+        Returns:
+            Tuple[Path, Dict[str, Any]]: Путь к файлу и отчёт.
+        """
+        report = self.report(**extra)
+        path = Path(index_path) / REPORTS_DIR / f"indexing_{self.started:%Y%m%d_%H%M%S}.json"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        return path, report
@@ -0,0 +1,156 @@
+"""Источники данных портала и раскладка индексов по шардам источников."""
+
+import logging
+import os
+from collections.abc import Iterable
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# Базы данных портала, из которых берутся документы (см. docs/db_schema_*.md)
+SOURCES = ("cms", "lists", "filestorage")
+# Файлы в корне директории данных — это вложения, скачанные из filestorage
+DEFAULT_SOURCE = "filestorage"
+# Временная директория, в которую adopt_root_index переносит индекс до переименования
+_ADOPT_DIR = f".{DEFAULT_SOURCE}.partial"
+
+
+def source_of(file_path: Union[str, Path], data_dir: Union[str, Path]) -> str:
+    """
+    Определяет источник файла по его поддиректории в директории данных.
+
+    Файлы из data_dir/<источник>/ относятся к этому источнику, остальные —
+    к DEFAULT_SOURCE.
+
+    Args:
+        file_path: Путь к файлу.
+        data_dir: Директория с данными.
+
+    Returns:
+        str: Имя источника.
+    """
+    try:
+        relative = Path(os.path.abspath(file_path)).relative_to(os.path.abspath(data_dir))
+    except ValueError:
+        return DEFAULT_SOURCE
+    if len(relative.parts) > 1 and relative.parts[0] in SOURCES:
+        return relative.parts[0]
+    return DEFAULT_SOURCE
+
+
+def list_source_files(data_dir: Union[str, Path]) -> List[str]:
+    """
+    Возвращает файлы для индексации: из корня data_dir и из поддиректорий источников.
+
+    Args:
+        data_dir: Директория с данными.
+
+    Returns:
+        List[str]: Пути к файлам.
+    """
+    files = [
+        os.path.join(data_dir, name) for name in sorted(os.listdir(data_dir))
+        if os.path.isfile(os.path.join(data_dir, name))
+    ]
+    for source in SOURCES:
+        source_dir = os.path.join(data_dir, source)
+        for root, _, names in os.walk(source_dir):
+            files.extend(os.path.join(root, name) for name in sorted(names))
+    return files
+
+
+def group_by_source(file_paths: Iterable[str], data_dir: Union[str, Path]) -> Dict[str, List[str]]:
+    """
+    Раскладывает файлы по источникам.
+
+    Args:
+        file_paths: Пути к файлам.
+        data_dir: Директория с данными.
+
+    Returns:
+        Dict[str, List[str]]: Файлы каждого источника (только непустые группы).
+    """
+    groups: Dict[str, List[str]] = {}
+    for path in file_paths:
+        groups.setdefault(source_of(path, data_dir), []).append(path)
+    return groups
+
+
+def shard_path(base_path: Union[str, Path], source: str) -> Path:
+    """
+    Возвращает директорию шарда источника внутри директории индекса.
+
+    Args:
+        base_path: Директория индекса (Chroma или BM25).
+        source: Имя источника.
+
+    Returns:
+        Path: base_path/<источник>.
+    """
+    if source not in SOURCES:
+        raise ValueError(f"Неизвестный источник данных: {source}")
+    return Path(base_path) / source
+
+
+def _root_entries(base: Path) -> List[Path]:
+    """Файлы индекса, собранного до разделения по источникам (всё, кроме шардов)."""
+    if not base.is_dir():
+        return []
+    return [child for child in base.iterdir() if child.name not in SOURCES and child.name != _ADOPT_DIR]
+
+
+def adopt_root_index(base_path: Union[str, Path]) -> bool:
+    """
+    Переносит индекс, собранный до разделения по источникам, в шард DEFAULT_SOURCE.
+
+    Такой индекс лежит прямо в base_path. Перенос выполняется один раз, пока
+    шарда DEFAULT_SOURCE нет: файлы собираются во временной директории, которая
+    затем переименовывается в base_path/DEFAULT_SOURCE, поэтому прерванный перенос
+    продолжается при следующем вызове.
+
+    Args:
+        base_path: Директория индекса (Chroma или BM25).
+
+    Returns:
+        bool: True, если индекс перенесён.
+    """
+    base = Path(base_path)
+    target = base / DEFAULT_SOURCE
+    staging = base / _ADOPT_DIR
+    entries = _root_entries(base)
+    if target.exists() or not (entries or staging.exists()):
+        return False
+    staging.mkdir(exist_ok=True)
+    for entry in entries:
+        os.replace(entry, staging / entry.name)
+    os.replace(staging, target)
+    logger.info(f"Индекс {base} перенесён в шард {DEFAULT_SOURCE}: {target}")
+    return True
+
+
+def discover_shards(base_path: Union[str, Path], sources: Optional[Iterable[str]] = None) -> Dict[str, Path]:
+    """
+    Находит шарды источников в директории индекса.
+
+    Индекс, собранный до разделения по источникам, лежит прямо в base_path; пока
+    шарда DEFAULT_SOURCE нет, он считается этим шардом (его переносит в шард
+    следующая индексация, см. adopt_root_index).
+
+    Args:
+        base_path: Директория индекса (Chroma или BM25).
+        sources: Какие источники искать (по умолчанию все).
+
+    Returns:
+        Dict[str, Path]: Директории существующих шардов по источникам.
+    """
+    base = Path(base_path)
+    wanted = list(sources) if sources is not None else list(SOURCES)
+    shards = {source: base / source for source in wanted if (base / source).is_dir()}
+    if DEFAULT_SOURCE in wanted and DEFAULT_SOURCE not in shards and _root_entries(base):
+        logger.warning(
+            f"{base}: индекс без разделения по источникам используется как шард {DEFAULT_SOURCE}; "
+            f"запустите индексацию, чтобы перенести его в {base / DEFAULT_SOURCE}",
+        )
+        shards[DEFAULT_SOURCE] = base
+    return shards
@@ -0,0 +1,163 @@
+"""Промежуточные результаты индексации на диске для продолжения после сбоя."""
+
+import hashlib
+import io
+import json
+import logging
+import os
+from collections.abc import Iterable
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+
+import numpy as np
+from haystack import Document
+
+logger = logging.getLogger(__name__)
+
+SPILL_DIR = "spill"
+FAILED_FILE = "failed_files.json"
+
+
+class SpillStore:
+    """
+    Хранилище результатов стадий индексации по файлам.
+
+    Для каждого файла (ключ — путь в манифесте вместе с SHA-256 содержимого:
+    одинаковые файлы в разных папках дают разные документы, а изменённый файл
+    не подхватывает старую запись) и стадии (например,
+    "converted" — документы после конвертации, "embedded" — чанки с
+    эмбеддингами) хранится список документов вместе с тегом настроек, при
+    которых он получен: при другом теге запись не используется. Запись — это
+    JSON с тегом и документами без эмбеддингов и, если эмбеддинги есть, .npy
+    рядом с ним (float32, строка на документ). Формат читается как данные, без
+    выполнения кода; повреждённая запись удаляется, и файл обрабатывается заново.
+    Записи пишутся атомарно и удаляются, когда файл попал в индекс и манифест, так что в
+    хранилище остаются только результаты незавершённой пачки. Отдельно хранится
+    список файлов, которые не удалось сконвертировать.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        """
+        Args:
+            path: Директория хранилища.
+        """
+        self.path = Path(path)
+
+    def _file(self, stage: str, path: str, file_hash: str, suffix: str = ".json") -> Path:
+        entry = hashlib.sha256(f"{path}\0{file_hash}".encode()).hexdigest()
+        return self.path / stage / entry[:2] / f"{entry}{suffix}"
+
+    @staticmethod
+    def _write(path: Path, data: bytes) -> None:
+        """Атомарно записывает файл (временный файл + os.replace)."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def save(self, stage: str, path: str, file_hash: str, documents: List[Document], tag: str = "") -> None:
+        """
+        Сохраняет документы файла после стадии.
+
+        Args:
+            stage: Имя стадии.
+            path: Путь файла в манифесте.
+            file_hash: SHA-256 содержимого файла.
+            documents: Документы файла.
+            tag: Настройки, при которых получены документы.
+        """
+        records, embeddings = [], []
+        for doc in documents:
+            record = doc.to_dict(flatten=False)
+            embedding = record.pop("embedding", None)
+            record["embedding_row"] = None if embedding is None else len(embeddings)
+            if embedding is not None:
+                embeddings.append(embedding)
+            records.append(record)
+        try:
+            data = json.dumps({"tag": tag, "documents": records}, ensure_ascii=False).encode("utf-8")
+        except (TypeError, ValueError) as e:
+            # метаданные не сериализуются в JSON — файл просто обработается заново
+            logger.warning(f"Контрольная точка {stage} для {path} не сохранена: {e}")
+            return
+        # .npy пишется первым: JSON появляется, только когда запись полная
+        npy_path = self._file(stage, path, file_hash, ".npy")
+        if embeddings:
+            buf = io.BytesIO()
+            np.save(buf, np.asarray(embeddings, dtype=np.float32), allow_pickle=False)
+            self._write(npy_path, buf.getvalue())
+        else:
+            npy_path.unlink(missing_ok=True)
+        self._write(self._file(stage, path, file_hash), data)
+
+    def load(self, stage: str, path: str, file_hash: str, tag: str = "") -> Optional[List[Document]]:
+        """
+        Документы файла после стадии или None, если записи нет (или она получена при других настройках).
+
+        Повреждённая запись удаляется (с предупреждением в логе) и тоже даёт None.
+        """
+        entry = self._file(stage, path, file_hash)
+        if not entry.exists():
+            return None
+        try:
+            with open(entry, encoding="utf-8") as f:
+                data = json.load(f)
+            if data["tag"] != tag:
+                return None
+            records = data["documents"]
+            embeddings = None
+            if any(record["embedding_row"] is not None for record in records):
+                embeddings = np.load(self._file(stage, path, file_hash, ".npy"), allow_pickle=False)
+            documents = []
+            for record in records:
+                row = record.pop("embedding_row")
+                if row is not None:
+                    record["embedding"] = embeddings[row].tolist()
+                documents.append(Document.from_dict(record))
+        except Exception as e:
+            logger.warning(f"Контрольная точка {entry} ({path}) повреждена и удалена, файл будет обработан заново: {e}")
+            self._discard_entry(stage, path, file_hash)
+            return None
+        return documents
+
+    def _discard_entry(self, stage: str, path: str, file_hash: str) -> None:
+        for suffix in (".json", ".npy"):
+            self._file(stage, path, file_hash, suffix).unlink(missing_ok=True)
+
+    def discard(self, files: Iterable[Tuple[str, str]]) -> None:
+        """Удаляет записи всех стадий для файлов, заданных парами (путь в манифесте, SHA-256)."""
+        if not self.path.exists():
+            return
+        stages = [entry for entry in self.path.iterdir() if entry.is_dir()]
+        for path, file_hash in files:
+            for stage in stages:
+                self._discard_entry(stage.name, path, file_hash)
+
+    def failed(self) -> List[str]:
+        """Файлы, которые не удалось сконвертировать при прошлых запусках."""
+        path = self.path / FAILED_FILE
+        if not path.exists():
+            return []
+        try:
+            with open(path, encoding="utf-8") as f:
+                return list(json.load(f))
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning(f"Не удалось прочитать {path}, список несконвертированных файлов сброшен: {e}")
+            return []
+
+    def update_failed(self, failed: Iterable[str], done: Iterable[str]) -> None:
+        """
+        Обновляет список несконвертированных файлов.
+
+        Args:
+            failed: Файлы, которые не удалось сконвертировать.
+            done: Файлы, которые проиндексированы (убираются из списка).
+        """
+        current = dict.fromkeys(self.failed())
+        current.update(dict.fromkeys(failed))
+        for path in done:
+            current.pop(path, None)
+        self._write(self.path / FAILED_FILE, json.dumps(list(current), ensure_ascii=False).encode("utf-8"))
@@ -0,0 +1,114 @@
+"""Общий анализатор текста для BM25: токенизация, нормализация и стемминг."""
+
+import re
+from collections.abc import Iterable
+from functools import lru_cache
+from typing import Callable, Dict, List
+
+from nltk.stem.snowball import SnowballStemmer
+
+# Слова из букв и цифр; «_» в \w не нужен — он склеивает имена файлов и идентификаторы
+WORD_RE = re.compile(r"[^\W_]+")
+CYRILLIC_RE = re.compile(r"[а-я]")
+LATIN_RE = re.compile(r"[a-z]")
+
+DEFAULT_ANALYZER = "ru_en_snowball"
+LEGACY_ANALYZER = "nltk_word_tokenize"
+
+
+class TextAnalyzer:
+    """
+    Анализатор текста, общий для индексации и поиска.
+
+    Текст приводится к нижнему регистру и режется одним скомпилированным регулярным
+    выражением; каждое слово нормализуется (ё → е) и стеммится Snowball-стеммером
+    по алфавиту слова: русским для кириллицы, английским для латиницы, числа не
+    меняются. Словарь распределён по Ципфу, поэтому нормализация кэшируется
+    по слову — стеммер вызывается только для новых слов.
+    """
+
+    name = DEFAULT_ANALYZER
+
+    def __init__(self, cache_size: int = 1 << 18):
+        self._ru = SnowballStemmer("russian")
+        self._en = SnowballStemmer("english")
+        self.normalize: Callable[[str], str] = lru_cache(maxsize=cache_size)(self._normalize)
+
+    def _normalize(self, word: str) -> str:
+        word = word.replace("ё", "е")
+        if CYRILLIC_RE.search(word):
+            return self._ru.stem(word)
+        if LATIN_RE.search(word):
+            return self._en.stem(word)
+        return word
+
+    def tokenize(self, text: str) -> List[str]:
+        """
+        Режет текст на слова без стемминга (для очистки запроса перед dense-поиском).
+
+        Args:
+            text: Исходный текст.
+
+        Returns:
+            List[str]: Слова в нижнем регистре.
+        """
+        return WORD_RE.findall(text.lower())
+
+    def analyze(self, text: str) -> List[str]:
+        """
+        Превращает текст в термины индекса.
+
+        Args:
+            text: Исходный текст.
+
+        Returns:
+            List[str]: Нормализованные термины.
+        """
+        normalize = self.normalize
+        return [normalize(word) for word in WORD_RE.findall(text.lower())]
+
+    def analyze_many(self, texts: Iterable[str]) -> List[List[str]]:
+        return [self.analyze(text) for text in texts]
+
+
+class NLTKWordAnalyzer(TextAnalyzer):
+    """
+    Прежняя токенизация (nltk word_tokenize по нижнему регистру, без морфологии).
+
+    Нужна только для индексов, перенесённых из bm25.pkl: запросы и документы,
+    дописываемые в такой индекс, должны анализироваться так же, как его корпус.
+    """
+
+    name = LEGACY_ANALYZER
+
+    def analyze(self, text: str) -> List[str]:
+        from nltk.tokenize import word_tokenize
+
+        return word_tokenize(text.lower())
+
+
+_ANALYZERS: Dict[str, Callable[[], TextAnalyzer]] = {
+    DEFAULT_ANALYZER: TextAnalyzer,
+    LEGACY_ANALYZER: NLTKWordAnalyzer,
+}
+_instances: Dict[str, TextAnalyzer] = {}
+
+
+def get_analyzer(name: str = DEFAULT_ANALYZER) -> TextAnalyzer:
+    """
+    Возвращает общий для процесса экземпляр анализатора (вместе с его кэшем).
+
+    Args:
+        name: Имя анализатора (записывается в манифест BM25-индекса).
+
+    Returns:
+        TextAnalyzer: Анализатор.
+
+    Raises:
+        ValueError: Если анализатор с таким именем неизвестен.
+    """
+    if name not in _ANALYZERS:
+        raise ValueError(f"Неизвестный анализатор текста: {name}")
+    if name not in _instances:
+        _instances[name] = _ANALYZERS[name]()
+    return _instances[name]
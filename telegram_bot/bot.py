@@ -64,7 +64,7 @@ if not Path(PERSIST_PATH).exists():
     logger.warning(f"Директория с индексом Chroma не найдена: {PERSIST_PATH}")
     
 if not Path(BM25_PATH).exists():
-    logger.warning(f"Файл индекса BM25 не найден: {BM25_PATH}")
+    logger.warning(f"Индекс BM25 не найден: {BM25_PATH}")
 
 logger.info(f"Конфигурация бота: MODEL_NAME={MODEL_NAME}, API_URL={API_URL}")
 logger.info(f"Пути к индексам: CHROMA={PERSIST_PATH}, BM25={BM25_PATH}")
@@ -0,0 +1,37 @@
+"""Общие настройки тестов."""
+
+import os
+import tempfile
+
+import pytest
+
+# settings создаёт директории данных при импорте — в тестах они уходят во временную папку
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="chathrd-tests-"))
+
+
+@pytest.fixture(scope="session")
+def tiny_model(tmp_path_factory) -> str:
+    """Крошечная BERT-модель SentenceTransformers со случайными весами — без скачивания."""
+    pytest.importorskip("sentence_transformers")
+    import transformers
+    from sentence_transformers import SentenceTransformer, models
+
+    base = tmp_path_factory.mktemp("tiny-model")
+    words = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"]
+    words += "отпуск заявление график работы сотрудник приказ leave request policy".split()
+    (base / "vocab.txt").write_text("\n".join(words), encoding="utf-8")
+    config = transformers.BertConfig(
+        vocab_size=len(words),
+        hidden_size=16,
+        num_hidden_layers=1,
+        num_attention_heads=2,
+        intermediate_size=32,
+        max_position_embeddings=64,
+    )
+    transformers.BertModel(config).save_pretrained(base / "hf")
+    transformers.BertTokenizerFast(vocab_file=str(base / "vocab.txt")).save_pretrained(base / "hf")
+    model = SentenceTransformer(
+        modules=[models.Transformer(str(base / "hf"), max_seq_length=32), models.Pooling(16)],
+    )
+    model.save(str(base / "st"))
+    return str(base / "st")
@@ -0,0 +1,112 @@
+"""Тесты бинарного формата BM25-сегментов."""
+
+import random
+
+import numpy as np
+import pytest
+from rank_bm25 import BM25L
+
+from chathrd.components.retrievers.bm25_index import BM25FormatError, BM25Index, build_index
+from chathrd.components.retrievers.bm25_segments import SegmentedBM25Index
+
+WORDS = [f"w{i}" for i in range(40)] + ["отпуск", "премия", "ёлка"]
+
+
+def make_corpus(num_docs: int, seed: int = 0):
+    rng = random.Random(seed)
+    corpus = [rng.choices(WORDS, k=rng.randint(1, 30)) for _ in range(num_docs)]
+    ids = [f"doc-{i}" for i in range(num_docs)]
+    return corpus, ids
+
+
+def bm25l_top(corpus, ids, query, top_k):
+    """Ожидаемый результат по rank_bm25: документы с совпадениями по убыванию оценки."""
+    scores = BM25L(corpus).get_scores(query)
+    matched = [i for i, tokens in enumerate(corpus) if set(query) & set(tokens)]
+    matched.sort(key=lambda i: -scores[i])
+    return {ids[i]: scores[i] for i in matched[:top_k]}
+
+
+@pytest.mark.parametrize("query", [["w1"], ["w1", "w2", "w1"], ["отпуск", "премия"], ["нет-такого"]])
+def test_scores_match_rank_bm25(tmp_path, query):
+    corpus, ids = make_corpus(200)
+    index = SegmentedBM25Index(tmp_path)
+    index.add(corpus, ids)
+
+    found_ids, scores = index.search(query, top_k=10)
+
+    expected = bm25l_top(corpus, ids, query, 10)
+    assert len(found_ids) == len(expected)
+    for doc_id, score in zip(found_ids, scores):
+        assert score == pytest.approx(expected[doc_id])
+    assert list(scores) == sorted(scores, reverse=True)
+
+
+def test_save_load_roundtrip(tmp_path):
+    corpus, ids = make_corpus(50)
+    index = BM25Index.build(corpus, ids)
+    index.save(tmp_path / "seg.bm25")
+
+    loaded = BM25Index.load(tmp_path / "seg.bm25")
+
+    assert list(loaded.terms) == list(index.terms)
+    assert list(loaded.doc_ids) == ids
+    np.testing.assert_array_equal(loaded.indptr, index.indptr)
+    np.testing.assert_array_equal(loaded.postings_doc, index.postings_doc)
+    np.testing.assert_array_equal(loaded.postings_tf, index.postings_tf)
+    np.testing.assert_array_equal(loaded.doc_lens, index.doc_lens)
+    np.testing.assert_array_equal(loaded.doc_ids.order, index.doc_ids.order)
+
+
+def test_find_doc_uses_sorted_id_table(tmp_path):
+    index = BM25Index.build([["a"], ["b"], ["c"], ["d"]], ["z", "a", "z", "m"])
+    index.save(tmp_path / "seg.bm25")
+    loaded = BM25Index.load(tmp_path / "seg.bm25")
+
+    assert loaded.find_doc("z").tolist() == [0, 2]
+    assert loaded.find_doc("a").tolist() == [1]
+    assert loaded.find_doc("missing").tolist() == []
+
+
+def test_empty_file_is_rejected(tmp_path):
+    path = tmp_path / "seg.bm25"
+    path.write_bytes(b"")
+
+    with pytest.raises(BM25FormatError):
+        BM25Index.load(path)
+
+
+def test_corrupted_segment_is_rejected(tmp_path):
+    corpus, ids = make_corpus(20)
+    path = tmp_path / "seg.bm25"
+    BM25Index.build(corpus, ids).save(path)
+    data = bytearray(path.read_bytes())
+    data[-1] ^= 0xFF
+    path.write_bytes(bytes(data))
+
+    with pytest.raises(BM25FormatError):
+        BM25Index.load(path)
+
+
+def test_unknown_version_is_rejected(tmp_path):
+    path = tmp_path / "seg.bm25"
+    BM25Index.build([["a"]], ["x"]).save(path)
+    data = bytearray(path.read_bytes())
+    data[8:10] = (99).to_bytes(2, "little")
+    path.write_bytes(bytes(data))
+
+    with pytest.raises(BM25FormatError):
+        BM25Index.load(path)
+
+
+def test_sharded_build_matches_sequential_build():
+    corpus, ids = make_corpus(120)
+    texts = [" ".join(tokens) for tokens in corpus]
+
+    sequential = build_index(texts, ids, "ru_en_snowball", workers=1)
+    sharded = build_index(texts, ids, "ru_en_snowball", workers=2, min_shard_docs=30)
+
+    assert list(sharded.terms) == list(sequential.terms)
+    assert list(sharded.doc_ids) == ids
+    np.testing.assert_array_equal(sharded.postings_doc, sequential.postings_doc)
+    np.testing.assert_array_equal(sharded.postings_tf, sequential.postings_tf)
@@ -0,0 +1,44 @@
+"""Тесты переноса bm25.pkl в сегментированный индекс."""
+
+import pickle
+
+import pytest
+from haystack import Document
+from rank_bm25 import BM25L
+
+from chathrd.components.retrievers.bm25_retriever import BM25Builder
+from chathrd.components.retrievers.bm25_segments import SegmentedBM25Index, convert_pickle_index
+from chathrd.utils.text_analyzer import DEFAULT_ANALYZER, LEGACY_ANALYZER, NLTKWordAnalyzer
+
+
+def write_pickle(path, corpus, ids):
+    with open(path, "wb") as f:
+        pickle.dump((BM25L(corpus), ids), f)
+
+
+def test_converted_index_keeps_scores(tmp_path):
+    corpus = [["отпуск", "заявление"], ["премия"], ["отпуск", "отпуск", "график"]]
+    write_pickle(tmp_path / "bm25.pkl", corpus, ["a", "b", "c"])
+
+    index = convert_pickle_index(tmp_path / "bm25.pkl", tmp_path / "index")
+
+    ids, scores = index.search(["отпуск"], top_k=3)
+    expected = BM25L(corpus).get_scores(["отпуск"])
+    assert sorted(ids) == ["a", "c"]
+    assert dict(zip(ids, scores)) == pytest.approx({"a": expected[0], "c": expected[2]})
+    assert SegmentedBM25Index(tmp_path / "index").analyzer_name == LEGACY_ANALYZER
+
+
+def test_builder_appends_to_converted_index(tmp_path, monkeypatch):
+    # прежний анализатор требует данных nltk punkt; для теста хватает разбиения по пробелам
+    monkeypatch.setattr(NLTKWordAnalyzer, "analyze", lambda self, text: text.lower().split())
+    write_pickle(tmp_path / "bm25.pkl", [["отпуск", "заявление"], ["премия"]], ["a", "b"])
+    convert_pickle_index(tmp_path / "bm25.pkl", tmp_path / "index")
+
+    builder = BM25Builder(analyzer=DEFAULT_ANALYZER, workers=1)
+    builder.run([Document(id="c", content="Отпуска сотрудников")], path=str(tmp_path / "index"))
+
+    index = builder.open_index(str(tmp_path / "index"))
+    assert index.analyzer_name == LEGACY_ANALYZER
+    assert index.search(["отпуска"], top_k=5)[0] == ["c"]
+    assert index.search(["премия"], top_k=5)[0] == ["b"]
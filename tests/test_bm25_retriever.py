@@ -0,0 +1,66 @@
+"""Тесты BM25-ретриверов с подгрузкой документов из Chroma."""
+
+import pickle
+import uuid
+
+import pytest
+from haystack import Document
+from haystack_integrations.document_stores.chroma import ChromaDocumentStore
+from rank_bm25 import BM25L
+
+from chathrd.components.retrievers.bm25_retriever import (
+    BM25Builder,
+    PickledBM25Retriever,
+    SegmentedBM25Retriever,
+)
+from chathrd.utils.text_analyzer import NLTKWordAnalyzer
+
+DOCS = [
+    Document(id="a", content="Заявление на отпуск", meta={"file_path": "a.txt"}),
+    Document(id="b", content="Премия по итогам года", meta={"file_path": "b.txt"}),
+    Document(id="c", content="График отпусков отдела", meta={"file_path": "c.txt"}),
+]
+
+
+@pytest.fixture
+def store():
+    store = ChromaDocumentStore(collection_name=f"test-{uuid.uuid4().hex[:8]}")
+    store.write_documents([Document(id=d.id, content=d.content, meta=d.meta, embedding=[0.1, 0.2]) for d in DOCS])
+    return store
+
+
+def test_retriever_hydrates_only_found_documents(store, tmp_path):
+    BM25Builder(workers=1).run(DOCS, path=str(tmp_path / "index"))
+    retriever = SegmentedBM25Retriever(store, str(tmp_path / "index"), top_k=5)
+
+    docs = retriever.run("отпуск")["documents"]
+
+    assert sorted(d.id for d in docs) == ["a", "c"]
+    assert all(d.embedding is None and d.score > 0 for d in docs)
+    assert docs[0].meta["file_path"] in {"a.txt", "c.txt"}
+
+
+def test_run_batch_keeps_query_order(store, tmp_path):
+    BM25Builder(workers=1).run(DOCS, path=str(tmp_path / "index"))
+    retriever = SegmentedBM25Retriever(store, str(tmp_path / "index"), top_k=5)
+
+    results = retriever.run_batch(["премия", "отпуск", "нет-такого"])["documents"]
+
+    assert [d.id for d in results[0]] == ["b"]
+    assert sorted(d.id for d in results[1]) == ["a", "c"]
+    assert results[2] == []
+
+
+def test_pickled_retriever_converts_pickle_once(store, tmp_path, monkeypatch):
+    # прежний анализатор требует данных nltk punkt; для теста хватает разбиения по пробелам
+    monkeypatch.setattr(NLTKWordAnalyzer, "analyze", lambda self, text: text.lower().split())
+    corpus = [doc.content.lower().split() for doc in DOCS]
+    with open(tmp_path / "bm25.pkl", "wb") as f:
+        pickle.dump((BM25L(corpus), [doc.id for doc in DOCS]), f)
+
+    retriever = PickledBM25Retriever(store, path_to_pickle=str(tmp_path / "bm25.pkl"), top_k=5)
+    again = PickledBM25Retriever(store, path_to_pickle=str(tmp_path / "bm25.pkl"), top_k=5)
+
+    assert retriever.path == str(tmp_path / "bm25_index")
+    assert [d.id for d in retriever.run("премия")["documents"]] == ["b"]
+    assert again.index.num_docs == len(DOCS)
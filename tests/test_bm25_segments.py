@@ -0,0 +1,83 @@
+"""Тесты сегментированного BM25-индекса: удаления (tombstones) и слияние."""
+
+import pytest
+from test_bm25_index import bm25l_top, make_corpus
+
+from chathrd.components.retrievers.bm25_segments import SegmentedBM25Index
+
+
+def assert_same_results(index, corpus, ids, query, top_k=20):
+    found_ids, scores = index.search(query, top_k)
+    expected = bm25l_top(corpus, ids, query, top_k)
+    assert dict(zip(found_ids, scores)) == pytest.approx(expected)
+
+
+def test_readd_replaces_old_copy(tmp_path):
+    corpus, ids = make_corpus(60)
+    index = SegmentedBM25Index(tmp_path, max_segments=100)
+    index.add(corpus[:40], ids[:40])
+    index.add(corpus[40:], ids[40:])
+
+    # doc-5 переиндексирован с другим текстом: старая копия помечена удалённой
+    index.add([["отпуск", "премия"]], ["doc-5"])
+
+    corpus[5] = ["отпуск", "премия"]
+    assert index.num_docs == 60
+    assert [len(seg.deleted) for seg in index._segments] == [1, 0, 0]
+    assert_same_results(index, corpus, ids, ["отпуск"])
+    assert_same_results(index, corpus, ids, ["w3", "w7"])
+
+
+def test_delete_excludes_documents_and_statistics(tmp_path):
+    corpus, ids = make_corpus(60)
+    index = SegmentedBM25Index(tmp_path, max_segments=100, max_deleted_ratio=1.0)
+    index.add(corpus, ids)
+
+    index.delete(["doc-1", "doc-2", "missing"])
+
+    live = [i for i in range(60) if ids[i] not in ("doc-1", "doc-2")]
+    assert index.num_docs == 58
+    assert_same_results(index, [corpus[i] for i in live], [ids[i] for i in live], ["w1", "w2"])
+
+
+def test_merge_drops_deleted_documents(tmp_path):
+    corpus, ids = make_corpus(90)
+    index = SegmentedBM25Index(tmp_path, max_segments=100, max_deleted_ratio=1.0)
+    for lo in range(0, 90, 30):
+        index.add(corpus[lo:lo + 30], ids[lo:lo + 30])
+    index.delete(ids[10:20])
+
+    index.merge()
+
+    live_corpus, live_ids = corpus[:10] + corpus[20:], ids[:10] + ids[20:]
+    assert index.num_segments == 1
+    assert index._segments[0].index.num_docs == 80
+    assert not index._segments[0].deleted
+    assert_same_results(index, live_corpus, live_ids, ["w4", "ёлка"])
+
+
+def test_state_survives_reopen(tmp_path):
+    corpus, ids = make_corpus(40)
+    index = SegmentedBM25Index(tmp_path, max_segments=100, max_deleted_ratio=1.0)
+    index.add(corpus[:20], ids[:20])
+    index.add(corpus[20:], ids[20:])
+    index.delete(["doc-3"])
+
+    reopened = SegmentedBM25Index(tmp_path)
+
+    found_ids, scores = reopened.search(["w1", "w2"], 10)
+    expected_ids, expected_scores = index.search(["w1", "w2"], 10)
+    assert reopened.num_docs == 39
+    assert found_ids == expected_ids
+    assert list(scores) == pytest.approx(list(expected_scores))
+
+
+def test_background_merge_keeps_results(tmp_path):
+    corpus, ids = make_corpus(100)
+    index = SegmentedBM25Index(tmp_path, max_segments=2)
+    for lo in range(0, 100, 25):
+        index.add(corpus[lo:lo + 25], ids[lo:lo + 25])
+    index.wait_for_merge()
+
+    assert index.num_segments <= 3
+    assert_same_results(index, corpus, ids, ["w5", "премия"])
@@ -0,0 +1,80 @@
+"""Тесты эмбеддера с батчами по длине."""
+
+import numpy as np
+import pytest
+from haystack import Document
+
+pytest.importorskip("sentence_transformers")
+
+from chathrd.components.embedders.bucketed_embedder import (  # noqa: E402
+    BucketedDocumentEmbedder,
+    length_buckets,
+    load_embedding_model,
+    padded_tokens,
+)
+
+TEXTS = [
+    "отпуск",
+    "заявление на отпуск график работы сотрудник приказ отпуск заявление",
+    "leave",
+    "график работы",
+    "leave request policy leave request policy leave request",
+    "приказ",
+    "сотрудник заявление",
+]
+
+
+def test_length_buckets_groups_similar_lengths():
+    lengths = [5, 1, 9, 2, 8, 1]
+    batches = length_buckets(lengths, 2)
+
+    assert [batch.tolist() for batch in batches] == [[1, 5], [3, 0], [4, 2]]
+
+
+def test_length_buckets_keeps_every_index_once():
+    lengths = [3, 7, 7, 1, 4]
+    batches = length_buckets(lengths, 3)
+
+    assert sorted(np.concatenate(batches).tolist()) == list(range(len(lengths)))
+    assert [len(batch) for batch in batches] == [3, 2]
+
+
+def test_padded_tokens():
+    lengths = [5, 1, 9, 2]
+    arrival = [np.array([0, 1]), np.array([2, 3])]
+    sorted_batches = length_buckets(lengths, 2)
+
+    assert padded_tokens(lengths, arrival) == 5 * 2 + 9 * 2
+    assert padded_tokens(lengths, sorted_batches) == 2 * 2 + 9 * 2
+
+
+def test_unknown_backend_rejected():
+    with pytest.raises(ValueError, match="Неизвестный бэкенд"):
+        BucketedDocumentEmbedder(model="unused", backend="tensorrt")
+
+
+def test_embeddings_follow_document_order(tiny_model):
+    embedder = BucketedDocumentEmbedder(model=tiny_model, batch_size=2, device="cpu")
+    documents = [Document(content=text) for text in TEXTS]
+
+    result = embedder.run(documents)["documents"]
+
+    reference = load_embedding_model(tiny_model, device="cpu").encode(TEXTS, batch_size=1)
+    assert [doc.content for doc in result] == TEXTS
+    np.testing.assert_allclose(np.array([doc.embedding for doc in result]), reference, atol=1e-5)
+
+
+def test_meta_fields_are_embedded(tiny_model):
+    embedder = BucketedDocumentEmbedder(
+        model=tiny_model, device="cpu", meta_fields_to_embed=["title"], prefix="query: ",
+    )
+    doc = Document(content="график работы", meta={"title": "приказ"})
+
+    assert embedder._text(doc) == "query: приказ\nграфик работы"
+    assert embedder._text(Document(content="отпуск")) == "query: отпуск"
+
+
+def test_empty_input():
+    embedder = BucketedDocumentEmbedder(model="unused")
+
+    assert embedder.run([]) == {"documents": []}
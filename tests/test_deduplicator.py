@@ -0,0 +1,94 @@
+"""Тесты правил отбрасывания почти одинаковых чанков."""
+
+import os
+
+import pytest
+from haystack import Document
+
+from chathrd.components.processors.deduplicator import NearDuplicateFilter, minhash
+
+
+def text(seed: str, words: int = 40) -> str:
+    return " ".join(f"{seed}{i}" for i in range(words))
+
+
+@pytest.fixture
+def files(tmp_path):
+    """Старая и новая версии одного положения (mtime различается)."""
+    old, new = tmp_path / "old" / "policy.txt", tmp_path / "new" / "policy.txt"
+    for path, mtime in ((old, 1_000_000), (new, 2_000_000)):
+        path.parent.mkdir()
+        path.write_text("-")
+        os.utime(path, (mtime, mtime))
+    return str(old), str(new)
+
+
+def chunks(path: str, texts):
+    return [Document(content=t, meta={"file_path": path, "source_id": path}) for t in texts]
+
+
+def test_only_matching_chunks_are_dropped(files):
+    old, new = files
+    shared = [text("общий", 40), text("раздел", 40)]
+    docs = chunks(old, shared + [text("старыйпункт")]) + chunks(new, shared + [text("новыйпункт")])
+
+    result = NearDuplicateFilter(threshold=0.9).run(documents=docs)
+
+    contents = [doc.content for doc in result["documents"]]
+    assert result["duplicates"] == 2
+    assert text("старыйпункт") in contents
+    assert text("новыйпункт") in contents
+    assert contents.count(shared[0]) == contents.count(shared[1]) == 1
+
+
+def test_newest_copy_is_canonical(files):
+    old, new = files
+    # в пачке старая версия идёт первой — канонической всё равно становится новая
+    docs = chunks(old, [text("общий")]) + chunks(new, [text("общий")])
+
+    result = NearDuplicateFilter(threshold=0.9).run(documents=docs)
+
+    [kept] = result["documents"]
+    assert kept.meta["file_path"] == new
+    assert kept.meta["duplicate_sources"] == old
+    assert kept.meta["duplicate_count"] == 1
+
+
+def test_different_chunks_are_kept(files):
+    old, new = files
+    docs = chunks(old, [text("первый")]) + chunks(new, [text("второй")])
+
+    result = NearDuplicateFilter(threshold=0.9).run(documents=docs)
+
+    assert result["duplicates"] == 0
+    assert len(result["documents"]) == 2
+
+
+def test_zero_threshold_disables_filter(files):
+    old, new = files
+    docs = chunks(old, [text("общий")]) + chunks(new, [text("общий")])
+
+    result = NearDuplicateFilter(threshold=0).run(documents=docs)
+
+    assert result == {"documents": docs, "duplicates": 0}
+
+
+def test_minhash_estimates_similarity():
+    base = text("слово", 100)
+    edited = base.replace("слово50", "правка")
+
+    assert minhash("") is None
+    assert (minhash(base) == minhash(base.upper())).all()
+    assert 0.8 < (minhash(base) == minhash(edited)).mean() < 1
+    assert (minhash(base) == minhash(text("другое", 100))).mean() < 0.1
+
+
+def test_copies_are_found_only_within_one_run(files):
+    old, new = files
+    dedup = NearDuplicateFilter(threshold=0.9)
+
+    first = dedup.run(documents=chunks(old, [text("общий")]))
+    second = dedup.run(documents=chunks(new, [text("общий")]))
+
+    assert first["duplicates"] == second["duplicates"] == 0
+    assert len(second["documents"]) == 1
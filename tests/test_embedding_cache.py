@@ -0,0 +1,81 @@
+"""Тесты кэша эмбеддингов и эмбеддера поверх него."""
+
+import numpy as np
+import pytest
+from haystack import Document
+
+from chathrd.components.embedders.cached_embedder import CachedDocumentEmbedder
+from chathrd.utils.embedding_cache import EmbeddingCache
+
+
+class CountingEmbedder:
+    """Эмбеддер-заглушка: вектор из длины текста, считает эмбеддинги и загрузки модели."""
+
+    model = "fake-model"
+    meta_fields_to_embed = ["title"]
+
+    def __init__(self):
+        self.embedded = []
+        self.warm_ups = 0
+
+    def warm_up(self):
+        self.warm_ups += 1
+
+    def run(self, documents):
+        self.embedded.extend(doc.content for doc in documents)
+        return {"documents": [
+            Document(id=doc.id, content=doc.content, embedding=[len(doc.content) / 3, 1.0]) for doc in documents
+        ]}
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "embeddings.sqlite")
+
+
+def test_cache_roundtrip_in_float16(cache_path):
+    cache = EmbeddingCache(cache_path)
+    key = EmbeddingCache.key("model", "текст")
+    cache.put_many({key: np.array([0.1, 0.2, 0.3], dtype=np.float32)})
+
+    found = EmbeddingCache(cache_path).get_many([key, "missing"])
+
+    assert list(found) == [key]
+    assert found[key].dtype == np.float16
+    np.testing.assert_allclose(found[key], [0.1, 0.2, 0.3], rtol=1e-3)
+
+
+def test_only_missing_chunks_are_embedded(cache_path):
+    embedder = CountingEmbedder()
+    cached = CachedDocumentEmbedder(embedder, cache_path=cache_path)
+    docs = [Document(content="отпуск"), Document(content="премия"), Document(content="отпуск")]
+
+    first = cached.run(documents=docs)["documents"]
+    second = cached.run(documents=[Document(content="премия"), Document(content="график")])["documents"]
+
+    assert embedder.embedded == ["отпуск", "премия", "график"]
+    assert embedder.warm_ups == 1
+    assert first[0].embedding == first[2].embedding
+    assert second[0].embedding == first[1].embedding
+
+
+def test_cached_and_fresh_vectors_are_identical(cache_path):
+    docs = [Document(content="положение о премировании")]
+    fresh = CachedDocumentEmbedder(CountingEmbedder(), cache_path=cache_path).run(documents=docs)["documents"]
+
+    embedder = CountingEmbedder()
+    again = CachedDocumentEmbedder(embedder, cache_path=cache_path).run(documents=docs)["documents"]
+
+    assert embedder.embedded == []
+    assert embedder.warm_ups == 0
+    assert again[0].embedding == fresh[0].embedding
+
+
+def test_key_includes_embedded_meta_fields(cache_path):
+    embedder = CountingEmbedder()
+    cached = CachedDocumentEmbedder(embedder, cache_path=cache_path)
+
+    cached.run(documents=[Document(content="текст", meta={"title": "Приказ"})])
+    cached.run(documents=[Document(content="текст", meta={"title": "Положение"})])
+
+    assert len(embedder.embedded) == 2
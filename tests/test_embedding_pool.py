@@ -0,0 +1,72 @@
+"""Тесты пула процессов эмбеддинга."""
+
+import numpy as np
+import pytest
+
+from chathrd.components.embedders.embedding_pool import EmbeddingWorkerPool, core_groups
+
+BATCHES = [
+    ["отпуск", "график работы"],
+    ["заявление на отпуск сотрудник приказ"],
+    ["leave request policy", "leave", "policy"],
+    ["сотрудник"],
+]
+
+
+def test_core_groups_are_disjoint():
+    groups = core_groups(3)
+    cores = [core for group in groups for core in group]
+
+    assert len(groups) == 3
+    assert len(cores) == len(set(cores))
+
+
+@pytest.fixture(scope="module")
+def pool(tiny_model):
+    pool = EmbeddingWorkerPool(tiny_model, "torch", workers=2, timeout=300)
+    yield pool
+    pool.close()
+
+
+@pytest.fixture(scope="module")
+def reference(tiny_model):
+    from chathrd.components.embedders.bucketed_embedder import load_embedding_model
+
+    model = load_embedding_model(tiny_model, device="cpu")
+    return [model.encode(batch, batch_size=len(batch)) for batch in BATCHES]
+
+
+def assert_same(results, reference):
+    assert len(results) == len(reference)
+    for vectors, expected in zip(results, reference):
+        np.testing.assert_allclose(vectors, expected, atol=1e-5)
+
+
+def test_encode_keeps_batch_order(pool, reference):
+    assert pool.max_seq_length == 32
+    assert_same(pool.encode(BATCHES), reference)
+
+
+def test_idle_dead_worker_is_replaced(pool, reference):
+    dead = pool._pool[0]
+    dead.process.kill()
+    dead.process.join()
+
+    assert_same(pool.encode(BATCHES), reference)
+    assert dead not in pool._pool
+    assert all(worker.process.is_alive() for worker in pool._pool)
+
+
+def test_worker_dying_during_encode_is_replaced(pool, reference, monkeypatch):
+    victim = pool._pool[1]
+    submit = victim.submit
+
+    def submit_and_die(*args):
+        submit(*args)
+        victim.process.kill()
+
+    monkeypatch.setattr(victim, "submit", submit_and_die)
+
+    assert_same(pool.encode(BATCHES), reference)
+    assert victim not in pool._pool
+    assert all(worker.process.is_alive() for worker in pool._pool)
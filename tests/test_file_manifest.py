@@ -0,0 +1,100 @@
+"""Тесты манифеста инкрементальной индексации."""
+
+import os
+
+import pytest
+from haystack import Document
+
+from chathrd.utils.file_manifest import FileChange, FileManifest, assign_chunks
+
+
+@pytest.fixture
+def files(tmp_path):
+    paths = {}
+    for name, text in {"a.txt": "альфа", "b.txt": "бета"}.items():
+        paths[name] = tmp_path / "data" / name
+        paths[name].parent.mkdir(exist_ok=True)
+        paths[name].write_text(text, encoding="utf-8")
+    return paths
+
+
+def index_all(manifest, paths):
+    for change in manifest.changes([str(path) for path in paths]):
+        manifest.record(change, [f"chunk-{os.path.basename(change.path)}"])
+    manifest.save()
+
+
+def test_unchanged_files_are_skipped_after_reload(tmp_path, files):
+    manifest = FileManifest(tmp_path / "indexed_files.json")
+    index_all(manifest, files.values())
+
+    reloaded = FileManifest(tmp_path / "indexed_files.json")
+
+    assert reloaded.changes([str(path) for path in files.values()]) == []
+
+
+def test_changed_file_carries_old_chunks(tmp_path, files):
+    manifest = FileManifest(tmp_path / "indexed_files.json")
+    index_all(manifest, files.values())
+    files["a.txt"].write_text("альфа, новая версия", encoding="utf-8")
+
+    changes = manifest.changes([str(path) for path in files.values()])
+
+    assert [change.path for change in changes] == [str(files["a.txt"])]
+    assert changes[0].old_chunk_ids == ["chunk-a.txt"]
+
+
+def test_rewritten_file_with_same_content_is_skipped(tmp_path, files):
+    manifest = FileManifest(tmp_path / "indexed_files.json")
+    index_all(manifest, files.values())
+    st = os.stat(files["b.txt"])
+    os.utime(files["b.txt"], ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+
+    assert manifest.changes([str(files["b.txt"])]) == []
+    assert manifest.files[str(files["b.txt"])]["mtime_ns"] == st.st_mtime_ns + 10**9
+
+
+def test_missing_lists_deleted_files(tmp_path, files):
+    manifest = FileManifest(tmp_path / "indexed_files.json")
+    index_all(manifest, files.values())
+
+    assert manifest.missing([str(files["a.txt"])]) == [str(files["b.txt"])]
+
+
+def test_unknown_version_reindexes_everything(tmp_path, files):
+    (tmp_path / "indexed_files.json").write_text('{"version": 99, "files": {}}', encoding="utf-8")
+
+    manifest = FileManifest(tmp_path / "indexed_files.json")
+
+    assert len(manifest.changes([str(path) for path in files.values()])) == 2
+
+
+def test_dependents_share_stale_chunks(tmp_path, files):
+    manifest = FileManifest(tmp_path / "indexed_files.json")
+    manifest.record(FileChange(str(files["a.txt"]), 1, 1, "a", []), ["shared"])
+    manifest.record(FileChange(str(files["b.txt"]), 1, 1, "b", []), ["shared", "own"])
+
+    dependents = manifest.dependents(["shared"], exclude=[str(files["a.txt"])])
+
+    assert [change.path for change in dependents] == [str(files["b.txt"])]
+    assert dependents[0].old_chunk_ids == ["shared", "own"]
+
+
+def test_unreferenced_keeps_chunks_of_other_files(tmp_path):
+    manifest = FileManifest(tmp_path / "indexed_files.json")
+    manifest.record(FileChange("/data/a.txt", 1, 1, "a", []), ["new-1", "shared"])
+    manifest.record(FileChange("/data/b.txt", 1, 1, "b", []), ["canonical"])
+
+    assert manifest.unreferenced(["old-1", "shared", "canonical"]) == ["old-1"]
+
+
+def test_assign_chunks_by_path_name_and_duplicates(files):
+    changes = [FileChange(str(path), 1, 1, name, []) for name, path in files.items()]
+    docs = [
+        Document(id="1", content="x", meta={"file_path": str(files["a.txt"])}),
+        Document(id="2", content="y", meta={"file_path": "b.txt"}),
+        Document(id="3", content="z", meta={"file_path": str(files["a.txt"]), "duplicate_sources": str(files["b.txt"])}),
+        Document(id="4", content="w", meta={}),
+    ]
+
+    assert assign_chunks(docs, changes) == {str(files["a.txt"]): ["1", "3"], str(files["b.txt"]): ["2", "3"]}
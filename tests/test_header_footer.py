@@ -0,0 +1,100 @@
+"""Тесты удаления колонтитулов и повторяющихся строк."""
+
+from haystack import Document
+
+from chathrd.components.processors.document_processors import HeaderFooterCleaner
+
+BODIES = [
+    (
+        "Работник имеет право на ежегодный оплачиваемый отпуск продолжительностью 28 календарных дней. "
+        "Отпуск за первый год работы предоставляется по истечении шести месяцев непрерывной работы."
+    ),
+    (
+        "Заявление на отпуск подаётся руководителю не позднее чем за две недели до его начала. "
+        "Руководитель согласует заявление и передаёт его в отдел кадров для оформления приказа."
+    ),
+    (
+        "График отпусков утверждается ежегодно до 15 декабря текущего года с учётом мнения профсоюза. "
+        "О времени начала отпуска работник извещается под подпись не позднее чем за две недели."
+    ),
+    (
+        "Перенос отпуска согласуется с руководителем подразделения и отделом кадров. "
+        "Часть отпуска, превышающая 28 календарных дней, по письменному заявлению может быть заменена компенсацией."
+    ),
+]
+
+
+def paged(pages):
+    return "\f".join(pages)
+
+
+def test_headers_and_page_numbers_removed():
+    text = paged(
+        f"ООО Ромашка. Положение об отпусках\n{body}\nСтраница {n} из {len(BODIES)}"
+        for n, body in enumerate(BODIES, 1)
+    )
+
+    assert HeaderFooterCleaner().clean(text) == paged(BODIES)
+
+
+def test_only_page_numbers_are_normalized():
+    # даты в начале страниц разные — это текст, а не колонтитул
+    dates = ["01.03.2024", "15.04.2024", "20.05.2024", "02.06.2024"]
+    text = paged(f"Протокол заседания от {date}\n{body}" for date, body in zip(dates, BODIES))
+
+    assert HeaderFooterCleaner().clean(text) == text
+
+
+def test_page_made_of_header_and_footer_is_kept():
+    header = "ООО Ромашка. Положение об отпусках"
+    pages = [f"{header}\n{body}\n- {n} -" for n, body in enumerate(BODIES, 1)]
+    pages.append(f"{header}\n- {len(pages) + 1} -")
+    cleaned = HeaderFooterCleaner(max_share=1.0).clean(paged(pages)).split("\f")
+
+    assert cleaned[:-1] == BODIES
+    assert cleaned[-1] == pages[-1]
+
+
+def test_header_share_is_capped():
+    boilerplate = "\n".join(f"Пункт {n} общего раздела положения об отпусках" for n in range(1, 6))
+    text = paged(f"{boilerplate}\n{body}" for body in BODIES)
+
+    assert HeaderFooterCleaner().clean(text) == text
+    assert HeaderFooterCleaner(max_share=0.9).clean(text) == paged(BODIES)
+
+
+def test_repeated_lines_without_pages():
+    notice = "Конфиденциально. Только для сотрудников"
+    lines = []
+    for n, body in enumerate(BODIES * 2, 1):
+        lines += [notice, body, f"Страница {n} из 8"]
+    text = "\n".join(lines)
+
+    cleaned = HeaderFooterCleaner(max_share=0.9).clean(text).split("\n")
+
+    assert cleaned == [notice, BODIES[0], "Страница 1 из 8", *BODIES[1:], *BODIES]
+
+
+def test_rare_lines_without_pages_are_kept():
+    text = "\n".join(["Итоговая строка отчёта", *BODIES, "Итоговая строка отчёта", "1", "1", "1"])
+
+    assert HeaderFooterCleaner().clean(text) == text
+
+
+def test_repeated_lines_share_is_capped():
+    notice = "Конфиденциально. Только для сотрудников"
+    text = "\n".join([notice] * 10 + BODIES[:1])
+
+    assert HeaderFooterCleaner().clean(text) == text
+
+
+def test_run_reports_stripped_bytes():
+    text = paged(f"ООО Ромашка. Положение об отпусках\n{body}" for body in BODIES)
+    untouched = Document(content=BODIES[0])
+
+    result = HeaderFooterCleaner().run([Document(content=text, meta={"name": "a.pdf"}), untouched])
+
+    assert result["documents"][0].content == paged(BODIES)
+    assert result["documents"][0].meta == {"name": "a.pdf"}
+    assert result["documents"][1] is untouched
+    assert result["stripped_bytes"] == len(text.encode("utf-8")) - len(paged(BODIES).encode("utf-8"))
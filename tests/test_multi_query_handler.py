@@ -0,0 +1,78 @@
+"""Тесты пакетного поиска в MultiQueryHandler."""
+
+from haystack import Document
+from haystack.dataclasses import ChatMessage
+
+from chathrd.components.generators.multi_query_handler import MultiQueryHandler
+
+
+class FakeRetriever:
+    """Ретривер, возвращающий документ с текстом запроса; на запросе fail падает."""
+
+    def __init__(self, name, batch_fails=False):
+        self.name = name
+        self.batch_fails = batch_fails
+        self.calls = []
+
+    def run_batch(self, queries, sources=None):
+        self.calls.append(("batch", list(queries), sources))
+        if self.batch_fails:
+            raise RuntimeError("batch failed")
+        return {"documents": [self._docs(query) for query in queries]}
+
+    def run(self, query, sources=None):
+        self.calls.append(("single", query, sources))
+        if query == "fail":
+            raise RuntimeError("query failed")
+        return {"documents": self._docs(query)}
+
+    def _docs(self, query):
+        return [Document(id=f"{self.name}-{query}", content=query, score=1.0)]
+
+
+class Passthrough:
+    def run(self, documents, query=None):
+        if query is None:
+            return {"documents": [doc for docs in documents for doc in docs]}
+        return {"documents": documents}
+
+
+class PromptBuilder:
+    def run(self, query, documents):
+        return {"prompt": [ChatMessage.from_user(" ".join(doc.id for doc in documents))]}
+
+
+class EchoGenerator:
+    def run(self, messages):
+        return {"replies": [ChatMessage.from_assistant(messages[0].text)]}
+
+
+def make_handler(bm25, chroma):
+    return MultiQueryHandler(bm25, chroma, Passthrough(), Passthrough(), PromptBuilder(), EchoGenerator())
+
+
+def test_each_retriever_gets_one_batch():
+    bm25, chroma = FakeRetriever("bm25"), FakeRetriever("chroma")
+
+    make_handler(bm25, chroma).run(multi=["a", "b", "c", "d"], original_query="q", sources=["cms"])
+
+    assert bm25.calls == [("batch", ["a", "b", "c"], ["cms"])]
+    assert chroma.calls == [("batch", ["a", "b", "c"], ["cms"])]
+
+
+def test_failed_batch_falls_back_to_single_queries():
+    bm25 = FakeRetriever("bm25", batch_fails=True)
+    handler = make_handler(bm25, FakeRetriever("chroma"))
+
+    docs = handler._retrieve("BM25", bm25, ["a", "fail", "b"], None)
+
+    assert [[doc.id for doc in query_docs] for query_docs in docs] == [["bm25-a"], [], ["bm25-b"]]
+
+
+def test_failing_retriever_does_not_drop_the_other():
+    bm25, chroma = FakeRetriever("bm25", batch_fails=True), FakeRetriever("chroma")
+
+    answer = make_handler(bm25, chroma).run(multi=["fail"], original_query="q")["answer"]
+
+    assert "chroma-fail" in answer
+    assert "bm25-fail" not in answer
@@ -0,0 +1,36 @@
+"""Тесты постоянного кэша OCR."""
+
+from chathrd.utils.ocr_cache import OCRCache
+
+
+def test_roundtrip_survives_reopen(tmp_path):
+    cache = OCRCache(tmp_path / "ocr.sqlite", max_bytes=2**20)
+    key = OCRCache.key("sha", 1, "rus+eng")
+    cache.put(key, "Приказ об отпуске")
+    cache.close()
+
+    reopened = OCRCache(tmp_path / "ocr.sqlite", max_bytes=2**20)
+
+    assert reopened.get(key) == "Приказ об отпуске"
+    assert reopened.get(OCRCache.key("sha", 2, "rus+eng")) is None
+
+
+def test_key_depends_on_page_and_params():
+    keys = {OCRCache.key("sha", 1, "a"), OCRCache.key("sha", 2, "a"), OCRCache.key("sha", 1, "b")}
+
+    assert len(keys) == 3
+
+
+def test_evict_drops_least_recently_used(tmp_path):
+    cache = OCRCache(tmp_path / "ocr.sqlite", max_bytes=10**6)
+    keys = [OCRCache.key("sha", page_no, "p") for page_no in range(3)]
+    for key in keys:
+        cache.put(key, "x" * 1000)
+    cache.get(keys[0])
+
+    cache.max_bytes = 2500
+    cache.evict()
+
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[2]) is not None
@@ -0,0 +1,268 @@
+"""Тесты OCR-конвертера PDF: постраничное распознавание в пуле потоков."""
+
+import threading
+import time
+
+import fitz
+import numpy as np
+import pytest
+from PIL import Image
+
+from chathrd.components.converters import document_converters
+from chathrd.components.converters.document_converters import (
+    OCRPDFToDocument,
+    PDFFastOrOCRRouter,
+    ocr_data_to_text,
+    otsu_threshold,
+)
+
+PAGE_TEXT = "Regulations on annual leave and bonuses"
+
+
+class FakeOCRPDFToDocument(OCRPDFToDocument):
+    """OCR без Poppler и Tesseract: страница «распознаётся» в текст с её номером."""
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("cache_path", "")
+        super().__init__(**kwargs)
+        self.rendered = []
+        self.alive = 0
+        self.max_alive = 0
+        self._lock = threading.Lock()
+
+    def _render(self, path, page_no):
+        with self._lock:
+            self.rendered.append(page_no)
+            self.alive += 1
+            self.max_alive = max(self.max_alive, self.alive)
+        image = Image.new("1", (1, 1))
+        image.info["page_no"] = page_no
+        return image, self.min_dpi
+
+    def _recognize(self, image):
+        time.sleep(0.01)
+        with self._lock:
+            self.alive -= 1
+        return f"страница {image.info['page_no']}", 90.0
+
+
+def make_pdf(path, texts):
+    """PDF со страницами из texts; None — страница без текстового слоя."""
+    with fitz.open() as pdf:
+        for text in texts:
+            page = pdf.new_page()
+            if text:
+                page.insert_text((72, 72), text)
+        pdf.save(path)
+    return path
+
+
+@pytest.fixture
+def pdf_path(tmp_path):
+    path = tmp_path / "scan.pdf"
+    path.write_bytes(b"%PDF-1.4")
+    return path
+
+
+def test_pages_are_recognized_in_order(pdf_path):
+    converter = FakeOCRPDFToDocument(workers=3, max_in_flight=3)
+
+    docs = converter.run(sources=[pdf_path], text_layers={str(pdf_path): [None] * 6})["documents"]
+
+    assert docs[0].content.split("\f") == [f"страница {i}" for i in range(1, 7)]
+    assert docs[0].meta["ocr_pages"] == "1,2,3,4,5,6"
+    assert docs[0].meta["page_count"] == 6
+
+
+def test_rendered_pages_in_memory_are_bounded(pdf_path):
+    converter = FakeOCRPDFToDocument(workers=2, max_in_flight=2)
+
+    converter.run(sources=[pdf_path], text_layers={str(pdf_path): [None] * 12})
+
+    assert converter.rendered == list(range(1, 13))
+    assert converter.max_alive <= 2
+
+
+def test_failed_page_does_not_drop_the_document(pdf_path):
+    class FailingPage(FakeOCRPDFToDocument):
+        def _recognize(self, image):
+            if image.info["page_no"] == 2:
+                raise RuntimeError("tesseract failed")
+            return super()._recognize(image)
+
+    docs = FailingPage(workers=2).run(sources=[pdf_path], text_layers={str(pdf_path): [None] * 3})["documents"]
+
+    assert docs[0].content.split("\f") == ["страница 1", "", "страница 3"]
+
+
+def test_router_sends_text_pdf_straight_to_documents(tmp_path):
+    path = make_pdf(tmp_path / "text.pdf", [PAGE_TEXT, PAGE_TEXT])
+
+    routed = PDFFastOrOCRRouter().run(sources=[path])
+
+    assert routed["ocr"] == []
+    assert routed["text_layers"] == {}
+    assert routed["documents"][0].content.count(PAGE_TEXT) == 2
+    assert routed["documents"][0].content.count("\f") == 1
+
+
+def test_router_passes_text_layer_of_mixed_pdf(tmp_path):
+    path = make_pdf(tmp_path / "mixed.pdf", [PAGE_TEXT, None])
+
+    routed = PDFFastOrOCRRouter().run(sources=[path])
+
+    assert routed["documents"] == []
+    assert routed["ocr"] == [str(path)]
+    pages = routed["text_layers"][str(path)]
+    assert PAGE_TEXT in pages[0]
+    assert pages[1] is None
+
+
+def test_ocr_uses_router_text_layer_without_reopening_pdf(tmp_path, monkeypatch):
+    path = make_pdf(tmp_path / "mixed.pdf", [PAGE_TEXT, None])
+    routed = PDFFastOrOCRRouter().run(sources=[path])
+
+    def fail_open(*args, **kwargs):
+        raise AssertionError("PDF открыт повторно")
+
+    monkeypatch.setattr(document_converters.fitz, "open", fail_open)
+    converter = FakeOCRPDFToDocument(workers=1)
+    docs = converter.run(sources=routed["ocr"], text_layers=routed["text_layers"])["documents"]
+
+    first, second = docs[0].content.split("\f")
+    assert PAGE_TEXT in first
+    assert second == "страница 2"
+    assert converter.rendered == [2]
+    assert docs[0].meta["ocr_pages"] == "2"
+
+
+def test_router_skips_unreadable_file(tmp_path):
+    path = tmp_path / "broken.pdf"
+    path.write_bytes(b"not a pdf")
+
+    routed = PDFFastOrOCRRouter().run(sources=[path])
+
+    assert routed == {"documents": [], "ocr": [], "text_layers": {}}
+
+
+def test_only_pages_without_text_layer_are_recognized(tmp_path):
+    path = make_pdf(tmp_path / "mixed.pdf", [None, PAGE_TEXT, "p. 3", PAGE_TEXT])
+    routed = PDFFastOrOCRRouter(min_page_chars=20).run(sources=[path])
+    converter = FakeOCRPDFToDocument(workers=2)
+
+    doc = converter.run(sources=routed["ocr"], text_layers=routed["text_layers"])["documents"][0]
+
+    # на третьей странице текста меньше min_page_chars — она распознаётся, как скан
+    assert converter.rendered == [1, 3]
+    assert doc.meta["ocr_pages"] == "1,3"
+    assert doc.meta["ocr_used"] is True
+    pages = doc.content.split("\f")
+    assert pages[0] == "страница 1"
+    assert pages[2] == "страница 3"
+    assert PAGE_TEXT in pages[1]
+    assert PAGE_TEXT in pages[3]
+
+
+def make_probe(line_height, width=595, height=842):
+    """Пробная растеризация страницы А4 при 72 dpi со строками текста заданной высоты."""
+    probe = np.full((height, width), 250, dtype=np.uint8)
+    for top in range(60, height - 60, 3 * line_height):
+        probe[top:top + line_height, 60:width - 60] = 20
+    return probe
+
+
+def test_otsu_threshold_separates_ink_from_paper():
+    gray = np.array([10] * 100 + [240] * 900, dtype=np.uint8)
+
+    threshold = otsu_threshold(gray)
+
+    assert 10 <= threshold < 240
+
+
+@pytest.mark.parametrize(("line_height", "dpi"), [(12, 175), (4, 300), (20, 150)])
+def test_dpi_follows_text_line_height(line_height, dpi):
+    converter = OCRPDFToDocument(min_dpi=150, max_dpi=300, cache_path="")
+
+    assert converter._choose_dpi(make_probe(line_height)) == dpi
+
+
+def test_dpi_is_limited_by_page_pixels():
+    converter = OCRPDFToDocument(min_dpi=150, max_dpi=300, max_pixels=4_000_000, cache_path="")
+
+    assert converter._choose_dpi(make_probe(4)) == 200
+
+
+def test_blank_page_is_skipped():
+    converter = OCRPDFToDocument(cache_path="")
+
+    assert converter._choose_dpi(np.full((842, 595), 250, dtype=np.uint8)) is None
+
+
+def test_ocr_data_keeps_lines_and_paragraphs():
+    data = {
+        "text": ["Приказ", "№", "5", "", "Отпуск", "шум"],
+        "conf": [90, 80, 70, -1, 60, -1],
+        "block_num": [1, 1, 1, 1, 2, 2],
+        "par_num": [1, 1, 1, 1, 1, 1],
+        "line_num": [1, 1, 2, 2, 1, 1],
+    }
+
+    text, conf = ocr_data_to_text(data)
+
+    assert text == "Приказ №\n5\n\nОтпуск"
+    assert conf == 75
+
+
+class LowConfidenceOCR(FakeOCRPDFToDocument):
+    """Бинаризованная страница распознаётся неуверенно, повтор в оттенках серого — уверенно."""
+
+    def __init__(self, retry_conf, **kwargs):
+        super().__init__(**kwargs)
+        self.retry_conf = retry_conf
+        self.retried = []
+
+    def _rasterize(self, path, page_no, dpi):
+        self.retried.append((page_no, dpi))
+        return Image.new("L", (1, 1))
+
+    def _recognize(self, image):
+        if image.mode == "1":
+            return "бинаризованная", 30.0
+        return "серая", self.retry_conf
+
+
+@pytest.mark.parametrize(("retry_conf", "expected"), [(80.0, "серая"), (20.0, "бинаризованная")])
+def test_low_confidence_page_is_retried_at_max_dpi(pdf_path, retry_conf, expected):
+    converter = LowConfidenceOCR(retry_conf, workers=1, min_dpi=150, max_dpi=300, min_confidence=60)
+
+    doc = converter.run(sources=[pdf_path], text_layers={str(pdf_path): [None]})["documents"][0]
+
+    assert converter.retried == [(1, 300)]
+    assert doc.content == expected
+
+
+def test_recognized_pages_come_from_cache_on_reindex(pdf_path, tmp_path):
+    cache_path = str(tmp_path / "ocr.sqlite")
+    layers = {str(pdf_path): [None] * 3}
+    first = FakeOCRPDFToDocument(workers=2, cache_path=cache_path)
+    expected = first.run(sources=[pdf_path], text_layers=layers)["documents"][0].content
+
+    second = FakeOCRPDFToDocument(workers=2, cache_path=cache_path)
+    doc = second.run(sources=[pdf_path], text_layers=layers)["documents"][0]
+
+    assert first.stats == {"ocr_cache_hits": 0, "ocr_cache_misses": 3}
+    assert second.stats == {"ocr_cache_hits": 3, "ocr_cache_misses": 0}
+    assert second.rendered == []
+    assert doc.content == expected
+
+
+def test_changed_pdf_misses_cache(pdf_path, tmp_path):
+    cache_path = str(tmp_path / "ocr.sqlite")
+    layers = {str(pdf_path): [None]}
+    FakeOCRPDFToDocument(cache_path=cache_path).run(sources=[pdf_path], text_layers=layers)
+    pdf_path.write_bytes(b"%PDF-1.4 changed")
+
+    converter = FakeOCRPDFToDocument(cache_path=cache_path)
+    converter.run(sources=[pdf_path], text_layers=layers)
+
+    assert converter.rendered == [1]
@@ -0,0 +1,56 @@
+"""Тесты пула конвертации: замена упавших процессов и таймаут запуска."""
+
+import pytest
+
+from chathrd.components.converters.parallel_converter import (
+    MAX_START_FAILURES,
+    ParallelFileConverter,
+)
+
+
+@pytest.fixture
+def text_file(tmp_path):
+    path = tmp_path / "note.txt"
+    path.write_text("Положение об отпусках. " * 20, encoding="utf-8")
+    return str(path)
+
+
+def test_worker_dead_while_idle_is_replaced(text_file):
+    converter = ParallelFileConverter(workers=1, timeout=120)
+    try:
+        first = converter.run(sources=[text_file])
+        for worker in converter._pool:
+            worker.process.kill()
+            worker.process.join()
+
+        second = converter.run(sources=[text_file])
+    finally:
+        converter.close()
+
+    assert first["failed"] == second["failed"] == []
+    assert [doc.content for doc in second["documents"]] == [doc.content for doc in first["documents"]]
+
+
+def test_startup_timeout_stops_after_repeated_failures(text_file):
+    converter = ParallelFileConverter(workers=1, timeout=0.01)
+    try:
+        with pytest.raises(RuntimeError, match=str(MAX_START_FAILURES)):
+            converter.run(sources=[text_file])
+        assert converter._pool == []
+    finally:
+        converter.close()
+
+
+def test_files_are_converted_by_route(tmp_path, text_file):
+    table = tmp_path / "table.csv"
+    table.write_text("имя;отдел\nИванов;кадры\n", encoding="utf-8")
+    converter = ParallelFileConverter(workers=2, timeout=120)
+    try:
+        result = converter.run(sources=[str(table), text_file])
+    finally:
+        converter.close()
+
+    assert result["failed"] == []
+    assert sorted(doc.meta["file_path"] for doc in result["documents"]) == sorted([str(table), text_file])
+    assert converter.route_of(table) == "text/csv"
+    assert dict(converter.route_stats["text/plain"]["converters"]) == {"txt_utf8": 1}
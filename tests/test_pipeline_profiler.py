@@ -0,0 +1,83 @@
+"""Тесты профилирования компонентов пайплайна."""
+
+import json
+from pathlib import Path
+from typing import List
+
+from haystack import Document, Pipeline, component
+
+from chathrd.utils.pipeline_profiler import REPORTS_DIR, PipelineProfiler
+
+
+@component
+class ReadFiles:
+    @component.output_types(documents=List[Document], failed=List[str])
+    def run(self, sources: List[str]):
+        documents = [Document(content=Path(path).read_text(encoding="utf-8"), meta={"file_path": path})
+                     for path in sources if path.endswith(".txt")]
+        return {"documents": documents, "failed": [path for path in sources if not path.endswith(".txt")]}
+
+
+@component
+class FirstWord:
+    @component.output_types(documents=List[Document])
+    def run(self, documents: List[Document]):
+        return {"documents": [Document(content=doc.content.split()[0], meta=doc.meta) for doc in documents]}
+
+
+def make_pipeline() -> Pipeline:
+    pipeline = Pipeline()
+    pipeline.add_component("reader", ReadFiles())
+    pipeline.add_component("first_word", FirstWord())
+    pipeline.connect("reader.documents", "first_word.documents")
+    return pipeline
+
+
+def test_components_are_measured_across_runs(tmp_path):
+    text = tmp_path / "a.txt"
+    text.write_text("отпуск по графику", encoding="utf-8")
+    scan = tmp_path / "b.pdf"
+    scan.write_bytes(b"%PDF-1.4")
+    pipeline = make_pipeline()
+    profiler = PipelineProfiler(pipeline, route_of=lambda path: "text/plain" if path.endswith(".txt") else "pdf")
+
+    for _ in range(2):
+        pipeline.run({"reader": {"sources": [str(text), str(scan)]}})
+
+    report = profiler.report(source="test")
+    reader, first_word = report["components"]["reader"], report["components"]["first_word"]
+    assert report["source"] == "test"
+    assert reader["calls"] == first_word["calls"] == 2
+    # пути считаются только во входе sources, а не в выходе failed
+    assert reader["items_in"] == 4
+    assert reader["bytes_in"] == 2 * (text.stat().st_size + scan.stat().st_size)
+    assert reader["items_out"] == 2
+    assert reader["bytes_out"] == 2 * len("отпуск по графику".encode())
+    assert first_word["bytes_out"] == 2 * len("отпуск".encode())
+    assert reader["routes"]["text/plain"] == {"items_in": 2, "bytes_in": 2 * text.stat().st_size,
+                                              "items_out": 2, "bytes_out": reader["bytes_out"]}
+    assert reader["routes"]["pdf"] == {"items_in": 2, "bytes_in": 2 * scan.stat().st_size}
+    assert reader["items_per_sec"] > 0
+
+
+def test_components_without_calls_are_omitted(tmp_path):
+    pipeline = make_pipeline()
+    profiler = PipelineProfiler(pipeline)
+
+    pipeline.run({"reader": {"sources": []}})
+
+    assert set(profiler.report()["components"]) == {"reader", "first_word"}
+    assert PipelineProfiler(make_pipeline()).report()["components"] == {}
+
+
+def test_save_writes_json_report(tmp_path):
+    pipeline = make_pipeline()
+    profiler = PipelineProfiler(pipeline)
+    pipeline.run({"reader": {"sources": []}})
+
+    path, report = profiler.save(tmp_path, status="completed")
+
+    assert path.parent == tmp_path / REPORTS_DIR
+    assert path.name.startswith("indexing_")
+    assert json.loads(path.read_text(encoding="utf-8")) == report
+    assert report["status"] == "completed"
@@ -0,0 +1,82 @@
+"""Тесты scatter-gather поиска по шардам источников."""
+
+import uuid
+
+import pytest
+from haystack import Document
+from haystack_integrations.document_stores.chroma import ChromaDocumentStore
+
+from chathrd.components.retrievers.bm25_retriever import BM25Builder, SegmentedBM25Retriever
+from chathrd.components.retrievers.sharded_retrievers import (
+    ShardedBM25Retriever,
+    ShardedChromaRetriever,
+)
+
+TEXTS = {
+    "cms": ["отпуск по уходу", "премия за квартал", "отпуск и премия"],
+    "lists": ["график отпусков", "список сотрудников", "отпуск отпуск отпуск"],
+}
+
+
+def make_store(docs):
+    store = ChromaDocumentStore(collection_name=f"test-{uuid.uuid4().hex[:8]}")
+    store.write_documents([Document(id=d.id, content=d.content, embedding=[0.1, 0.2]) for d in docs])
+    return store
+
+
+def make_docs(source):
+    return [Document(id=f"{source}-{i}", content=text) for i, text in enumerate(TEXTS[source])]
+
+
+@pytest.fixture
+def sharded(tmp_path):
+    shards = {}
+    for source in TEXTS:
+        docs = make_docs(source)
+        BM25Builder(workers=1).run(docs, path=str(tmp_path / source))
+        shards[source] = SegmentedBM25Retriever(make_store(docs), str(tmp_path / source), top_k=10)
+    return ShardedBM25Retriever(shards, top_k=10)
+
+
+def test_sharded_scores_match_single_index(sharded, tmp_path):
+    all_docs = make_docs("cms") + make_docs("lists")
+    BM25Builder(workers=1).run(all_docs, path=str(tmp_path / "single"))
+    single = SegmentedBM25Retriever(make_store(all_docs), str(tmp_path / "single"), top_k=10)
+
+    merged = sharded.run_batch(["отпуск", "премия"])["documents"]
+    expected = single.run_batch(["отпуск", "премия"])["documents"]
+
+    for got, want in zip(merged, expected):
+        assert {d.id: d.score for d in got} == pytest.approx({d.id: d.score for d in want})
+        assert [d.score for d in got] == sorted((d.score for d in got), reverse=True)
+
+
+def test_sources_limit_the_shards(sharded):
+    docs = sharded.run("отпуск", sources=["lists"])["documents"]
+
+    assert {d.id for d in docs} == {"lists-0", "lists-2"}
+    assert sharded.run("отпуск", sources=["filestorage"])["documents"] == []
+
+
+def test_top_k_applies_to_merged_results(sharded):
+    assert len(sharded.run("отпуск", top_k=2)["documents"]) == 2
+
+
+class FakeChromaShard:
+    def __init__(self, docs):
+        self.document_store = make_store(docs)
+        self.docs = docs
+
+    def run_batch(self, queries, top_k=None):
+        return {"documents": [self.docs[:top_k] for _ in queries]}
+
+
+def test_chroma_shards_merge_by_distance():
+    shards = {
+        "cms": FakeChromaShard([Document(id="c1", content="a", score=0.3), Document(id="c2", content="b", score=0.9)]),
+        "lists": FakeChromaShard([Document(id="l1", content="c", score=0.1), Document(id="l2", content="d", score=None)]),
+    }
+
+    docs = ShardedChromaRetriever(shards, top_k=3).run_batch(["q"])["documents"][0]
+
+    assert [d.id for d in docs] == ["l1", "c1", "c2"]
@@ -0,0 +1,61 @@
+"""Тесты раскладки файлов и индексов по источникам."""
+
+from chathrd.utils.sources import adopt_root_index, discover_shards, group_by_source, source_of
+
+
+def make_root_index(base):
+    base.mkdir(parents=True, exist_ok=True)
+    (base / "manifest.json").write_text("{}")
+    (base / "seg_000001.bm25").write_bytes(b"x")
+
+
+def test_source_of_uses_first_subdirectory(tmp_path):
+    assert source_of(tmp_path / "cms" / "a" / "doc.txt", tmp_path) == "cms"
+    assert source_of(tmp_path / "doc.txt", tmp_path) == "filestorage"
+    assert source_of(tmp_path / "other" / "doc.txt", tmp_path) == "filestorage"
+    assert group_by_source([str(tmp_path / "lists" / "x"), str(tmp_path / "y")], tmp_path) == {
+        "lists": [str(tmp_path / "lists" / "x")],
+        "filestorage": [str(tmp_path / "y")],
+    }
+
+
+def test_root_index_is_default_shard_next_to_other_shards(tmp_path):
+    make_root_index(tmp_path)
+    (tmp_path / "cms").mkdir()
+
+    assert discover_shards(tmp_path) == {"cms": tmp_path / "cms", "filestorage": tmp_path}
+    assert discover_shards(tmp_path, ["cms"]) == {"cms": tmp_path / "cms"}
+
+
+def test_root_index_is_hidden_by_real_default_shard(tmp_path):
+    make_root_index(tmp_path)
+    (tmp_path / "filestorage").mkdir()
+
+    assert discover_shards(tmp_path) == {"filestorage": tmp_path / "filestorage"}
+
+
+def test_adopt_root_index_moves_it_once(tmp_path):
+    make_root_index(tmp_path)
+    (tmp_path / "cms").mkdir()
+
+    assert adopt_root_index(tmp_path)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["cms", "filestorage"]
+    assert sorted(p.name for p in (tmp_path / "filestorage").iterdir()) == ["manifest.json", "seg_000001.bm25"]
+    assert not adopt_root_index(tmp_path)
+    assert discover_shards(tmp_path) == {"cms": tmp_path / "cms", "filestorage": tmp_path / "filestorage"}
+
+
+def test_adopt_root_index_resumes_interrupted_move(tmp_path):
+    make_root_index(tmp_path)
+    staging = tmp_path / ".filestorage.partial"
+    staging.mkdir()
+    (tmp_path / "manifest.json").rename(staging / "manifest.json")
+
+    assert adopt_root_index(tmp_path)
+    assert sorted(p.name for p in (tmp_path / "filestorage").iterdir()) == ["manifest.json", "seg_000001.bm25"]
+
+
+def test_empty_directory_has_no_shards(tmp_path):
+    assert discover_shards(tmp_path) == {}
+    assert not adopt_root_index(tmp_path)
+    assert discover_shards(tmp_path / "missing") == {}
@@ -0,0 +1,91 @@
+"""Тесты контрольных точек индексации: сохранение, продолжение после сбоя, повреждённые записи."""
+
+import pytest
+from haystack import Document
+
+from chathrd.components.processors.checkpoint import SpillCheckpoint
+from chathrd.utils.file_manifest import FileManifest
+from chathrd.utils.spill_store import SpillStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SpillStore(tmp_path / "spill")
+
+
+def test_roundtrip_keeps_documents_and_embeddings(store):
+    docs = [
+        Document(content="а", meta={"file_path": "/data/a.txt", "page_number": 1}, embedding=[0.5, -0.25]),
+        Document(content="б", meta={"file_path": "/data/a.txt"}),
+    ]
+    store.save("embedded", "/data/a.txt", "ab" * 32, docs, tag="model|200")
+
+    assert store.load("embedded", "/data/a.txt", "ab" * 32, tag="model|200") == docs
+    # при других настройках или другом содержимом файла запись не используется
+    assert store.load("embedded", "/data/a.txt", "ab" * 32, tag="model|300") is None
+    assert store.load("embedded", "/data/a.txt", "cd" * 32, tag="model|200") is None
+
+
+@pytest.mark.parametrize("suffix", [".json", ".npy"])
+def test_corrupted_entry_is_discarded(store, suffix):
+    entry = ("/data/x.txt", "ef" * 32)
+    store.save("embedded", *entry, [Document(content="x", embedding=[1.0])])
+    store._file("embedded", *entry, suffix).write_bytes(b"\x80garbage")
+
+    assert store.load("embedded", *entry) is None
+    assert not store._file("embedded", *entry).exists()
+    assert not store._file("embedded", *entry, ".npy").exists()
+
+
+def test_failed_files_list(store):
+    store.update_failed(["/data/a.pdf", "/data/b.pdf"], done=[])
+    store.update_failed(["/data/c.pdf"], done=["/data/a.pdf"])
+    assert store.failed() == ["/data/b.pdf", "/data/c.pdf"]
+
+    (store.path / "failed_files.json").write_text("{oops")
+    assert store.failed() == []
+
+
+def test_checkpoint_resumes_interrupted_batch(store, tmp_path):
+    a, b, c = (str(tmp_path / name) for name in ("a.txt", "b.txt", "c.txt"))
+    hashes = {FileManifest.key(a): "aa" * 32, FileManifest.key(b): "bb" * 32, FileManifest.key(c): "cc" * 32}
+    checkpoint = SpillCheckpoint(store, "converted")
+
+    # первый запуск: a сконвертирован, b — без документов, c не сконвертировался
+    doc_a = Document(content="текст a", meta={"file_path": a})
+    checkpoint.run(documents=[doc_a], file_hashes=hashes, failed=[c])
+
+    # повторный запуск после сбоя берёт a и b из хранилища и конвертирует только c
+    restored = {path: store.load("converted", path, file_hash) for path, file_hash in hashes.items()}
+    assert restored[FileManifest.key(a)] == [doc_a]
+    assert restored[FileManifest.key(b)] == []
+    assert restored[FileManifest.key(c)] is None
+
+    doc_c = Document(content="текст c", meta={"file_path": c})
+    result = checkpoint.run(
+        documents=[doc_c],
+        restored=restored[FileManifest.key(a)],
+        file_hashes={FileManifest.key(c): hashes[FileManifest.key(c)]},
+    )
+    assert result["documents"] == [doc_c, doc_a]
+
+    store.discard(hashes.items())
+    assert all(store.load("converted", path, file_hash) is None for path, file_hash in hashes.items())
+
+
+
+def test_identical_files_in_different_folders(store, tmp_path):
+    # копии одного файла: SHA-256 совпадает, а документы у каждой свои
+    first, second = (str(tmp_path / folder / "policy.txt") for folder in ("hr", "archive"))
+    hashes = {FileManifest.key(first): "dd" * 32, FileManifest.key(second): "dd" * 32}
+    docs = {path: [Document(content="положение", meta={"file_path": path})] for path in (first, second)}
+    checkpoint = SpillCheckpoint(store, "converted")
+
+    checkpoint.run(documents=docs[first] + docs[second], file_hashes=hashes)
+
+    for path in (first, second):
+        assert store.load("converted", FileManifest.key(path), "dd" * 32) == docs[path]
+
+    store.discard([(FileManifest.key(first), "dd" * 32)])
+    assert store.load("converted", FileManifest.key(first), "dd" * 32) is None
+    assert store.load("converted", FileManifest.key(second), "dd" * 32) == docs[second]
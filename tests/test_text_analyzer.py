@@ -0,0 +1,40 @@
+"""Тесты общего анализатора текста BM25."""
+
+import pytest
+
+from chathrd.utils.text_analyzer import DEFAULT_ANALYZER, TextAnalyzer, get_analyzer
+
+
+@pytest.fixture
+def analyzer():
+    return TextAnalyzer()
+
+
+def test_word_forms_share_a_term(analyzer):
+    assert analyzer.analyze("отпуск") == analyzer.analyze("Отпуска") == analyzer.analyze("отпуском")
+    assert analyzer.analyze("holidays") == analyzer.analyze("Holiday")
+
+
+def test_yo_is_normalized(analyzer):
+    assert analyzer.analyze("Ёлка") == analyzer.analyze("елка")
+
+
+def test_numbers_are_kept_and_underscore_splits_words(analyzer):
+    assert analyzer.analyze("приказ 2024 file_name.docx") == ["приказ", "2024", "file", "name", "docx"]
+
+
+def test_tokenize_does_not_stem(analyzer):
+    assert analyzer.tokenize("Отпуска и Holidays") == ["отпуска", "и", "holidays"]
+
+
+def test_normalization_is_cached(analyzer):
+    analyzer.analyze("отпуск отпуск отпуск")
+
+    assert analyzer.normalize.cache_info().misses == 1
+    assert analyzer.normalize.cache_info().hits == 2
+
+
+def test_get_analyzer_returns_shared_instance():
+    assert get_analyzer(DEFAULT_ANALYZER) is get_analyzer(DEFAULT_ANALYZER)
+    with pytest.raises(ValueError, match="unknown"):
+        get_analyzer("unknown")
@@ -0,0 +1,71 @@
+"""Тесты чтения текстовых файлов с определением кодировки."""
+
+import pytest
+
+from chathrd.components.converters.document_converters import StreamingTextFileToDocument
+from chathrd.components.processors.document_processors import EncodingSplitter, detect_encoding
+
+LINE = "Приказ об отпуске сотрудников отдела кадров\n"
+
+
+@pytest.fixture
+def streaming():
+    return StreamingTextFileToDocument(chunk_chars=500, prefix_bytes=256, block_size=100)
+
+
+def test_detect_encoding_tolerates_cut_utf8_character():
+    data = "отпуск".encode()
+
+    assert detect_encoding(data[:3]) == "utf-8"
+    assert detect_encoding(data[:3], final=True) == "cp1251"
+    assert detect_encoding("отпуск".encode("cp1251")) == "cp1251"
+
+
+def test_utf8_file_is_split_on_line_boundaries(tmp_path, streaming):
+    text = LINE * 40
+    path = tmp_path / "log.txt"
+    path.write_text(text, encoding="utf-8")
+
+    docs = streaming.run(sources=[path])["documents"]
+
+    assert len(docs) > 1
+    assert "".join(doc.content for doc in docs) == text
+    assert all(doc.content.endswith("\n") for doc in docs)
+    assert [doc.meta["part"] for doc in docs] == list(range(len(docs)))
+    assert {doc.meta["encoding"] for doc in docs} == {"utf-8"}
+
+
+def test_cp1251_tail_after_utf8_prefix_is_decoded_without_replacement(tmp_path, streaming):
+    head, tail = "log started\n" * 30, LINE * 10
+    path = tmp_path / "export.txt"
+    path.write_bytes(head.encode("ascii") + tail.encode("cp1251"))
+
+    docs = streaming.run(sources=[path])["documents"]
+
+    assert "".join(doc.content for doc in docs) == head + tail
+    assert {doc.meta["encoding"] for doc in docs} == {"cp1251"}
+
+
+def test_cp1251_file(tmp_path, streaming):
+    path = tmp_path / "cp.txt"
+    path.write_bytes((LINE * 20).encode("cp1251"))
+
+    docs = streaming.run(sources=[path])["documents"]
+
+    assert "".join(doc.content for doc in docs) == LINE * 20
+    assert "�" not in "".join(doc.content for doc in docs)
+
+
+def test_encoding_splitter_routes_by_encoding_and_size(tmp_path):
+    utf8, cp, mixed, large = (tmp_path / name for name in ("utf8.txt", "cp.txt", "mixed.txt", "large.txt"))
+    utf8.write_text(LINE, encoding="utf-8")
+    cp.write_bytes(LINE.encode("cp1251"))
+    mixed.write_bytes(b"a" * 64 + LINE.encode("cp1251"))
+    large.write_text(LINE * 100, encoding="utf-8")
+
+    result = EncodingSplitter(prefix_bytes=32, stream_threshold=1000).run(sources=[utf8, cp, mixed, large])
+
+    assert [s.meta["file_path"] for s in result["utf8"]] == [str(utf8)]
+    assert [s.meta["file_path"] for s in result["cp"]] == [str(cp), str(mixed)]
+    assert result["large"] == [str(large)]
+    assert result["cp"][0].data == LINE.encode("cp1251")